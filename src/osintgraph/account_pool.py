@@ -0,0 +1,122 @@
+import atexit
+import json
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from .constants import ACCOUNT_POOL_FILE
+
+
+class AccountPool:
+    """
+    Health of every configured Instagram account, persisted across runs:
+    request and 429 counts, the last 429, the cooldown it triggered and whether
+    the saved session still loads. Used to choose which account to scrape with.
+    """
+    BASE_COOLDOWN = 10 * 60 # First 429 in a row; doubles for each further one
+    MAX_COOLDOWN = 4 * 60 * 60
+    SAVE_INTERVAL = 30 # Seconds between saves for plain request counts
+
+    _lock = threading.RLock() # Guards `accounts`; never held during file I/O
+    _save_lock = threading.Lock()
+
+    def __init__(self, path: str = ACCOUNT_POOL_FILE):
+        self.path = path
+        self._last_save = 0.0
+        self.accounts = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    self.accounts = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                self.accounts = {}
+        atexit.register(self.save) # Request counts since the last periodic save
+
+    def _state(self, account: str) -> dict:
+        return self.accounts.setdefault(account, {
+            "requests": 0,
+            "throttles": 0,
+            "consecutive_throttles": 0,
+            "last_429": None,
+            "cooldown_until": 0,
+            "session_valid": None,
+        })
+
+    def save(self):
+        with self._lock:
+            data = json.dumps(self.accounts, indent=4)
+            self._last_save = time.time()
+        with self._save_lock:
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+
+    def record_request(self, account: str):
+        """Counts a request in memory; the file is only rewritten every `SAVE_INTERVAL` seconds."""
+        with self._lock:
+            state = self._state(account)
+            state["requests"] += 1
+            state["consecutive_throttles"] = 0
+            due = time.time() - self._last_save > self.SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def record_429(self, account: str) -> float:
+        """Puts `account` on cooldown (exponential in consecutive 429s) and returns its length in seconds."""
+        with self._lock:
+            state = self._state(account)
+            now = time.time()
+            state["throttles"] += 1
+            state["consecutive_throttles"] += 1
+            state["last_429"] = now
+            cooldown = min(self.BASE_COOLDOWN * 2 ** (state["consecutive_throttles"] - 1), self.MAX_COOLDOWN)
+            state["cooldown_until"] = now + cooldown
+        self.save()
+        return cooldown
+
+    def record_session(self, account: str, valid: bool):
+        with self._lock:
+            self._state(account)["session_valid"] = valid
+        self.save()
+
+    def cooldown_remaining(self, account: str) -> float:
+        with self._lock:
+            return max(self._state(account)["cooldown_until"] - time.time(), 0)
+
+    def success_rate(self, account: str) -> float:
+        with self._lock:
+            state = self._state(account)
+            total = state["requests"] + state["throttles"]
+            return 1.0 if total == 0 else state["requests"] / total
+
+    def pick(self, accounts: List[str], exclude: Optional[str] = None) -> Tuple[Optional[str], float]:
+        """
+        Chooses the next account to use out of `accounts` (other than `exclude`).
+        Accounts whose session is known to be broken are only used as a last resort.
+        Among ready accounts the healthiest wins; if all are cooling down, the one
+        that frees up soonest. Returns (account, seconds until it is ready).
+        """
+        with self._lock:
+            candidates = [a for a in accounts if a != exclude]
+            if not candidates:
+                return None, 0
+            usable = [a for a in candidates if self._state(a)["session_valid"] is not False] or candidates
+            ready = [a for a in usable if self.cooldown_remaining(a) == 0]
+            if ready:
+                best = max(ready, key=lambda a: (self.success_rate(a), -(self._state(a)["last_429"] or 0)))
+                return best, 0
+            best = min(usable, key=self.cooldown_remaining)
+            return best, self.cooldown_remaining(best)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                account: {
+                    "success_rate": round(self.success_rate(account), 3),
+                    "cooldown_remaining": round(self.cooldown_remaining(account)),
+                    "session_valid": state["session_valid"],
+                }
+                for account, state in self.accounts.items()
+            }
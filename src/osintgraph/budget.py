@@ -0,0 +1,89 @@
+import math
+import time
+from typing import Dict, Optional, Tuple
+
+
+class Budget:
+    """
+    A request and wall-clock allowance for a run, a target or a single stage.
+
+    Budgets form a chain: charging a stage also charges its target and the run,
+    and a child is exhausted as soon as any of its ancestors is. A limit of 0
+    means unlimited.
+    """
+    def __init__(self, max_requests: int = 0, max_seconds: float = 0, parent: Optional["Budget"] = None):
+        self.max_requests = max_requests
+        self.max_seconds = max_seconds
+        self.parent = parent
+        self.requests = 0
+        self.started_at = time.monotonic()
+
+    def charge(self, requests: int = 1):
+        """Records `requests` Instagram requests against this budget and its ancestors."""
+        self.requests += requests
+        if self.parent:
+            self.parent.charge(requests)
+
+    @property
+    def remaining_requests(self) -> Optional[int]:
+        """Requests left, or None when neither this budget nor its ancestors cap requests."""
+        own = max(self.max_requests - self.requests, 0) if self.max_requests else None
+        inherited = self.parent.remaining_requests if self.parent else None
+        if own is None or inherited is None:
+            return own if inherited is None else inherited
+        return min(own, inherited)
+
+    @property
+    def remaining_seconds(self) -> Optional[float]:
+        """Seconds left, or None when neither this budget nor its ancestors cap time."""
+        own = max(self.max_seconds - (time.monotonic() - self.started_at), 0) if self.max_seconds else None
+        inherited = self.parent.remaining_seconds if self.parent else None
+        if own is None or inherited is None:
+            return own if inherited is None else inherited
+        return min(own, inherited)
+
+    def out_of_time(self) -> bool:
+        return self.remaining_seconds == 0
+
+    def exhausted(self) -> bool:
+        return self.remaining_requests == 0 or self.out_of_time()
+
+    def child(self, max_requests: int = 0, max_seconds: float = 0) -> "Budget":
+        """A nested budget (e.g. one target within a run) with its own optional limits."""
+        return Budget(max_requests, max_seconds, parent=self)
+
+    def reservations(self, weights: Dict[str, float]) -> Dict[str, Tuple[int, float]]:
+        """
+        Splits what is currently left among stages by weight, fixed up front. For each
+        stage (run in `weights` order) returns the requests and seconds it must leave
+        for the stages after it, to be passed to `allocate`.
+        """
+        requests = self.remaining_requests
+        seconds = self.remaining_seconds
+        total = sum(weights.values())
+        later = total
+        reserved = {}
+        for stage, weight in weights.items():
+            later -= weight
+            reserved[stage] = (
+                math.floor(requests * later / total) if requests else 0,
+                seconds * later / total if seconds else 0,
+            )
+        return reserved
+
+    def allocate(self, reserved_requests: int = 0, reserved_seconds: float = 0) -> "Budget":
+        """
+        A child budget holding what is left once `reserved_requests` and `reserved_seconds`
+        are kept back for later stages. Whatever the child does not spend rolls over to them.
+        """
+        requests = self.remaining_requests
+        seconds = self.remaining_seconds
+        return self.child(
+            max_requests=max(requests - reserved_requests, 1) if requests else 0,
+            max_seconds=max(seconds - reserved_seconds, 1) if seconds else 0,
+        )
+
+    def sleep(self, seconds: float):
+        """Sleeps for `seconds`, cut short to the remaining wall-clock budget."""
+        remaining = self.remaining_seconds
+        time.sleep(seconds if remaining is None else min(seconds, remaining))
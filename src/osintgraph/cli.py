@@ -9,13 +9,16 @@ import osintgraph
 import requests
 from packaging import version as pkg_version
 from .logger import setup_root_logger
-from .utils.monkey_patches import custom_get_likes
+from .utils.monkey_patches import custom_get_comments, custom_get_likes
 instaloader.structures.Post.get_likes = custom_get_likes
+instaloader.structures.Post.get_comments = custom_get_comments
 from .insta_manager import InstagramManager, Insta_Config, migrate_resume_hashes
 from .neo4j_manager import Neo4jManager
 from .credential_manager import get_credential_manager
 from .osintgraph_agent import OSINTGraphAgent
+from .services.llm_models import models_available
 from .constants import SERVICE_MAP, GIT_REPO, TEMPLATES_DIR
+from .utils.data_extractors import LAZY_POST_FIELDS
 
 
 
@@ -92,7 +95,9 @@ def main():
                     Maximum number of items to fetch per account. (default: follower=1000, followee=1000, post=10)
                     {ACCENT_COLOR}Options:{RESET} {HEADER_COLOR}follower{RESET}, {HEADER_COLOR}followee{RESET}, {HEADER_COLOR}post{RESET}
                 {HEADER_COLOR}--rate-limit NUMBER{RESET}         
-                    Pause for 5–10 minutes after every N requests (default: 200)
+                    Switch account (or pause 5–10 minutes if there is none) after every N Instagram requests (default: 200)
+                {HEADER_COLOR}--rpm NUMBER{RESET}
+                    Starting requests per minute per account; lowered automatically on rate-limit responses and raised back while clean (default: 30)
                 {HEADER_COLOR}--force [parts]{RESET}        
                     Re-fetch or re-analyze the chosen sections even if already completed before.  
                     {ACCENT_COLOR}Options:{RESET} {HEADER_COLOR}all{RESET}, {HEADER_COLOR}follower{RESET}, {HEADER_COLOR}followee{RESET}, {HEADER_COLOR}post{RESET}, {HEADER_COLOR}post-analysis{RESET}, {HEADER_COLOR}account-analysis{RESET}
@@ -101,6 +106,20 @@ def main():
                     Specify which of your Instagram accounts to use for this action.
                 {HEADER_COLOR}--skip-accounts [USERNAMES]{RESET}
                     A list of usernames to skip during discovery.
+                {HEADER_COLOR}--budget TYPE=VALUE{RESET}
+                    Stop cleanly when a request or time budget runs out, keeping resume points (default: unlimited).
+                    The per-target budget is split across follower/followee/post fetching by priority (post > followee > follower).
+                    {ACCENT_COLOR}Options:{RESET} {HEADER_COLOR}requests{RESET}, {HEADER_COLOR}minutes{RESET}, {HEADER_COLOR}run-requests{RESET}, {HEADER_COLOR}run-minutes{RESET}
+                {HEADER_COLOR}--full-metadata [FIELDS]{RESET}
+                    Post fields that may trigger an extra metadata request per post when missing from the feed payload (default: none).
+                    {ACCENT_COLOR}Options:{RESET} {HEADER_COLOR}all{RESET}, {HEADER_COLOR}accessibility_caption{RESET}, {HEADER_COLOR}tagged_users{RESET}, {HEADER_COLOR}title{RESET}, {HEADER_COLOR}video_view_count{RESET}, ...
+                {HEADER_COLOR}--no-cache{RESET}
+                    Always call Gemini, ignoring stored responses for identical prompts and images.
+                {HEADER_COLOR}--triage SCORE{RESET}
+                    Score new posts on a cheap lite model first; only posts with OSINT relevance of at least SCORE (0-10) get full image and text analysis.
+                    The others keep the triage score and summary as their post analysis (default: off); `analyze` and `reanalyze --stale` analyze them in full once a lower SCORE or no triage is used.
+                {HEADER_COLOR}--image-match-distance BITS{RESET}
+                    Also reuse the stored analysis of near-identical images (re-encoded, resized) whose perceptual hashes differ in at most BITS bits (0-2; default: off, identical images only).
             Example:
                 {HEADER_COLOR}osintgraph discover "target_user"{RESET}
                 {HEADER_COLOR}osintgraph discover "target_user" --limit follower=200 post=10 --skip post-analysis account-analysis --force follower followee{RESET}
@@ -120,7 +139,9 @@ def main():
                     Maximum number of items to fetch per account. (default: follower=1000, followee=1000, post=10)
                     {ACCENT_COLOR}Options:{RESET} {HEADER_COLOR}follower{RESET}, {HEADER_COLOR}followee{RESET}, {HEADER_COLOR}post{RESET}
                 {HEADER_COLOR}--rate-limit NUMBER{RESET}         
-                    Pause for 5–10 minutes after every N requests (default: 200)
+                    Switch account (or pause 5–10 minutes if there is none) after every N Instagram requests (default: 200)
+                {HEADER_COLOR}--rpm NUMBER{RESET}
+                    Starting requests per minute per account; lowered automatically on rate-limit responses and raised back while clean (default: 30)
                 {HEADER_COLOR}--force [parts]{RESET}        
                     Re-fetch or re-analyze the chosen sections even if already completed before.  
                     {ACCENT_COLOR}Options:{RESET} {HEADER_COLOR}all{RESET}, {HEADER_COLOR}follower{RESET}, {HEADER_COLOR}followee{RESET}, {HEADER_COLOR}post{RESET}, {HEADER_COLOR}post-analysis{RESET}, {HEADER_COLOR}account-analysis{RESET}
@@ -129,11 +150,74 @@ def main():
                     Specify which of your Instagram accounts to use for this action.
                 {HEADER_COLOR}--skip-accounts [USERNAMES]{RESET}
                     A list of usernames to skip during exploration.
+                {HEADER_COLOR}--budget TYPE=VALUE{RESET}
+                    Request/time budget per target (requests, minutes) and for the whole run (run-requests, run-minutes).
+                    No new target is started once the run budget is spent.
+                {HEADER_COLOR}--full-metadata [FIELDS]{RESET}
+                    Post fields that may trigger an extra metadata request per post when missing from the feed payload (default: none).
+                {HEADER_COLOR}--no-cache{RESET}
+                    Always call Gemini, ignoring stored responses for identical prompts and images.
+                {HEADER_COLOR}--triage SCORE{RESET}
+                    Score new posts on a cheap lite model first; only posts with OSINT relevance of at least SCORE (0-10) get full image and text analysis.
+                    The others keep the triage score and summary as their post analysis (default: off); `analyze` and `reanalyze --stale` analyze them in full once a lower SCORE or no triage is used.
+                {HEADER_COLOR}--image-match-distance BITS{RESET}
+                    Also reuse the stored analysis of near-identical images (re-encoded, resized) whose perceptual hashes differ in at most BITS bits (0-2; default: off, identical images only).
                 {HEADER_COLOR}--reverse-explore{RESET}
                     Explore users from the smallest follower base to the largest, instead of the default largest to smallest.
+                {HEADER_COLOR}--sequential{RESET}
+                    Finish AI analysis of each user before scraping the next. By default, analysis of earlier users runs while the next one is scraped.
             Example:
                 {HEADER_COLOR}osintgraph explore "target_user" --max 10 --limit follower=1000 followee=500 --rate-limit 1000{RESET}
 
+        {HEADER_COLOR}reanalyze{RESET} --stale [usernames]
+            Re-run only the AI analyses made with older prompts or another Gemini model (every analysis is stamped with both).
+            Accounts are processed most followed first: their outdated post analyses, then their account analysis.
+            Restrict to specific accounts by listing their usernames.
+
+            {ACCENT_COLOR}Options:{RESET}
+                {HEADER_COLOR}--stale{RESET}
+                    Select outdated analyses by their prompt version and model stamps.
+                {HEADER_COLOR}--max NUMBER{RESET}
+                    Max accounts to re-analyze (default: all)
+                {HEADER_COLOR}--account USERNAME{RESET}
+                    Specify which of your Instagram accounts to use (only needed to refresh expired image links).
+                {HEADER_COLOR}--no-cache{RESET}
+                    Always call Gemini, ignoring stored responses for identical prompts and images.
+                {HEADER_COLOR}--triage SCORE{RESET}
+                    Score new posts on a cheap lite model first; only posts with OSINT relevance of at least SCORE (0-10) get full image and text analysis.
+                    The others keep the triage score and summary as their post analysis (default: off); `analyze` and `reanalyze --stale` analyze them in full once a lower SCORE or no triage is used.
+                {HEADER_COLOR}--image-match-distance BITS{RESET}
+                    Also reuse the stored analysis of near-identical images (re-encoded, resized) whose perceptual hashes differ in at most BITS bits (0-2; default: off, identical images only).
+            Example:
+                {HEADER_COLOR}osintgraph reanalyze --stale --max 20{RESET}
+
+        {HEADER_COLOR}analyze{RESET}
+            Catch up on AI analysis of everything already scraped, without touching Instagram scraping.
+            Unanalyzed posts of all accounts run first, ordered by engagement, account followers and recency,
+            then missing or outdated account analyses, most followed accounts first.
+            Progress is saved as it goes, so a stopped run continues where it left off.
+
+            {ACCENT_COLOR}Options:{RESET}
+                {HEADER_COLOR}--max-tokens NUMBER{RESET}
+                    Stop after about this many Gemini tokens (default: unlimited).
+                {HEADER_COLOR}--max-minutes NUMBER{RESET}
+                    Stop after this many minutes (default: unlimited).
+                {HEADER_COLOR}--skip [parts]{RESET}
+                    Skip a stage. {ACCENT_COLOR}Options:{RESET} {HEADER_COLOR}post-analysis{RESET}, {HEADER_COLOR}account-analysis{RESET}
+                {HEADER_COLOR}--skip-accounts [USERNAMES]{RESET}
+                    A list of usernames to leave out.
+                {HEADER_COLOR}--account USERNAME{RESET}
+                    Specify which of your Instagram accounts to use (only needed to refresh expired image links).
+                {HEADER_COLOR}--no-cache{RESET}
+                    Always call Gemini, ignoring stored responses for identical prompts and images.
+                {HEADER_COLOR}--triage SCORE{RESET}
+                    Score new posts on a cheap lite model first; only posts with OSINT relevance of at least SCORE (0-10) get full image and text analysis.
+                    The others keep the triage score and summary as their post analysis (default: off); `analyze` and `reanalyze --stale` analyze them in full once a lower SCORE or no triage is used.
+                {HEADER_COLOR}--image-match-distance BITS{RESET}
+                    Also reuse the stored analysis of near-identical images (re-encoded, resized) whose perceptual hashes differ in at most BITS bits (0-2; default: off, identical images only).
+            Example:
+                {HEADER_COLOR}osintgraph analyze --max-minutes 480 --triage 4{RESET}
+
         {HEADER_COLOR}agent{RESET}
             Launch the OSINTGraph AI Agent for searching (keyword search, semantic search), analyzing, and template-based investigations.
             
@@ -176,10 +260,16 @@ def main():
     discover_parser.add_argument("username", type=str, help="Target username to scrape.")
     discover_parser.add_argument("--skip", nargs="+", choices=["all", "follower", "followee", "post", "post-analysis", "account-analysis"], help="Skip specific scraping/analysis steps.")
     discover_parser.add_argument("--limit", nargs="+", metavar="TYPE=VALUE", help="Set scrape limits. Types: follower, followee, post. Example: --limit follower=2000 post=50")
-    discover_parser.add_argument("--rate-limit", type=int, default=200, help="Pause for 5–10 min after every N requests to reduce Instagram detection (default: 200).")
+    discover_parser.add_argument("--rate-limit", type=int, default=200, help="Switch account, or pause for 5–10 min, after every N Instagram requests to reduce detection (default: 200).")
+    discover_parser.add_argument("--rpm", type=float, default=30, help="Starting Instagram requests per minute per account; adapts to rate-limit responses (default: 30).")
     discover_parser.add_argument("--force", nargs="+", choices=["all", "follower", "followee", "post", "post-analysis", "account-analysis"], help="Force re-fetch or re-analyze for chosen sections. Use 'all' to redo all.")
     discover_parser.add_argument("--account", type=str, help="Specify which Instagram account to use for scraping.")
     discover_parser.add_argument("--skip-accounts", nargs="+", help="A list of usernames to skip.")
+    discover_parser.add_argument("--budget", nargs="+", metavar="TYPE=VALUE", help="Stop cleanly when a budget runs out. Types: requests, minutes, run-requests, run-minutes. Example: --budget requests=500 minutes=30")
+    discover_parser.add_argument("--full-metadata", nargs="+", choices=["all", *LAZY_POST_FIELDS], help="Post fields allowed to trigger a full-metadata request when missing from the feed payload.")
+    discover_parser.add_argument("--no-cache", action="store_true", help="Bypass the LLM response cache.")
+    discover_parser.add_argument("--triage", type=int, default=0, metavar="SCORE", help="Triage new posts on a lite model first; only posts scoring at least SCORE (0-10) get full analysis (default: off).")
+    discover_parser.add_argument("--image-match-distance", type=int, choices=range(3), metavar="BITS", help="Reuse the analysis of near-identical images within BITS perceptual-hash bits (0-2; default: identical images only).")
 
     # Explore command
     explore_parser = subparsers.add_parser("explore", help="Recursive discovery: run 'discover' on all followees of the target username.")
@@ -187,11 +277,39 @@ def main():
     explore_parser.add_argument("--max", type=int, default=5, help="Maximum followees to discover (default: 5)")
     explore_parser.add_argument("--skip", nargs="+", choices=["all", "follower", "followee", "post", "post-analysis", "account-analysis"], help="Skip specific scraping/analysis steps.")
     explore_parser.add_argument("--limit", nargs="+", metavar="TYPE=VALUE", help="Set scrape limits. Types: follower, followee, post. Example: --limit follower=2000 post=50")
-    explore_parser.add_argument("--rate-limit", type=int, default=200, help="Pause for 5–10 min after every N requests to reduce Instagram detection (default: 200).")
+    explore_parser.add_argument("--rate-limit", type=int, default=200, help="Switch account, or pause for 5–10 min, after every N Instagram requests to reduce detection (default: 200).")
+    explore_parser.add_argument("--rpm", type=float, default=30, help="Starting Instagram requests per minute per account; adapts to rate-limit responses (default: 30).")
     explore_parser.add_argument("--force", nargs="+", choices=["all", "follower", "followee", "post", "post-analysis", "account-analysis"], help="Force re-fetch or re-analyze for chosen sections. Use 'all' to redo all.")
     explore_parser.add_argument("--account", type=str, help="Specify which Instagram account to use for scraping.")
     explore_parser.add_argument("--skip-accounts", nargs="+", help="A list of usernames to skip during exploration.")
+    explore_parser.add_argument("--budget", nargs="+", metavar="TYPE=VALUE", help="Stop cleanly when a budget runs out. Types: requests, minutes (per target), run-requests, run-minutes (whole run). Example: --budget requests=500 run-minutes=120")
+    explore_parser.add_argument("--full-metadata", nargs="+", choices=["all", *LAZY_POST_FIELDS], help="Post fields allowed to trigger a full-metadata request when missing from the feed payload.")
+    explore_parser.add_argument("--no-cache", action="store_true", help="Bypass the LLM response cache.")
+    explore_parser.add_argument("--triage", type=int, default=0, metavar="SCORE", help="Triage new posts on a lite model first; only posts scoring at least SCORE (0-10) get full analysis (default: off).")
+    explore_parser.add_argument("--image-match-distance", type=int, choices=range(3), metavar="BITS", help="Reuse the analysis of near-identical images within BITS perceptual-hash bits (0-2; default: identical images only).")
     explore_parser.add_argument("--reverse-explore", action="store_true", help="Explore users from smallest follower base to largest.")
+    explore_parser.add_argument("--sequential", action="store_true", help="Analyze each user before scraping the next, instead of overlapping analysis with scraping.")
+
+    # Reanalyze command
+    reanalyze_parser = subparsers.add_parser("reanalyze", help="Re-run AI analyses made with older prompts or another model.")
+    reanalyze_parser.add_argument("usernames", nargs="*", help="Only re-analyze these accounts.")
+    reanalyze_parser.add_argument("--stale", action="store_true", help="Select analyses whose prompt version or model stamp is outdated.")
+    reanalyze_parser.add_argument("--max", type=int, help="Maximum accounts to re-analyze (default: all).")
+    reanalyze_parser.add_argument("--account", type=str, help="Specify which Instagram account to use.")
+    reanalyze_parser.add_argument("--no-cache", action="store_true", help="Bypass the LLM response cache.")
+    reanalyze_parser.add_argument("--triage", type=int, default=0, metavar="SCORE", help="Triage new posts on a lite model first; only posts scoring at least SCORE (0-10) get full analysis (default: off).")
+    reanalyze_parser.add_argument("--image-match-distance", type=int, choices=range(3), metavar="BITS", help="Reuse the analysis of near-identical images within BITS perceptual-hash bits (0-2; default: identical images only).")
+
+    # Analyze command
+    analyze_parser = subparsers.add_parser("analyze", help="Run pending AI analysis of all scraped posts and accounts, most important first.")
+    analyze_parser.add_argument("--max-tokens", type=int, default=0, help="Stop after about this many Gemini tokens (default: unlimited).")
+    analyze_parser.add_argument("--max-minutes", type=float, default=0, help="Stop after this many minutes (default: unlimited).")
+    analyze_parser.add_argument("--skip", nargs="+", choices=["post-analysis", "account-analysis"], help="Skip post or account analysis.")
+    analyze_parser.add_argument("--skip-accounts", nargs="+", help="A list of usernames to leave out.")
+    analyze_parser.add_argument("--account", type=str, help="Specify which Instagram account to use.")
+    analyze_parser.add_argument("--no-cache", action="store_true", help="Bypass the LLM response cache.")
+    analyze_parser.add_argument("--triage", type=int, default=0, metavar="SCORE", help="Triage new posts on a lite model first; only posts scoring at least SCORE (0-10) get full analysis (default: off).")
+    analyze_parser.add_argument("--image-match-distance", type=int, choices=range(3), metavar="BITS", help="Reuse the analysis of near-identical images within BITS perceptual-hash bits (0-2; default: identical images only).")
 
     # Agent command
     agent_parser = subparsers.add_parser("agent", help="Launch Osintgraph AI Agent (RAG-powered). Supports keyword & semantic search, simple analysis, and template-assisted complex investigations.")
@@ -376,6 +494,19 @@ def main():
         else:
             config_force = []
 
+        budgets = {"requests": 0, "minutes": 0, "run-requests": 0, "run-minutes": 0}
+        for item in args.budget or []:
+            try:
+                key, value = item.split("=")
+                key = key.strip().lower()
+                if key not in budgets:
+                    logger.error(f"Unknown budget type: {key}")
+                    sys.exit(1)
+                budgets[key] = float(value.strip())
+            except ValueError:
+                logger.error(f"Invalid budget format: {item}. Use TYPE=VALUE")
+                sys.exit(1)
+
         config = Insta_Config(
         limits={ 
             "followers": limits_input["follower"],
@@ -383,6 +514,7 @@ def main():
             "posts": limits_input["post"]
         }, 
         max_request=args.rate_limit,
+        requests_per_minute=args.rpm,
         skip_followers = "all" in skip_args or "follower" in skip_args,
         skip_followees = "all" in skip_args or "followee" in skip_args,
         skip_posts = "all" in skip_args or "post" in skip_args,
@@ -390,7 +522,15 @@ def main():
         skip_account_analysis = "all" in skip_args or "account-analysis" in skip_args,
         force=config_force,
         auto_login= True,
-        skip_accounts=args.skip_accounts or []
+        skip_accounts=args.skip_accounts or [],
+        full_metadata_fields=list(LAZY_POST_FIELDS) if "all" in (args.full_metadata or []) else (args.full_metadata or []),
+        target_request_budget=int(budgets["requests"]),
+        target_time_budget=budgets["minutes"] * 60,
+        run_request_budget=int(budgets["run-requests"]),
+        run_time_budget=budgets["run-minutes"] * 60,
+        llm_cache=not args.no_cache,
+        triage_threshold=args.triage,
+        image_match_distance=args.image_match_distance
         )
 
         manager = InstagramManager(config=config, account_username=args.account)
@@ -398,18 +538,37 @@ def main():
         if args.command == "discover":
             print()
             logger.info(f"Discovering: {args.username}")
-            manager.discover(target_user=args.username, account_username=args.account)
+            manager.discover(target_user=args.username)
 
         elif args.command == "explore":
             print()
             logger.info(f"Exploring network of user: {args.username} (Max people: {args.max})")
-            manager.explore(target_user=args.username, max_people=args.max, reverse=args.reverse_explore)
+            manager.explore(target_user=args.username, max_people=args.max, reverse=args.reverse_explore, pipeline=not args.sequential)
 
         
 
+    elif args.command == "reanalyze":
+        if not args.stale:
+            logger.error("Nothing selected. Use --stale to re-analyze outdated analyses, or `discover <username> --force post-analysis account-analysis` to redo an account.")
+            sys.exit(1)
+        manager = InstagramManager(config=Insta_Config(llm_cache=not args.no_cache, triage_threshold=args.triage, image_match_distance=args.image_match_distance), account_username=args.account)
+        manager.reanalyze_stale(usernames=args.usernames or None, max_people=args.max)
+
+    elif args.command == "analyze":
+        skip_args = args.skip or []
+        config = Insta_Config(
+            skip_posts_analysis="post-analysis" in skip_args,
+            skip_account_analysis="account-analysis" in skip_args,
+            skip_accounts=args.skip_accounts or [],
+            llm_cache=not args.no_cache,
+            triage_threshold=args.triage,
+            image_match_distance=args.image_match_distance
+        )
+        manager = InstagramManager(config=config, account_username=args.account)
+        manager.analyze_pending(max_tokens=args.max_tokens, max_seconds=args.max_minutes * 60)
+
     elif args.command == "agent":
-        llm_api_key = credential_manager.get("GEMINI_API_KEY")
-        if not llm_api_key:
+        if not models_available():
             logger.error("✗ No Gemini API key set. Please run `osintgraph setup gemini` to configure it.")
             sys.exit(1)
         
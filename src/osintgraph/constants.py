@@ -47,4 +47,17 @@ os.makedirs(DEBUG_LOGS_DIR, exist_ok=True)
 
 TRACK_FILE = os.path.join(BASE_DIR, "templates_sync.json")
 NEO4J_SYNC_QUEUE_FILE = os.path.join(os.path.dirname(TEMPLATES_DIR), "neo4j_sync_queue.json")
+ACCOUNT_POOL_FILE = os.path.join(os.path.dirname(TEMPLATES_DIR), "account_pool.json")
+LLM_CACHE_FILE = os.path.join(os.path.dirname(TEMPLATES_DIR), "llm_cache.sqlite3")
+IMAGES_DIR = os.path.join(os.path.dirname(TEMPLATES_DIR), "images")
+GEMINI_RATE_LIMIT_FILE = os.path.join(os.path.dirname(TEMPLATES_DIR), "gemini_rate_limits.sqlite3")
+
+# Default per-model Gemini budgets shared by all osintgraph processes on this host.
+# Override any of them with the GEMINI_RATE_LIMITS credential, e.g. {"gemini-2.5-flash": {"rpm": 1000, "tpm": 1000000}}
+GEMINI_RATE_LIMITS = {
+    "gemini-2.0-flash": {"rpm": 10, "tpm": 1000000},
+    "gemini-2.5-flash": {"rpm": 10, "tpm": 250000},
+    "gemini-2.5-flash-lite-preview-06-17": {"rpm": 15, "tpm": 250000},
+    "models/text-embedding-004": {"rpm": 1500},
+}
 CREDENTIALS_FILE = os.path.join(BASE_DIR, "credentials.json")
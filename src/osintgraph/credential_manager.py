@@ -1,15 +1,18 @@
 # credential_manager.py
 import json
 import os
+import threading
 from .constants import CREDENTIALS_FILE
 
 class CredentialManager:
     _instance = None
+    _lock = threading.RLock()
 
     def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(CredentialManager, cls).__new__(cls)
-            cls._instance._load_or_initialize()
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(CredentialManager, cls).__new__(cls)
+                cls._instance._load_or_initialize()
 
         return cls._instance
     
@@ -31,25 +34,29 @@ class CredentialManager:
 
     def reset(self, keys=None):
         """Reset all credentials or specific keys."""
-        if keys is None:
-            for k in self.credentials:
-                self.credentials[k] = ""
-        else:
-            for k in keys:
-                if k in self.credentials:
+        with self._lock:
+            if keys is None:
+                for k in self.credentials:
                     self.credentials[k] = ""
-        self._save()
+            else:
+                for k in keys:
+                    if k in self.credentials:
+                        self.credentials[k] = ""
+            self._save()
 
     def _save(self):
-        with open(CREDENTIALS_FILE, "w") as f:
-            json.dump(self.credentials, f, indent=4)
+        with self._lock:
+            with open(CREDENTIALS_FILE, "w") as f:
+                json.dump(self.credentials, f, indent=4)
 
     def get(self, key, default=""):
-        return self.credentials.get(key, default)
+        with self._lock:
+            return self.credentials.get(key, default)
     
     def set(self, key, value):
-        self.credentials[key] = value
-        self._save()
+        with self._lock:
+            self.credentials[key] = value
+            self._save()
 
 
 _credential_manager_instance = CredentialManager()
@@ -7,13 +7,14 @@ class ResumableNodeIterator:
     A custom wrapper around Instaloader's NodeIterator that supports
     account-agnostic resuming via an end_cursor.
     """
-    def __init__(self, node_iterator, neo4j_manager, profile_id, scraper_username, data_type, total_count):
+    def __init__(self, node_iterator, neo4j_manager, profile_id, scraper_username, data_type, total_count, label="Person"):
         self.node_iterator = node_iterator
         self.neo4j_manager = neo4j_manager
         self.profile_id = profile_id
         self.scraper_username = scraper_username # For saving the hash if we get interrupted
         self.data_type = data_type
         self.total = total_count
+        self.label = label # Node label holding the cursor (Person, or Post for likers)
         self.is_resumed = False
         self.logger = logging.getLogger(__name__)
         self._init_resume_state()
@@ -23,7 +24,8 @@ class ResumableNodeIterator:
         resume_data = self.neo4j_manager.execute_read(
             self.neo4j_manager.get_shared_resume_cursor,
             self.profile_id,
-            self.data_type
+            self.data_type,
+            self.label
         )
         if resume_data and resume_data.get("end_cursor"):
             try:
@@ -86,7 +88,8 @@ class ResumableNodeIterator:
                 self.profile_id,
                 self.data_type,
                 end_cursor,
-                count
+                count,
+                self.label
             )
 
     def clear_resume_state(self):
@@ -94,11 +97,68 @@ class ResumableNodeIterator:
         self.neo4j_manager.execute_write(
             self.neo4j_manager.clear_shared_resume_cursor,
             self.profile_id,
-            self.data_type
+            self.data_type,
+            self.label
         )
 
     def freeze(self):
         """
         Provides a fallback to instaloader's native freeze for partial saves within a single account's run.
         """
-        return self.node_iterator.freeze()
\ No newline at end of file
+        return self.node_iterator.freeze()
+
+
+class LikersIterator:
+    """
+    Iterates over every liker of a post through the iPhone `likers` endpoint,
+    following `next_max_id` pages instead of stopping after the first one.
+
+    Mirrors the parts of instaloader's NodeIterator that ResumableNodeIterator
+    relies on (`page_info`, `nodes_per_chunk`, `_total_index`), so likers can be
+    resumed from a shared cursor like followers and posts.
+    """
+    def __init__(self, context, media_id, exhausted=False):
+        self._context = context
+        self.media_id = media_id
+        self.page_info = None
+        self.nodes_per_chunk = None
+        self._total_index = 0
+        self._buffer = iter(())
+        self._exhausted = exhausted
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            user = next(self._buffer, None)
+            if user is not None:
+                self._total_index += 1
+                return instaloader.Profile(self._context, {
+                    'id': user.get('pk', user.get('id')),
+                    'username': user.get('username'),
+                    'full_name': user.get('full_name'),
+                    'profile_pic_url': user.get('profile_pic_url'),
+                    'is_verified': user.get('is_verified'),
+                    'iphone_struct': user,
+                })
+            if self._exhausted:
+                raise StopIteration
+            self._fetch_page()
+
+    def _fetch_page(self):
+        """Fetches the next page of likers and advances `page_info`."""
+        previous_cursor = self.page_info.get('end_cursor') if self.page_info else None
+        params = {'max_id': previous_cursor} if previous_cursor else {}
+        data = self._context.get_iphone_json(path='api/v1/media/{}/likers/'.format(self.media_id), params=params)
+
+        next_cursor = data.get('next_max_id')
+        # Guard against the endpoint echoing the same cursor back forever.
+        has_next_page = bool(next_cursor) and str(next_cursor) != str(previous_cursor)
+        self.page_info = {'end_cursor': str(next_cursor) if has_next_page else None, 'has_next_page': has_next_page}
+        self._exhausted = not has_next_page
+        self._buffer = iter(data.get('users', []))
+
+    def freeze(self):
+        """Returns the current pagination state."""
+        return {'page_info': self.page_info, 'total_index': self._total_index}
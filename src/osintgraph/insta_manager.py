@@ -1,22 +1,37 @@
 import asyncio
+import heapq
 import json
+import math
 import os
 import logging
 from fake_useragent import UserAgent
+import queue
 import random
+import threading
 import time
+from collections import Counter
 from dataclasses import dataclass, field
-from typing import Dict, List
+from dateutil.parser import isoparse
+from typing import Dict, List, Optional
 
 import instaloader
+import requests
 from instaloader.exceptions import InvalidArgumentException, ProfileNotExistsException, TooManyRequestsException
 from tqdm import tqdm
 from google.api_core.exceptions import ResourceExhausted, TooManyRequests
 
+from .account_pool import AccountPool
 from .credential_manager import get_credential_manager
 from .get_session import *
-from .services.llm_analyzer import LLMAnalyzer
+from .services.llm_analyzer import ACCOUNT_ANALYSIS_VERSION, POST_ANALYSIS_VERSION, LLMAnalyzer
+from .services.llm_cache import LLMCache
+from .services.llm_models import models_available
+from .services.image_store import ImageStore
+from .services.retry_policy import QuotaExhausted
 from .custom_iterator import ResumableNodeIterator
+from .budget import Budget
+from .rate_limiter import AccountRateLimiter, AdaptiveRateController
+from .session_pool import SessionPool
 from .neo4j_manager import *
 from .utils.data_extractors import (
     extract_comment_data,
@@ -30,6 +45,24 @@ from .constants import (
 from .migrate_hashes import migrate_resume_hashes
 
 
+# discover steps that only use the LLM, not Instagram
+ANALYSIS_DATA_TYPES = ('posts_analysis', 'account_analysis')
+SCRAPE_DATA_TYPES = ('followers', 'followees', 'posts')
+
+
+def analysis_priority(post: dict, followers: int, now: float) -> float:
+    """
+    Order of a pending post in `analyze`, highest first: its engagement, the
+    importance of its owner (followers) and its recency. Counts are taken on a
+    log scale and recency decays over months, so no single factor dominates.
+    """
+    engagement = math.log1p((post.get("likes") or 0) + (post.get("comments") or 0))
+    importance = math.log1p(followers or 0)
+    try:
+        age_days = max(now - isoparse(post["date_utc"]).timestamp(), 0) / 86400 # Neo4j writes UTC as "Z", which fromisoformat rejects before 3.11
+    except (KeyError, TypeError, ValueError):
+        age_days = 365
+    return engagement + importance + 10 * math.exp(-age_days / 180)
 
 
 @dataclass
@@ -46,63 +79,212 @@ class Insta_Config:
     skip_posts_analysis: bool = False
     skip_accounts: List[str] = field(default_factory=list) # Usernames to skip
     skip_account_analysis: bool = False    
-    max_request: int = 200
+    max_request: int = 200 # Rotate account (or pause) after this many HTTP requests
+    requests_per_minute: float = 30 # Starting pace per account; adapts down on 429s and back up while clean
+    warm_sessions: bool = True # Load and check every account's session in the background at startup
+    analysis_concurrency: int = 4 # LLM calls in flight during post analysis (still bound by the Gemini rate limiter)
+    llm_cache: bool = True # Reuse stored LLM responses for identical prompts/images
+    llm_cache_max_entries: int = 0 # 0 = unbounded; otherwise least recently used entries are evicted
+    image_max_edge: int = 1024 # Post images are downscaled to this many pixels on their longest side before analysis
+    image_match_distance: Optional[int] = None # Reuse the analysis of an image within this many perceptual-hash bits (0-2); None = identical bytes only
+    image_cache_max_entries: int = 0 # 0 = unbounded; otherwise least recently used local images are evicted
+    structured_output: bool = True # Request schema-constrained JSON from Gemini rather than parsing free text
+    single_call_sidecars: bool = True # Analyze all images of a carousel post with its caption/comments in one LLM call
+    account_chunk_tokens: int = 50000 # Above this prompt size, account analysis is map-reduced over batches of posts
+    triage_threshold: int = 0 # Posts scoring below this OSINT relevance (0-10) on a lite-model triage skip full analysis; 0 = off
+    incremental_account_analysis: bool = True # Update an existing account analysis from new posts only, instead of redoing it
     debug_mode: bool = False
     force: List[str] = field(default_factory=list)
     auto_login: bool = True
+    full_metadata_fields: List[str] = field(default_factory=list) # Lazy post fields allowed to trigger a full-metadata request
+    # Budgets (0 = unlimited). Per target and for the whole run; time in seconds.
+    target_request_budget: int = 0
+    target_time_budget: float = 0
+    run_request_budget: int = 0
+    run_time_budget: float = 0
+    # Relative share of a target's budget given to each scraping stage
+    stage_priority: Dict[str, float] = field(default_factory=lambda: {
+        'posts'    : 3,
+        'followees': 2,
+        'followers': 1,
+    })
+
+@dataclass
+class WorkerContext:
+    """
+    Mutable scraping state owned by a single thread: its own Instaloader session,
+    the account it is logged in as and its request counters.
+    """
+    L: instaloader.Instaloader
+    username: str = ""
+    current_account_index: int = 0
+    request_made: int = 0 # Actual HTTP requests sent by this worker's Instaloader
+    requests_on_account: int = 0
+    budget: Optional[Budget] = None # Budget of the target/stage this worker is on
+    sessions: Dict[str, requests.Session] = field(default_factory=dict) # Logged-in HTTP sessions by account, swapped into L on switch
+
 
 class InstagramManager:
     def __init__(self, config : Insta_Config = Insta_Config(), account_username: str = None):
         self.config = config
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.DEBUG if self.config.debug_mode else logging.INFO)
-        self.L = instaloader.Instaloader(
-            compress_json=False,
-            dirname_pattern=os.path.join(SESSIONS_DIR, "{target}"),
-            filename_pattern="{profile}_{mediaid}"
-        )
-        self.L.context.error = lambda *args, **kwargs: None
 
-        self.request_made = 0
+        # Shared, lock-protected resources (Neo4j driver, credentials, account list).
+        # Per-thread run state lives in a WorkerContext, see `context`.
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        # Held around each Instagram request of threads sharing one Instaloader
+        self.instagram_lock = threading.RLock()
+
         self.credential_manager = get_credential_manager()
         self._neo4j_manager = None  # private attribute for lazy init
-        self.llmanalyzer = LLMAnalyzer()
-        self.key_lock = asyncio.Lock()
-        self.has_gemini_key = bool(self.credential_manager.get("GEMINI_API_KEY"))
+        self.llmanalyzer = LLMAnalyzer(
+            cache=LLMCache(max_entries=self.config.llm_cache_max_entries) if self.config.llm_cache else None,
+            images=ImageStore(
+                max_edge=self.config.image_max_edge,
+                match_distance=self.config.image_match_distance,
+                max_entries=self.config.image_cache_max_entries,
+            ),
+            single_call_sidecars=self.config.single_call_sidecars,
+            triage_threshold=self.config.triage_threshold,
+            structured_output=self.config.structured_output
+        )
+        self.has_gemini_key = models_available() # A Gemini key, or the offline fake provider
 
         self.accounts = self.credential_manager.get("INSTAGRAM_ACCOUNTS", [])
-        self.current_account_index = 0
-        self.tried_all_accounts = False
+        self.account_pool = AccountPool()
+        self._default_account_index = 0
 
         if account_username:
             if account_username in self.accounts:
-                self.current_account_index = self.accounts.index(account_username)
+                self._default_account_index = self.accounts.index(account_username)
             else:
                 self.logger.warning(f"Account '{account_username}' not found. Using default account.")
         elif default_account := self.credential_manager.get("DEFAULT_INSTAGRAM_ACCOUNT"):
             if default_account in self.accounts:
-                self.current_account_index = self.accounts.index(default_account)
+                self._default_account_index = self.accounts.index(default_account)
+
+        # Unless an account was asked for, don't start on one still cooling down from an earlier run
+        if not account_username and self.accounts and (cooldown := self.account_pool.cooldown_remaining(self.accounts[self._default_account_index])):
+            candidate, wait = self.account_pool.pick(self.accounts, exclude=self.accounts[self._default_account_index])
+            if candidate and wait < cooldown:
+                self.logger.info(f"Default account is rate-limited for another {int(cooldown / 60)} min. Using {candidate} instead.")
+                self._default_account_index = self.accounts.index(candidate)
 
-        self.username = self.accounts[self.current_account_index] if self.accounts else ""
+        self.run_budget = Budget(self.config.run_request_budget, self.config.run_time_budget)
+        self.rate_limiter = AccountRateLimiter(requests_per_minute=self.config.requests_per_minute)
+        self.user_agent = None
+        self.session_pool = SessionPool(self.account_pool, self._new_instaloader)
+        self._local.context = self._new_context()
 
         if self.config.auto_login:
             _ = self.neo4j_manager
             self._login(self.username)
+            if self.config.warm_sessions and len(self.accounts) > 1:
+                self.session_pool.warm(self.accounts)
             self._initialize_neo4j()
 
     @property
     def neo4j_manager(self):
         """Lazily create Neo4jManager when accessed."""
         if self._neo4j_manager is None:
-            self._neo4j_manager = Neo4jManager()
+            with self._lock:
+                if self._neo4j_manager is None:
+                    self._neo4j_manager = Neo4jManager()
         return self._neo4j_manager
+
+    ### Per-worker context
+
+    def _new_instaloader(self) -> instaloader.Instaloader:
+        L = instaloader.Instaloader(
+            compress_json=False,
+            dirname_pattern=os.path.join(SESSIONS_DIR, "{target}"),
+            filename_pattern="{profile}_{mediaid}",
+            rate_controller=lambda ctx: AdaptiveRateController(ctx, self.rate_limiter, self._on_request)
+        )
+        L.context.error = lambda *args, **kwargs: None
+        if self.user_agent:
+            L.context.user_agent = self.user_agent
+        return L
+
+    def _new_context(self) -> WorkerContext:
+        return WorkerContext(
+            L=self._new_instaloader(),
+            username=self.accounts[self._default_account_index] if self.accounts else "",
+            current_account_index=self._default_account_index,
+        )
+
+    @property
+    def context(self) -> WorkerContext:
+        """
+        The calling thread's WorkerContext. Worker threads get their own
+        Instaloader session on first access, logged in as the default account.
+        """
+        context = getattr(self._local, "context", None)
+        if context is None:
+            context = self._local.context = self._new_context()
+            if self.config.auto_login:
+                self._login(context.username)
+        return context
+
+    @property
+    def L(self) -> instaloader.Instaloader:
+        return self.context.L
+
+    @property
+    def username(self) -> str:
+        return self.context.username
+
+    @username.setter
+    def username(self, value: str):
+        self.context.username = value
+
+    @property
+    def request_made(self) -> int:
+        return self.context.request_made
+
+    @request_made.setter
+    def request_made(self, value: int):
+        self.context.request_made = value
+
+    @property
+    def current_account_index(self) -> int:
+        return self.context.current_account_index
+
+    @current_account_index.setter
+    def current_account_index(self, value: int):
+        self.context.current_account_index = value
+
+    @property
+    def budget(self) -> Budget:
+        """The budget the calling thread is currently spending (stage, target, or the run)."""
+        return self.context.budget or self.run_budget
     
     #############################################################################################
     # Public Features 
 
     ## Collecting target user's profile and connection data
-    def discover(self, target_user: str):
+    def discover(self, target_user: str, defer_analysis: bool = False):
+        """
+        Scrapes `target_user` and, unless `defer_analysis` is set, runs the LLM
+        analysis steps right after. Returns True when the profile could be scraped.
+        """
         data_types = ['followers', 'followees', 'posts', 'posts_analysis', 'account_analysis']
+        if defer_analysis:
+            data_types = [d for d in data_types if d not in ANALYSIS_DATA_TYPES]
+        if self.run_budget.exhausted():
+            self.logger.warning(f"⏱  Run budget exhausted — not starting {target_user}.")
+            return False
+
+        target_budget = self.run_budget.child(self.config.target_request_budget, self.config.target_time_budget)
+        self.context.budget = target_budget
+        try:
+            return self._discover(target_user, data_types, target_budget)
+        finally:
+            self.context.budget = None
+
+    def _discover(self, target_user: str, data_types: List[str], target_budget: Budget):
         self._rate_limit()
         
         try:
@@ -112,21 +294,22 @@ class InstagramManager:
         except TooManyRequestsException:
             self.logger.warning(f"Account '{self.username}' is rate-limited.")
             if self._switch_account():
-                self.discover(target_user) # Retry with new account
-            else:
-                self.logger.error("All accounts are rate-limited. Please wait and try again later.")
-            return
+                return self._discover(target_user, data_types, target_budget) # Retry with new account
+            self.logger.error("All accounts are rate-limited. Please wait and try again later.")
+            return False
         except ProfileNotExistsException:
             self.logger.warning(f"Instagram user: {target_user} does not exist. Make sure the username is correct.")
+            return False
 
         try:
             user = extract_profile_data(profile)
         except KeyError:
+            self.account_pool.record_session(self.username, False)
             self.logger.error("Your Instagram session might be expired. Try the following:\n"
                 "                       1. If you log in via Firefox cookie session, re-login to your Instagram account in Firefox and run `osintgraph reset instagram`.\n"
                 "                       2. If you log in manually, simply run `osintgraph reset instagram` to re-login."
             )
-            return
+            return False
         existing_user = self.neo4j_manager.execute_read(self.neo4j_manager.get_person_by_username, target_user)
         if isinstance(existing_user, dict):
             user["account_analysis"] = existing_user.get("account_analysis")
@@ -147,47 +330,29 @@ class InstagramManager:
 
         if profile.is_private and not profile.followed_by_viewer:
             self.logger.error(f"Cannot fetch data. {target_user}'s profile is private. Follow the user to access their profile.")
-            return
+            return False
         
-        force_all = "all" in self.config.force
-        for data_type in data_types:
-            print()
-            self.logger.info(f"{data_type.upper()} -")
-            completions = self.neo4j_manager.execute_read(self.neo4j_manager.get_completion_flags, target_user)
-                
-            if not getattr(self.config, f"skip_{data_type}"):
-                force_this = force_all or data_type in self.config.force
-                
-                if force_this:
-                    
-                    self.neo4j_manager.execute_write(self.neo4j_manager.set_completion_flags, target_user, **{data_type: False})
+        completions = self.neo4j_manager.execute_read(self.neo4j_manager.get_completion_flags, target_user)
+        pending_scrapes = [d for d in data_types if d in SCRAPE_DATA_TYPES and self._needs_run(d, completions)]
+        # Each stage's share of the target budget, by priority, is reserved up front so early
+        # stages cannot drain it; whatever a stage leaves unspent rolls over to the next one.
+        reservations = target_budget.reservations({d: self.config.stage_priority.get(d, 1) for d in pending_scrapes})
 
-                if force_this or not completions.get(data_type, False):
-
-                    if data_type == "posts_analysis":
-                        if self.has_gemini_key:
-                            self.analyze_post(user["username"])
-                        else:
-                            self.logger.warning("⤷  Skipped posts_analysis (no Gemini key)")
-
-                    elif data_type == "account_analysis":
-                        if self.has_gemini_key:
-                            self.analyze_account(user["username"])
-                        else:
-                            self.logger.warning("⤷  Skipped account_analysis (no Gemini key)")
-                    else:
-                        self._fetch_and_map(profile, data_type)
-
-                else:
-                    self.logger.info(f"⤷  {data_type.capitalize()} was already completed — skipping")
+        for data_type in data_types:
+            if data_type in reservations:
+                self.context.budget = target_budget.allocate(*reservations[data_type])
             else:
-                self.logger.info(f"⤷  Skipped {data_type.capitalize()}")
+                self.context.budget = target_budget
+
+            self._run_data_type(user["username"], data_type, profile)
 
             # Add a human-like pause between scraping different data types
             if data_type != data_types[-1]: # Don't sleep after the last item
-                time.sleep(random.uniform(5, 15))
+                target_budget.sleep(random.uniform(5, 15))
 
-        
+        if target_budget.exhausted():
+            self.logger.warning(f"⏱  Budget for {target_user} exhausted — partial results saved, resume points kept.")
+        return True
 
         # if self.config.debug_mode:
         #     with open(f"{target_user}_followers.json", "w") as json_file:
@@ -198,11 +363,62 @@ class InstagramManager:
         #     with open(f"{target_user}_followees.json", "w") as json_file:
         #         json.dump(result['followees'], json_file, indent=4)
         #     self.logger.debug(f"Followee details saved to {target_user}_followees_batch.json.")
-        
 
+    def analyze_target(self, target_user: str):
+        """Runs the LLM steps of `discover` (posts_analysis, account_analysis) for an already scraped user."""
+        for data_type in ANALYSIS_DATA_TYPES:
+            self._run_data_type(target_user, data_type)
+
+    def _needs_run(self, data_type: str, completions: dict) -> bool:
+        if getattr(self.config, f"skip_{data_type}"):
+            return False
+        return "all" in self.config.force or data_type in self.config.force or not completions.get(data_type, False)
+
+    def _run_data_type(self, target_user: str, data_type: str, profile=None):
+        """Runs one discover step, honouring skip/force flags and completion state."""
+        print()
+        self.logger.info(f"{data_type.upper()} - {target_user}" if data_type in ANALYSIS_DATA_TYPES else f"{data_type.upper()} -")
+        completions = self.neo4j_manager.execute_read(self.neo4j_manager.get_completion_flags, target_user)
+
+        if getattr(self.config, f"skip_{data_type}"):
+            self.logger.info(f"⤷  Skipped {data_type.capitalize()}")
+            return
+
+        force_this = "all" in self.config.force or data_type in self.config.force
+        if force_this:
+            self.neo4j_manager.execute_write(self.neo4j_manager.set_completion_flags, target_user, **{data_type: False})
+
+        if not force_this and completions.get(data_type, False):
+            self.logger.info(f"⤷  {data_type.capitalize()} was already completed — skipping")
+            return
+
+        if self.budget.exhausted():
+            self.logger.warning(f"⏱  Skipped {data_type.capitalize()} (budget exhausted)")
+            return
+
+        if data_type == "posts_analysis":
+            if self.has_gemini_key:
+                self.analyze_post(target_user)
+            else:
+                self.logger.warning("⤷  Skipped posts_analysis (no Gemini key)")
+
+        elif data_type == "account_analysis":
+            if self.has_gemini_key:
+                self.analyze_account(target_user, full=force_this)
+            else:
+                self.logger.warning("⤷  Skipped account_analysis (no Gemini key)")
+        else:
+            self._fetch_and_map(profile, data_type)
 
     ## Uncovering the network of target user  
-    def explore(self, target_user: str, max_people: int = 5, reverse: bool = False):
+    def explore(self, target_user: str, max_people: int = 5, reverse: bool = False, pipeline: bool = True):
+        """
+        Discovers up to `max_people` followees of `target_user`.
+
+        With `pipeline`, scraping and LLM analysis run as two stages joined by a queue:
+        a background thread analyzes target N while target N+1 is being scraped. Each
+        stage keeps its own limiter (the per-account token buckets vs. the Gemini rate limiter).
+        """
         result = self.neo4j_manager.execute_read(
             self.neo4j_manager.get_person_by_username, username=target_user
         )
@@ -219,39 +435,79 @@ class InstagramManager:
         if reverse:
             self.logger.info("Exploring from smallest follower base to largest.")
 
+        analysis_wanted = self.has_gemini_key and not (self.config.skip_posts_analysis and self.config.skip_account_analysis)
+        analysis_queue = queue.Queue() if pipeline and analysis_wanted else None
+        analysis_worker = None
+        if analysis_queue is not None:
+            analysis_worker = threading.Thread(target=self._analysis_worker, args=(analysis_queue, self.username, self.current_account_index, self.L.save_session()), name="osintgraph-analysis", daemon=True)
+            analysis_worker.start()
 
         # Convert to an iterator to pull users one by one
         user_iterator = iter(famous_users)
         discovered_count = 0
         
-        # Use a while loop to respect max_people
-        while discovered_count < max_people:
-            try:
-                # Keep pulling from the iterator until a valid, non-skipped user is found
-                while True:
-                    user = next(user_iterator)
-                    username = user.get('username')
-                    if username and username not in self.config.skip_accounts:
-                        break # Found a valid user to process
-                    elif username:
-                        self.logger.info(f"⤷  Skipped {username} as per configuration.")
-
-            except StopIteration:
-                self.logger.info("No more users to explore.")
-                break
-
-            self.logger.info(f"Discovering: {username}")
-
+        try:
+            # Use a while loop to respect max_people
+            while discovered_count < max_people:
+                if self.run_budget.exhausted():
+                    self.logger.warning("⏱  Run budget exhausted — stopping exploration.")
+                    break
+                try:
+                    # Keep pulling from the iterator until a valid, non-skipped user is found
+                    while True:
+                        user = next(user_iterator)
+                        username = user.get('username')
+                        if username and username not in self.config.skip_accounts:
+                            break # Found a valid user to process
+                        elif username:
+                            self.logger.info(f"⤷  Skipped {username} as per configuration.")
+
+                except StopIteration:
+                    self.logger.info("No more users to explore.")
+                    break
+
+                self.logger.info(f"Discovering: {username}")
+
+                try:
+                    scraped = self.discover(username, defer_analysis=analysis_queue is not None)
+                except Exception as e:
+                    self.logger.error(f"Error discovering {username}: {e}")
+                    continue
+
+                if scraped and analysis_queue is not None:
+                    analysis_queue.put(username)
+                
+                discovered_count += 1
+                print()
+                self.logger.info(f"Step {discovered_count}/{max_people} complete.")
+                self.run_budget.sleep(random.uniform(5, 10))  # Avoid rate limits
+        finally:
+            if analysis_worker is not None:
+                analysis_queue.put(None)
+
+        if analysis_worker is not None:
+            if analysis_queue.qsize() > 1:
+                self.logger.info(f"⧗  Scraping finished. Waiting for analysis of {analysis_queue.qsize() - 1} queued account(s)...")
+            analysis_worker.join()
+
+    def _analysis_worker(self, analysis_queue: "queue.Queue", username: str, account_index: int, session_data: dict):
+        """
+        Analysis stage of the explore pipeline: drains usernames until it receives None.
+        It fetches through an Instaloader of its own, loaded from the main thread's
+        session cookies so that no second login happens and scraping is never blocked.
+        """
+        L = self._new_instaloader()
+        L.load_session(username, session_data)
+        self._local.context = WorkerContext(
+            L=L,
+            username=username,
+            current_account_index=account_index,
+        )
+        while (username := analysis_queue.get()) is not None:
             try:
-                self.discover(username)
+                self.analyze_target(username)
             except Exception as e:
-                self.logger.error(f"Error discovering {username}: {e}")
-                continue
-            
-            discovered_count += 1
-            print()
-            self.logger.info(f"Step {discovered_count}/{max_people} complete.")
-            time.sleep(random.uniform(5, 10))  # Avoid rate limits
+                self.logger.error(f"Error analyzing {username}: {e}")
 
     #############################################################################################
     # Internal Features
@@ -260,19 +516,20 @@ class InstagramManager:
     
     ## Account Login (This will first try to login via session file, if not found then relogin is needed )
     def _login(self, account_username: str = None):
-        self.user_agent = self.credential_manager.get("INSTAGRAM_USER_AGENT")
-
-        if self.user_agent:
-            self.L.context.user_agent = self.user_agent
-        else:
-            try:
-                ua = UserAgent()
-                self.user_agent = ua.random
+        with self._lock:
+            if self.user_agent is None:
+                self.user_agent = self.credential_manager.get("INSTAGRAM_USER_AGENT")
+                if not self.user_agent:
+                    try:
+                        ua = UserAgent()
+                        self.user_agent = ua.random
+                        self.logger.info(f"✓  No User-Agent set, using a random one: {self.user_agent}")
+                        self.credential_manager.set("INSTAGRAM_USER_AGENT", self.user_agent)
+                    except Exception as e:
+                        self.user_agent = ""
+                        self.logger.warning(f"Could not generate a random User-Agent: {e}. Using Instaloader's default.")
+            if self.user_agent:
                 self.L.context.user_agent = self.user_agent
-                self.logger.info(f"✓  No User-Agent set, using a random one: {self.user_agent}")
-                self.credential_manager.set("INSTAGRAM_USER_AGENT", self.user_agent)
-            except Exception as e:
-                self.logger.warning(f"Could not generate a random User-Agent: {e}. Using Instaloader's default.")
         # Try to fetch the username from the environment
         self.username = account_username
 
@@ -291,6 +548,8 @@ class InstagramManager:
 
         try:
             self.L.load_session_from_file(self.username, filename=os.path.join(SESSIONS_DIR, self.username))
+            self.account_pool.record_session(self.username, True)
+            self.context.sessions[self.username] = self.L.context._session
             self.logger.info(f"✓  Logged in as {self.username}.")
         except FileNotFoundError:
             self.logger.warning(f"✗ USER: {self.username} Session file not found")
@@ -309,30 +568,64 @@ class InstagramManager:
             self.logger.warning("Instagram Login required.")
             self.choose_login_method()
 
-    def _switch_account(self):
+    def _switch_account(self, rate_limited: bool = True):
+        """
+        Moves this worker to the healthiest other account in the pool. With
+        `rate_limited`, the current account is put on cooldown first and, if every
+        account is cooling down, waits for the one that frees up soonest. A
+        proactive switch (not rate-limited) never waits and returns False instead.
+        """
+        if rate_limited:
+            # The rate itself was already cut by AdaptiveRateController.handle_429
+            cooldown = self.account_pool.record_429(self.username)
+            self.logger.info(f"Account '{self.username}' on cooldown for {int(cooldown / 60)} min.")
+
         if len(self.accounts) <= 1:
             self.logger.warning("No other accounts available to switch to.")
             return False
 
-        if self.tried_all_accounts:
-            self.logger.error("All accounts have been tried and are rate-limited. Pausing for 10 minutes.")
-            time.sleep(600)
-            self.tried_all_accounts = False # Reset after waiting
-
-        self.current_account_index = (self.current_account_index + 1) % len(self.accounts)
-        new_username = self.accounts[self.current_account_index]
-        
-        # Check if we have looped through all accounts
-        default_account = self.credential_manager.get("DEFAULT_INSTAGRAM_ACCOUNT") or self.accounts[0]
-        if new_username == (self.credential_manager.get("DEFAULT_INSTAGRAM_ACCOUNT") or self.accounts[0]):
-             self.tried_all_accounts = True
+        new_username, wait = self.account_pool.pick(self.accounts, exclude=self.username)
+        if new_username is None:
+            return False
+        if wait > 0:
+            if not rate_limited:
+                return False
+            self.logger.warning(f"All accounts are rate-limited. Waiting {int(wait / 60) + 1} min for {new_username} to cool down.")
+            self.budget.sleep(wait)
 
+        self.current_account_index = self.accounts.index(new_username)
         self.logger.info(f"Switching to account: {new_username}")
-        self.username = new_username
-        self._login(self.username)
+        self.context.requests_on_account = 0
+        if not self._activate_session(new_username):
+            self._login(new_username)
         
         return True
 
+    def _activate_session(self, account: str) -> bool:
+        """
+        Swaps `account`'s already-loaded session into this worker's Instaloader
+        context. Iterators and profiles bound to the context carry on as the new
+        account. Returns False when no warm session exists and a full login is needed.
+        """
+        context = self.context
+        session = context.sessions.get(account)
+        if session is None:
+            data = self.session_pool.get(account)
+            if data is None:
+                return False
+            try:
+                self.L.load_session(account, data)
+            except KeyError: # Saved cookies without a csrftoken
+                self.session_pool.discard(account)
+                return False
+            session = context.sessions[account] = self.L.context._session
+        else:
+            self.L.context._session = session
+            self.L.context.username = account
+        context.username = account
+        self.logger.debug(f"Activated warm session for {account}.")
+        return True
+
         
     def choose_login_method(self):
         self.logger.info(
@@ -362,17 +655,20 @@ class InstagramManager:
                 self.L.interactive_login(self.username)  # Log in interactively
                 self.L.save_session_to_file(os.path.join(SESSIONS_DIR, self.username))
                 self.logger.info(f"✓  Logged in as {self.username}.")
-
-            accounts = self.credential_manager.get("INSTAGRAM_ACCOUNTS", [])
-            if self.username not in accounts:
-                # Ensure 'accounts' is a list, even if it was stored as a string
-                if not isinstance(accounts, list):
-                    self.logger.warning("Correcting malformed 'INSTAGRAM_ACCOUNTS' in credentials.")
-                    accounts = [accounts] if accounts else []
-                accounts.append(self.username)
-                self.credential_manager.set("INSTAGRAM_ACCOUNTS", accounts)
-            if not self.credential_manager.get("DEFAULT_INSTAGRAM_ACCOUNT"):
-                self.credential_manager.set("DEFAULT_INSTAGRAM_ACCOUNT", self.username)
+            self.session_pool.put(self.username, self.L.save_session())
+            self.context.sessions[self.username] = self.L.context._session
+
+            with self._lock:
+                accounts = self.credential_manager.get("INSTAGRAM_ACCOUNTS", [])
+                if self.username not in accounts:
+                    # Ensure 'accounts' is a list, even if it was stored as a string
+                    if not isinstance(accounts, list):
+                        self.logger.warning("Correcting malformed 'INSTAGRAM_ACCOUNTS' in credentials.")
+                        accounts = [accounts] if accounts else []
+                    accounts.append(self.username)
+                    self.credential_manager.set("INSTAGRAM_ACCOUNTS", accounts)
+                if not self.credential_manager.get("DEFAULT_INSTAGRAM_ACCOUNT"):
+                    self.credential_manager.set("DEFAULT_INSTAGRAM_ACCOUNT", self.username)
 
             return self.username
 
@@ -400,6 +696,7 @@ class InstagramManager:
         
         self.neo4j_manager.execute_write(self.neo4j_manager.create_unique_constraint)
         self.neo4j_manager.execute_write(self.neo4j_manager.create_vector_indexes)
+        self.neo4j_manager.execute_write(self.neo4j_manager.create_analysis_indexes)
 
     ### Data Fetching 
 
@@ -453,7 +750,7 @@ class InstagramManager:
 
                 for person in tqdm(iterator, desc=f"Fetching {data_type}", unit="people", total=total_items, initial=initial_count, ncols=70):
                     
-                    if counter >= max_count:
+                    if counter >= max_count or self.budget.exhausted():
                         resume_hash_created =True
                         break
                     
@@ -467,7 +764,7 @@ class InstagramManager:
                         self.neo4j_manager.execute_write(self.neo4j_manager.manage_follow_relationships, profile.userid, relationship_data)
                         batch_data = []
 
-                    self._request_made_and_wait()
+                    self._rotate_account_if_due()
                     counter +=1
 
                 if batch_data: # Process any remaining items in the last batch
@@ -503,7 +800,7 @@ class InstagramManager:
 
                 for post in tqdm(iterator, desc=f"Fetching {data_type}", unit="post", total=total_items, ncols=70):
                     
-                    if counter >= max_count:
+                    if counter >= max_count or self.budget.exhausted():
                         resume_hash_created =True
                         break
                     
@@ -514,7 +811,12 @@ class InstagramManager:
                     }
                     post.likers_list = []
 
-                    for comment in post.get_comments():
+                    # Extract first so the counts come from the loaded payload; the lists above are filled in place.
+                    post_data = extract_post_data(post, fetch_fields=self.config.full_metadata_fields)
+                    if post_data['unavailable_fields']:
+                        self.logger.debug(f"Post {post_data['shortcode']}: not in payload, left empty: {', '.join(post_data['unavailable_fields'])}")
+
+                    for comment in (post.get_comments() if post_data['comments'] != 0 else []):
                         post.comments_details['comments_list'].append({'reply_id': None , **extract_comment_data(comment)})
                         post.comments_details['commentors_list'].append(extract_user_metadata(comment.owner))
                         
@@ -525,15 +827,13 @@ class InstagramManager:
                             post.comments_details['comments_list'].append({'reply_id': int(comment.id), **extract_comment_data(ans)})
                             post.comments_details['commentors_list'].append(extract_user_metadata(ans.owner))
                     
-                    for liker in post.get_likes():
-                        post.likers_list.append({'liked_post_id': int(post.mediaid), **extract_user_metadata(liker)})
-                        
-                    post_data = extract_post_data(post)
                     self.neo4j_manager.execute_write(self.neo4j_manager.manage_post_relationships, post_data)
+                    if post_data['likes'] != 0:
+                        self._stream_post_likers(post, post_data['likes'])
                     self.neo4j_manager.execute_write(self.neo4j_manager.set_completion_flags, profile.username, **{"posts_analysis": False})
                     self.neo4j_manager.execute_write(self.neo4j_manager.set_completion_flags, profile.username, **{"account_analysis": False})
 
-                    self._request_made_and_wait(is_post=True)
+                    self._rotate_account_if_due()
                     counter +=1
 
                     
@@ -557,18 +857,68 @@ class InstagramManager:
             else:
                 self.logger.error("All accounts are rate-limited. Aborting fetch.")
 
-    def analyze_post(self, username: str):
+    def _stream_post_likers(self, post, total_likes, batch_size: int = 100):
+        """
+        Pages through every liker of `post` and writes them in batches of `batch_size`,
+        so large posts never sit in memory. Progress is saved as a shared cursor on the
+        Post node, letting another account resume an interrupted likers fetch.
+        """
+        post_id = int(post.mediaid)
+        iterator = ResumableNodeIterator(
+            node_iterator=post.get_likes(),
+            neo4j_manager=self.neo4j_manager,
+            profile_id=post_id,
+            scraper_username=self.username,
+            data_type="likers",
+            total_count=total_likes,
+            label="Post"
+        )
+
+        batch_data = []
+        for liker in iterator:
+            if self.budget.exhausted():
+                break # The shared cursor on the Post lets a later run finish these likers
+            batch_data.append({'liked_post_id': post_id, **extract_user_metadata(liker)})
+            if len(batch_data) >= batch_size:
+                self.neo4j_manager.execute_write(self.neo4j_manager.create_users, batch_data)
+                self.neo4j_manager.execute_write(self.neo4j_manager.like_post, batch_data)
+                batch_data = []
+
+        if batch_data:
+            self.neo4j_manager.execute_write(self.neo4j_manager.create_users, batch_data)
+            self.neo4j_manager.execute_write(self.neo4j_manager.like_post, batch_data)
+
+    def analyze_post(self, username: str, stale_only: bool = False):
+        """Analyzes the posts of `username` that have no analysis yet or, with `stale_only`, those analyzed with older prompts or another model."""
         self.logger.info(f"⧗  Starting to analyze Posts with LLM...")
-        total_items = self.neo4j_manager.execute_read(self.neo4j_manager.count_posts_unanalyzed_by_username, username)
-        iterator = self.neo4j_manager.get_posts_unanalyzed_by_username(username)
+        if stale_only:
+            posts = [
+                {**post, "image_analysis": "", "post_analysis": ""}
+                for post in self.neo4j_manager.get_stale_posts_by_username(username, POST_ANALYSIS_VERSION, self.llmanalyzer.model_ids, self.config.triage_threshold)
+            ]
+        else:
+            posts = list(self.neo4j_manager.get_posts_unanalyzed_by_username(username, self.config.triage_threshold))
         try:
-            for post in tqdm(iterator, desc=f"Analyzing Post", unit="post", total=total_items, ncols=70):
-                self.llmanalyzer.process_post(self, post)
+            with tqdm(desc=f"Analyzing Post", unit="post", total=len(posts), ncols=70) as progress:
+                asyncio.run(self.llmanalyzer.aprocess_posts(
+                    self, posts,
+                    concurrency=self.config.analysis_concurrency,
+                    on_done=lambda post: progress.update(),
+                    should_stop=self.budget.out_of_time,
+                ))
+            if self.budget.out_of_time():
+                self.logger.warning(f"⏱  Time budget exhausted. Post analysis Incomplete.")
+                return False
             
-            self.neo4j_manager.execute_write(self.neo4j_manager.set_completion_flags, username, **{"posts_analysis": True})
+            if not stale_only:
+                self.neo4j_manager.execute_write(self.neo4j_manager.set_completion_flags, username, **{"posts_analysis": True})
             self.logger.info(f"✓  Posts Analysis Completed")
+            self._log_llm_stats()
             return True
         
+        except QuotaExhausted as e:
+            self.logger.warning(f"⚠  {e}. Post analysis Incomplete.")
+            return False
         except (ResourceExhausted, TooManyRequests) as e:
             self.logger.warning(f"⚠  Rate limit hit. Post analysis Incomplete.")
             return False
@@ -583,7 +933,8 @@ class InstagramManager:
             return False
 
 
-    def analyze_account(self, username: str):
+    def analyze_account(self, username: str, full: bool = False):
+        """Runs account analysis; with `full` (e.g. when forced), redoes it from all posts rather than updating it."""
         completions = self.neo4j_manager.execute_read(self.neo4j_manager.get_completion_flags, username)
         self.logger.info(f"⧗  Starting to analyze Account with LLM...")
         
@@ -596,9 +947,20 @@ class InstagramManager:
         
         
         try:
-            self.llmanalyzer.process_account(self, username)
+            mode = self.llmanalyzer.process_account(
+                self, username,
+                chunk_tokens=self.config.account_chunk_tokens,
+                concurrency=self.config.analysis_concurrency,
+                incremental=self.config.incremental_account_analysis and not full,
+            )
             self.neo4j_manager.execute_write(self.neo4j_manager.set_completion_flags, username, **{"account_analysis": True})
-            self.logger.info(f"✓  Account Analysis Completed")
+            if mode == "unchanged":
+                self.logger.info(f"✓  Account Analysis already covers every post")
+            else:
+                self.logger.info(f"✓  Account Analysis Completed" + (" (updated from new posts)" if mode == "incremental" else ""))
+            self._log_llm_stats()
+        except QuotaExhausted as e:
+            self.logger.warning(f"⚠  {e}. Account analysis Incomplete.")
         except (ResourceExhausted, TooManyRequests) as e:
             self.logger.warning(f"⚠  Rate limit hit. Post analysis Incomplete.")
         except RuntimeError as e:
@@ -606,6 +968,138 @@ class InstagramManager:
         except Exception as e:
             self.logger.error(f"⚠  Post analysis Failed. Unknown error  {e}")
 
+    def reanalyze_stale(self, usernames: Optional[List[str]] = None, max_people: Optional[int] = None):
+        """
+        Redoes the analyses made with older prompts (see POST_ANALYSIS_VERSION,
+        ACCOUNT_ANALYSIS_VERSION) or another model, person by person, most
+        followed first: their stale posts, then their account analysis, which is
+        redone from all posts whenever any of them was re-analyzed.
+        """
+        if not self.has_gemini_key:
+            self.logger.error("✗ No Gemini API key set. Please run `osintgraph setup gemini` to configure it.")
+            return
+        stale = self.neo4j_manager.execute_read(
+            self.neo4j_manager.find_stale_analyses,
+            POST_ANALYSIS_VERSION, ACCOUNT_ANALYSIS_VERSION, self.llmanalyzer.model_ids, usernames, max_people, self.config.triage_threshold
+        )
+        if not stale:
+            self.logger.info("✓  Every analysis is up to date")
+            return
+        self.logger.info(f"Found stale analyses for {len(stale)} account(s) (prompt version {POST_ANALYSIS_VERSION}/{ACCOUNT_ANALYSIS_VERSION}, model {self.llmanalyzer.model_id})")
+
+        for entry in stale:
+            if self.run_budget.exhausted():
+                self.logger.warning("⏱  Run budget exhausted — stopping re-analysis.")
+                break
+            username = entry["username"]
+            print()
+            self.logger.info(f"REANALYZE - {username} ({entry['stale_posts']} stale posts{', stale account analysis' if entry['stale_account'] else ''})")
+            if entry["stale_posts"] and not self.analyze_post(username, stale_only=True):
+                continue # Its account analysis would be built on outdated posts; a later run picks both up again
+            if self.config.skip_account_analysis:
+                continue
+            completions = self.neo4j_manager.execute_read(self.neo4j_manager.get_completion_flags, username)
+            if entry["stale_account"] or (entry["stale_posts"] and completions.get("account_analysis")):
+                self.analyze_account(username, full=True)
+
+    def analyze_pending(self, max_tokens: int = 0, max_seconds: float = 0, checkpoint_every: int = 50):
+        """
+        Catches up on analysis independently of scraping: every unanalyzed post of
+        every scraped person, in order of `analysis_priority`, then the account
+        analyses that are missing or stale, most followed first. Stops once
+        `max_tokens` Gemini tokens or `max_seconds` are spent (0 = unlimited).
+        Posts are written back as they are analyzed; every `checkpoint_every`
+        posts, people whose posts are all done are marked complete, so an
+        interrupted run continues where it stopped.
+        """
+        if not self.has_gemini_key:
+            self.logger.error("✗ No Gemini API key set. Please run `osintgraph setup gemini` to configure it.")
+            return
+        budget = self.run_budget.child(max_seconds=max_seconds)
+        tokens_at_start = self.llmanalyzer.tokens_used
+
+        def exhausted() -> bool:
+            return budget.out_of_time() or bool(max_tokens and self.llmanalyzer.tokens_used - tokens_at_start >= max_tokens)
+
+        skip = set(self.config.skip_accounts)
+        posts_done = 0
+        if not self.config.skip_posts_analysis:
+            now = time.time()
+            pending = [entry for entry in self.neo4j_manager.execute_read(self.neo4j_manager.find_pending_posts, self.config.triage_threshold) if entry["username"] not in skip]
+            owners = {entry["post"]["id"]: entry["username"] for entry in pending}
+            remaining = Counter(owners.values())
+            heap = [(-analysis_priority(entry["post"], entry["followers"], now), i, entry["post"]) for i, entry in enumerate(pending)]
+            heapq.heapify(heap)
+            self.logger.info(f"POSTS_ANALYSIS - {len(heap)} unanalyzed posts across {len(remaining)} account(s)")
+
+            def done(post):
+                nonlocal posts_done
+                posts_done += 1
+                remaining[owners[post["id"]]] -= 1
+                progress.update()
+
+            with tqdm(desc=f"Analyzing Post", unit="post", total=len(heap), ncols=70) as progress:
+                while heap and not exhausted():
+                    chunk = [heapq.heappop(heap)[2] for _ in range(min(checkpoint_every, len(heap)))]
+                    try:
+                        asyncio.run(self.llmanalyzer.aprocess_posts(
+                            self, chunk, concurrency=self.config.analysis_concurrency, on_done=done, should_stop=exhausted
+                        ))
+                    except QuotaExhausted as e:
+                        self.logger.warning(f"⚠  {e}. Stopping.")
+                        break
+                    except (ResourceExhausted, TooManyRequests):
+                        self.logger.warning(f"⚠  Rate limit hit. Stopping.")
+                        break
+                    except Exception as e:
+                        self.logger.error(f"⚠  Post analysis failed: {e}")
+                        continue # Its posts stay unanalyzed for the next run
+                    finally:
+                        # Checkpoint: people with nothing left to analyze
+                        for username in {owners[post["id"]] for post in chunk}:
+                            if remaining[username] == 0:
+                                self.neo4j_manager.execute_write(self.neo4j_manager.set_completion_flags, username, posts_analysis=True)
+            if heap and exhausted():
+                self.logger.warning(f"⏱  Analysis budget exhausted — {len(pending) - posts_done} posts left for the next run.")
+            self.logger.info(f"✓  {posts_done}/{len(pending)} pending posts analyzed")
+
+        accounts_done = 0
+        if not self.config.skip_account_analysis:
+            for entry in self.neo4j_manager.execute_read(self.neo4j_manager.find_pending_accounts, ACCOUNT_ANALYSIS_VERSION, self.llmanalyzer.model_ids, self.config.triage_threshold):
+                username = entry["username"]
+                if username in skip or entry["unanalyzed_posts"]:
+                    continue # Not all of its posts are analyzed yet; a later run picks it up
+                if exhausted():
+                    self.logger.warning("⏱  Analysis budget exhausted — stopping.")
+                    break
+                try:
+                    self.llmanalyzer.retry_policy.check()
+                except QuotaExhausted as e:
+                    self.logger.warning(f"⚠  {e}. Stopping.")
+                    break
+                if not entry["posts_analyzed"]:
+                    self.neo4j_manager.execute_write(self.neo4j_manager.set_completion_flags, username, posts_analysis=True)
+                print()
+                self.logger.info(f"ACCOUNT_ANALYSIS - {username}" + (" (stale)" if entry["stale"] else ""))
+                self.analyze_account(username, full=entry["stale"])
+                accounts_done += 1
+
+        tokens = self.llmanalyzer.tokens_used - tokens_at_start
+        self.logger.info(f"✓  Analyzed {posts_done} posts and {accounts_done} accounts using {tokens} Gemini tokens in {int(time.monotonic() - budget.started_at)}s")
+
+    def _log_llm_stats(self):
+        if self.llmanalyzer.cache is not None:
+            stats = self.llmanalyzer.cache.stats()
+            self.logger.info(f"✓  LLM cache this run: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+        decode = self.llmanalyzer.decode_stats
+        if decode["failures"]:
+            self.logger.info(f"✓  JSON responses this run: {decode['parsed']} parsed, {decode['failures']} malformed and requested again")
+        triage = self.llmanalyzer.triage_counts
+        if triage["full"] or triage["skipped"]:
+            self.logger.info(f"✓  Triage this run: {triage['full']} posts fully analyzed, {triage['skipped']} kept at triage (below relevance {self.config.triage_threshold})")
+        for kind, stats in self.llmanalyzer.token_report.stats().items():
+            self.logger.info(f"✓  {kind.capitalize()} prompts this run: ~{stats['tokens']} context tokens ({stats['saved']:.0%} fewer than as JSON)")
+
     ## Finds the most popular user based on a given criterion (e.g., followers, date).
     def _famous(self, target: str, limit: int = 100, reverse: bool = False):
         """
@@ -646,23 +1140,36 @@ class InstagramManager:
         pass
 
 
-    def _request_made_and_wait(self, is_post: bool = False):
+    def _on_request(self, account: Optional[str], query_type: str):
         """
-        Increments request counter and enforces rate limits with jitter.
+        Called by the AdaptiveRateController right before each real HTTP request
+        (pacing has already been applied), so counters and budgets track what
+        Instagram actually sees rather than items processed.
         """
-        self.request_made += 1
-
-        # Short, random pause between each request to mimic human behavior
-        time.sleep(random.uniform(0.5, 2.5))
-
-        # Longer pause after a configurable number of requests
-        if self.request_made % self.config.max_request == 0:
-            self.logger.info("Proactive rate limit hit. Attempting to switch accounts...")
-            if not self._switch_account():
-                # If switching fails (e.g., all accounts are used), then pause.
-                sleep_duration = random.uniform(5 * 60, 10 * 60)  # 5 to 10 minutes
-                self.logger.info(f"All accounts tried. Pausing for {int(sleep_duration / 60)} minutes...")
-                time.sleep(sleep_duration)
+        if account:
+            self.account_pool.record_request(account)
+        context = getattr(self._local, "context", None)
+        if context is None: # Background session checks and analysis helper threads
+            self.run_budget.charge()
+            return
+        context.request_made += 1
+        context.requests_on_account += 1
+        (context.budget or self.run_budget).charge()
+
+    def _rotate_account_if_due(self):
+        """
+        Called between items. Once the current account has sent `max_request` HTTP
+        requests, rotate to the next account, or pause if there is none.
+        """
+        if self.context.requests_on_account < self.config.max_request:
+            return
+        self.context.requests_on_account = 0
+        self.logger.info("Proactive rate limit hit. Attempting to switch accounts...")
+        if not self._switch_account(rate_limited=False):
+            # If switching fails (e.g., every other account is cooling down), then pause.
+            sleep_duration = random.uniform(5 * 60, 10 * 60)  # 5 to 10 minutes
+            self.logger.info(f"All accounts tried. Pausing for {int(sleep_duration / 60)} minutes...")
+            self.budget.sleep(sleep_duration)
 
     ### Temporary Configuration 
 
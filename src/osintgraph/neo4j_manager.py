@@ -1,5 +1,6 @@
 import json
 import logging
+import threading
 import time
 from contextlib import contextmanager
 from dataclasses import dataclass
@@ -10,7 +11,7 @@ from neo4j import GraphDatabase, Session
 from neo4j.exceptions import Neo4jError, ServiceUnavailable
 from dateutil.parser import isoparse
 
-from typing import Optional, Dict, Generator
+from typing import Optional, Dict, Generator, List
 
 from .credential_manager import get_credential_manager
 from .constants import USEFUL_FIELDS, NEO4J_SYNC_QUEUE_FILE
@@ -34,7 +35,25 @@ def _safe_serialize(obj):
 
 
 
+# Fields of a post that post analysis reads: no `*_vector` embeddings or other bulky properties.
+# A post kept at its triage score is only fetched to be analyzed in full, so it comes without one.
+ANALYSIS_POST_PROJECTION = """post {
+    .id, .shortcode, .display_urls, .is_video, .is_pinned, .is_sponsored, .likes, .comments, .title,
+    .caption, .pcaption, .caption_hashtags, .caption_mentions, .tagged_users, .image_analysis,
+    post_analysis: CASE WHEN post.analysis_kind = "triage" THEN "" ELSE post.post_analysis END,
+    date_utc: toString(post.date_utc), date_local: toString(post.date_local)
+}"""
+
+# A post kept at its triage score that the current $triage_threshold (0 = triage off) would analyze in full
+RETRIAGED_POST = """(post.analysis_kind = "triage" AND ($triage_threshold = 0 OR post.triage_relevance >= $triage_threshold))"""
+# A post still to be analyzed: no post analysis yet, or only a triage score the current threshold no longer accepts
+UNANALYZED_POST = """(post.post_analysis IS NULL OR post.post_analysis = "" OR """ + RETRIAGED_POST + """)"""
+
+
 class Neo4jManager:
+    # The sync journal is a single file shared by every manager and worker thread.
+    _queue_lock = threading.RLock()
+
     def __init__(self, config: Neo4j_Config = Neo4j_Config()):
         
         self.config = config
@@ -95,41 +114,63 @@ class Neo4jManager:
         self._connect_to_neo4j()
 
     def _process_sync_queue(self):
-        if not os.path.exists(NEO4J_SYNC_QUEUE_FILE):
-            return
+        with self._queue_lock:
+            if not os.path.exists(NEO4J_SYNC_QUEUE_FILE):
+                return
+            try:
+                with open(NEO4J_SYNC_QUEUE_FILE, "r") as f:
+                    queue = json.load(f)
+            except (IOError, json.JSONDecodeError) as e:
+                self.logger.error(f"Error processing Neo4j sync queue file: {e}. The file might be corrupted.")
+                return
 
         self.logger.info("Found a pending Neo4j sync queue. Attempting to sync...")
+        unprocessed = []
+        for i, op_data in enumerate(queue):
+            op_name = op_data.get("operation")
+            args = op_data.get("args", [])
+            kwargs = op_data.get("kwargs", {})
+
+            if not op_name or not hasattr(self, op_name):
+                self.logger.warning(f"Skipping invalid operation in queue: {op_name}")
+                continue
+
+            operation = getattr(self, op_name)
+            try:
+                # Not through execute_write, which would journal a failing op a second time
+                with self.get_session() as session:
+                    session.execute_write(operation, *args, **kwargs)
+            except ServiceUnavailable as e:
+                self.logger.warning(f"Neo4j unavailable while syncing ({e}). Keeping the remaining operations for later.")
+                unprocessed.extend(queue[i:])
+                break
+            except Exception as e:
+                self.logger.error(f"⚠  Could not sync operation {op_name}: {e}. Keeping it for later.")
+                unprocessed.append(op_data)
+                continue
+            self.logger.info(f"✓  Synced operation: {op_name}")
+
+        # The journal is only rewritten now: what failed is kept, and so is anything other threads queued meanwhile
         try:
-            with open(NEO4J_SYNC_QUEUE_FILE, "r") as f:
-                queue = json.load(f)
-
-            remaining_ops = []
-            for op_data in queue:
-                op_name = op_data.get("operation")
-                args = op_data.get("args", [])
-                kwargs = op_data.get("kwargs", {})
-
-                if not op_name or not hasattr(self, op_name):
-                    self.logger.warning(f"Skipping invalid operation in queue: {op_name}")
-                    continue
-
-                operation = getattr(self, op_name)
-                try:
-                    # Use execute_write to run the queued operation
-                    self.execute_write(operation, *args, **kwargs)
-                    self.logger.info(f"✓  Synced operation: {op_name}")
-                except ServiceUnavailable:
-                    self.logger.warning(f"⚠  Failed to sync operation {op_name}, will retry later.")
-                    remaining_ops.append(op_data)
-
-            if remaining_ops:
-                with open(NEO4J_SYNC_QUEUE_FILE, "w") as f:
-                    json.dump(remaining_ops, f, indent=2)
-            else:
-                os.remove(NEO4J_SYNC_QUEUE_FILE)
-                self.logger.info("✓  Neo4j sync queue processed successfully.")
+            with self._queue_lock:
+                queued_meanwhile = []
+                if os.path.exists(NEO4J_SYNC_QUEUE_FILE):
+                    with open(NEO4J_SYNC_QUEUE_FILE, "r") as f:
+                        queued_meanwhile = json.load(f)[len(queue):]
+                remaining = unprocessed + queued_meanwhile
+                if remaining:
+                    with open(NEO4J_SYNC_QUEUE_FILE, "w") as f:
+                        json.dump(remaining, f, indent=2)
+                elif os.path.exists(NEO4J_SYNC_QUEUE_FILE):
+                    os.remove(NEO4J_SYNC_QUEUE_FILE)
         except (IOError, json.JSONDecodeError) as e:
-            self.logger.error(f"Error processing Neo4j sync queue file: {e}. The file might be corrupted.")
+            self.logger.error(f"Could not update Neo4j sync queue file: {e}")
+            return
+
+        if unprocessed:
+            self.logger.warning(f"⚠  {len(unprocessed)} queued Neo4j operation(s) could not be synced and stay queued.")
+        else:
+            self.logger.info("✓  Neo4j sync queue processed.")
     
     # Function to get session
     @contextmanager
@@ -147,7 +188,11 @@ class Neo4jManager:
             session.close()  # Ensure session is closed when done
 
     def execute_read(self, operation, *args, **kwargs):
-        """Centralized method for read operations with retry logic."""
+        """
+        Centralized method for read operations with retry logic.
+        Safe to call from worker threads: the driver is shared, each call opens its
+        own session, and retry sleeps never hold a lock.
+        """
         for attempt in range(3):
             try:
                 with self.get_session() as session:
@@ -160,7 +205,7 @@ class Neo4jManager:
                     raise
     
     def execute_write(self, operation, *args, **kwargs):
-        """Centralized method for write operations with retry logic."""
+        """Centralized method for write operations with retry logic. Thread-safe, see execute_read."""
         for attempt in range(3):
             try:
                 with self.get_session() as session:
@@ -183,13 +228,15 @@ class Neo4jManager:
             "timestamp": datetime.now().isoformat()
         }
         try:
-            queue = []
-            if os.path.exists(NEO4J_SYNC_QUEUE_FILE):
-                with open(NEO4J_SYNC_QUEUE_FILE, "r") as f:
-                    queue = json.load(f)
-            queue.append(op_data)
-            with open(NEO4J_SYNC_QUEUE_FILE, "w") as f:
-                json.dump(queue, f, indent=2)
+            # Read-modify-write of the shared journal must not interleave between threads.
+            with self._queue_lock:
+                queue = []
+                if os.path.exists(NEO4J_SYNC_QUEUE_FILE):
+                    with open(NEO4J_SYNC_QUEUE_FILE, "r") as f:
+                        queue = json.load(f)
+                queue.append(op_data)
+                with open(NEO4J_SYNC_QUEUE_FILE, "w") as f:
+                    json.dump(queue, f, indent=2)
         except (IOError, json.JSONDecodeError) as e:
             self.logger.error(f"Could not write to Neo4j sync queue file: {e}")
     def create_unique_constraint(self, session: Session):
@@ -225,6 +272,24 @@ class Neo4jManager:
         if missing_constraints:
             self.logger.info("Neo4j Constraints initialize successfully")
         
+    def create_analysis_indexes(self, session: Session):
+        """
+        Indexes the prompt version stamps of post and account analyses, looked up by
+        `reanalyze --stale`, and the posts completion flag `analyze` starts its scans from.
+        """
+        existing_index_names = [record["name"] for record in session.run("SHOW INDEXES")]
+        required_indexes = {
+            "post_analysis_version_index": "CREATE INDEX post_analysis_version_index FOR (p:Post) ON (p.analysis_version)",
+            "person_account_analysis_version_index": "CREATE INDEX person_account_analysis_version_index FOR (p:Person) ON (p.account_analysis_version)",
+            "person_posts_complete_index": "CREATE INDEX person_posts_complete_index FOR (p:Person) ON (p._posts_complete)",
+        }
+        missing_indexes = [name for name in required_indexes if name not in existing_index_names]
+        for name in missing_indexes:
+            session.run(required_indexes[name])
+
+        if missing_indexes:
+            self.logger.info("Neo4j analysis indexes initialize successfully")
+
     def create_vector_indexes(self, session: Session):
         # 1️⃣ Fetch existing indexes
         existing_indexes = session.run("SHOW INDEXES")
@@ -366,8 +431,8 @@ class Neo4jManager:
         result = session.run(query, username=username)
         return [record for record in result]
 
-    def save_shared_resume_cursor(self, session: Session, profile_id: int, data_type: str, end_cursor: str, count: int):
-        """Saves a shared, account-agnostic resume cursor."""
+    def save_shared_resume_cursor(self, session: Session, profile_id: int, data_type: str, end_cursor: str, count: int, label: str = "Person"):
+        """Saves a shared, account-agnostic resume cursor on a Person (or Post, for likers)."""
         prop_name = f"_shared_{data_type}_cursor"
         cursor_data = {
             "end_cursor": end_cursor,
@@ -375,17 +440,17 @@ class Neo4jManager:
         }
         cursor_json_string = json.dumps(cursor_data)
         query = f"""
-            MATCH (p:Person {{id: $profile_id}})
+            MATCH (p:{label} {{id: $profile_id}})
             SET p.{prop_name} = $cursor_json_string,
                 p._shared_{data_type}_cursor_updated_at = datetime()
         """
         session.run(query, profile_id=profile_id, cursor_json_string=cursor_json_string)
 
-    def get_shared_resume_cursor(self, session: Session, profile_id: int, data_type: str) -> dict:
+    def get_shared_resume_cursor(self, session: Session, profile_id: int, data_type: str, label: str = "Person") -> dict:
         """Gets the shared resume cursor for a specific data type."""
         prop_name = f"_shared_{data_type}_cursor"
         query = f"""
-            MATCH (p:Person {{id: $profile_id}})
+            MATCH (p:{label} {{id: $profile_id}})
             WHERE p.{prop_name} IS NOT NULL AND p.{prop_name} <> ""
             RETURN p.{prop_name} AS cursor_data
         """
@@ -395,11 +460,11 @@ class Neo4jManager:
             return json.loads(record["cursor_data"])
         return {}
 
-    def clear_shared_resume_cursor(self, session: Session, profile_id: int, data_type: str):
+    def clear_shared_resume_cursor(self, session: Session, profile_id: int, data_type: str, label: str = "Person"):
         """Clears the shared resume cursor property."""
         prop_name = f"_shared_{data_type}_cursor"
         query = f"""
-            MATCH (p:Person {{id: $profile_id}})
+            MATCH (p:{label} {{id: $profile_id}})
             SET p.{prop_name} = ""
         """
         session.run(query, profile_id=profile_id)
@@ -613,19 +678,20 @@ class Neo4jManager:
                 p.tagged_users = coalesce($tagged_users, []),
                 p.is_sponsored = coalesce($is_sponsored, false),
                 p.is_pinned = coalesce($is_pinned, false),
+                p.display_urls = coalesce($display_urls, p.display_urls, []),
                 p.image_analysis = coalesce($image_analysis, ""),
                 p.post_analysis = coalesce($post_analysis, "")
             """
         if not is_update:    
             cypher+="MERGE (owner)-[:POSTED]->(p)"
         
-        session.run(cypher, post)
+        session.run(cypher, {"display_urls": None, **post})
         if not is_update:
-            if post['likes'] > 0:
+            if (post['likes'] or 0) > 0:
                 self.create_users(session, post['likers_list'])
                 self.like_post(session, post['likers_list'])
 
-            if post['comments'] > 0: 
+            if (post['comments'] or 0) > 0: 
                 self.create_users(session, post['comments_details']['commentors_list'])
                 self.create_comments(session, post['comments_details']['comments_list'])
                 self.manage_comment_relationships(session, post['id'], post['comments_details']['comments_list'])
@@ -633,6 +699,21 @@ class Neo4jManager:
                     self.create_users(session, post['comments_details']['likers_list'])
                     self.liked_comment(session, post['comments_details']['likers_list'])
 
+    def update_post_analyses(self, session: Session, posts):
+        """Writes image/post analysis results for many posts at once; None leaves a field unchanged."""
+        session.run("""
+            WITH $posts AS posts
+            UNWIND posts AS post
+            MATCH (p:Post {id: post.id})
+            SET p.image_analysis = coalesce(post.image_analysis, p.image_analysis, ""),
+                p.post_analysis = coalesce(post.post_analysis, p.post_analysis, ""),
+                p.analysis_version = coalesce(post.analysis_version, p.analysis_version),
+                p.analysis_model = coalesce(post.analysis_model, p.analysis_model),
+                p.analysis_kind = coalesce(post.analysis_kind, p.analysis_kind),
+                p.triage_relevance = CASE WHEN post.analysis_kind IS NULL THEN p.triage_relevance ELSE post.triage_relevance END,
+                p.post_analyzed_at = CASE WHEN post.post_analysis IS NULL THEN p.post_analyzed_at ELSE datetime() END
+        """, posts=posts)
+
     def set_completion_flags(self, session: Session, username: str, *, profile: Optional[bool] = None, followers: Optional[bool] = None, followees: Optional[bool] = None, posts: Optional[bool] = None, posts_analysis: Optional[bool] = None, account_analysis: Optional[bool] = None):
         updates = []
         params = {"username": username}
@@ -666,6 +747,93 @@ class Neo4jManager:
         self.logger.debug(f"Updating completion flags for user {username}: {params}")
         session.run(query, params)
 
+    def set_account_analysis(self, session: Session, username: str, account_analysis: str, post_ids: List[int], version: str, model: str, posts_analyzed_at=None):
+        """
+        Stores `account_analysis` with the ids of the posts it was generated from, the
+        latest post_analyzed_at among them and the prompt version and model that made it.
+        """
+        session.run("""
+        MATCH (p:Person {username: $username})
+        SET p.account_analysis = $account_analysis,
+            p._account_analysis_post_ids = $post_ids,
+            p._account_analysis_posts_analyzed_at = $posts_analyzed_at,
+            p.account_analysis_version = $version,
+            p.account_analysis_model = $model
+        """, username=username, account_analysis=account_analysis, post_ids=post_ids, posts_analyzed_at=posts_analyzed_at, version=version, model=model)
+
+    def find_stale_analyses(self, session: Session, post_version: str, account_version: str, models: List[str], usernames: Optional[List[str]] = None, limit: Optional[int] = None,
+                            triage_threshold: int = 0) -> List[dict]:
+        """
+        Persons with post or account analyses made by other prompt versions or by a
+        model not in `models` (or not stamped at all), or with posts kept at a triage
+        score that `triage_threshold` would now analyze in full, most followed first.
+        Each entry has the username, the number of stale posts and whether the
+        account analysis is stale.
+        """
+        result = session.run("""
+        CALL {
+            MATCH (p:Person)-[:POSTED]->(post:Post)
+            WHERE post.post_analysis <> ""
+              AND (coalesce(post.analysis_version, "") <> $post_version
+                OR NOT all(m IN split(coalesce(post.analysis_model, ""), "+") WHERE m IN $models)
+                OR """ + RETRIAGED_POST + """)
+            RETURN p, count(post) AS stale_posts
+            UNION
+            MATCH (p:Person)
+            WHERE p.account_analysis <> ""
+              AND (coalesce(p.account_analysis_version, "") <> $account_version
+                OR NOT all(m IN split(coalesce(p.account_analysis_model, ""), "+") WHERE m IN $models))
+            RETURN p, 0 AS stale_posts
+        }
+        WITH p, sum(stale_posts) AS stale_posts
+        WHERE $usernames IS NULL OR p.username IN $usernames
+        RETURN p.username AS username, stale_posts,
+            p.account_analysis <> ""
+              AND (coalesce(p.account_analysis_version, "") <> $account_version
+                OR NOT all(m IN split(coalesce(p.account_analysis_model, ""), "+") WHERE m IN $models)) AS stale_account
+        ORDER BY p.followers DESC
+        """ + ("LIMIT $limit" if limit else ""),
+            post_version=post_version, account_version=account_version, models=models, usernames=usernames, limit=limit, triage_threshold=triage_threshold)
+        return [r.data() for r in result]
+
+    def find_pending_posts(self, session: Session, triage_threshold: int = 0) -> List[dict]:
+        """
+        Unanalyzed posts of every person whose posts have been scraped (see
+        UNANALYZED_POST), each with the username and follower count of its owner.
+        Starts from the indexed `_posts_complete` flag instead of scanning all posts.
+        """
+        result = session.run("""
+        MATCH (p:Person)
+        WHERE p._posts_complete = true
+        MATCH (p)-[:POSTED]->(post:Post)
+        WHERE """ + UNANALYZED_POST + """
+        RETURN """ + ANALYSIS_POST_PROJECTION + """ AS post,
+            p.username AS username, coalesce(p.followers, 0) AS followers
+        """, triage_threshold=triage_threshold)
+        return [r.data() for r in result]
+
+    def find_pending_accounts(self, session: Session, account_version: str, models: List[str], triage_threshold: int = 0) -> List[dict]:
+        """
+        Persons with scraped posts whose account analysis is not done yet or was made
+        by other prompts or a model not in `models` (`stale`), most followed first, with the
+        number of their posts still unanalyzed.
+        """
+        result = session.run("""
+        MATCH (p:Person)
+        WHERE p._posts_complete = true
+        WITH p,
+            coalesce(p.account_analysis, "") <> ""
+              AND (coalesce(p.account_analysis_version, "") <> $account_version
+                OR NOT all(m IN split(coalesce(p.account_analysis_model, ""), "+") WHERE m IN $models)) AS stale
+        WHERE stale OR NOT coalesce(p._account_analysis_complete, false)
+        OPTIONAL MATCH (p)-[:POSTED]->(post:Post)
+        WHERE """ + UNANALYZED_POST + """
+        RETURN p.username AS username, coalesce(p.followers, 0) AS followers, stale,
+            coalesce(p._posts_analysis_complete, false) AS posts_analyzed, count(post) AS unanalyzed_posts
+        ORDER BY followers DESC
+        """, account_version=account_version, models=models, triage_threshold=triage_threshold)
+        return [r.data() for r in result]
+
     def get_completion_flags(self, session: Session, username: str) -> Dict[str, Optional[bool]]:
         query = """
         MATCH (p:Person {username: $username})
@@ -736,14 +904,52 @@ class Neo4jManager:
             result = session.run(query, username=username)
             for record in result:
                 yield dict(record["post"])
-    def get_posts_unanalyzed_by_username(self, username: str) -> Generator[dict, None, None]:
+    def get_posts_by_username_excluding(self, username: str, post_ids: List[int]) -> Generator[dict, None, None]:
+        """Posts of `username` whose id is not in `post_ids`, e.g. those not yet covered by the account_analysis."""
         with self.driver.session() as session:
             query = """
             MATCH (p:Person {username: $username})-[:POSTED]->(post:Post)
-            WHERE post.post_analysis IS NULL OR post.post_analysis = ""
+            WHERE NOT post.id IN $post_ids
             RETURN post {.*, date_utc: toString(post.date_utc), date_local: toString(post.date_local)}
             """
-            result = session.run(query, username=username)
+            result = session.run(query, username=username, post_ids=post_ids)
+            for record in result:
+                yield dict(record["post"])
+    def has_posts_analyzed_since(self, username: str, post_ids: List[int], since) -> bool:
+        """Whether a post of `username` in `post_ids` got its post_analysis after `since` (None: at any time it was stamped)."""
+        with self.driver.session() as session:
+            query = """
+            MATCH (p:Person {username: $username})-[:POSTED]->(post:Post)
+            WHERE post.id IN $post_ids AND post.post_analyzed_at IS NOT NULL
+              AND ($since IS NULL OR post.post_analyzed_at > $since)
+            RETURN count(post) > 0 AS changed
+            """
+            return session.run(query, username=username, post_ids=post_ids, since=since).single()["changed"]
+    def get_stale_posts_by_username(self, username: str, version: str, models: List[str], triage_threshold: int = 0) -> Generator[dict, None, None]:
+        """
+        Analyzed posts of `username` not stamped with `version` and models in `models`,
+        or kept at a triage score that `triage_threshold` would now analyze in full.
+        """
+        with self.driver.session() as session:
+            query = """
+            MATCH (p:Person {username: $username})-[:POSTED]->(post:Post)
+            WHERE post.post_analysis <> ""
+              AND (coalesce(post.analysis_version, "") <> $version
+                OR NOT all(m IN split(coalesce(post.analysis_model, ""), "+") WHERE m IN $models)
+                OR """ + RETRIAGED_POST + """)
+            RETURN """ + ANALYSIS_POST_PROJECTION + """ AS post
+            """
+            result = session.run(query, username=username, version=version, models=models, triage_threshold=triage_threshold)
+            for record in result:
+                yield dict(record["post"])
+    def get_posts_unanalyzed_by_username(self, username: str, triage_threshold: int = 0) -> Generator[dict, None, None]:
+        with self.driver.session() as session:
+            query = """
+            MATCH (p:Person {username: $username})-[:POSTED]->(post:Post)
+            WHERE """ + UNANALYZED_POST + """
+            RETURN """ + ANALYSIS_POST_PROJECTION + """ AS post
+            """
+            result = session.run(query, username=username, triage_threshold=triage_threshold)
             for record in result:
                 yield dict(record["post"])
     def get_post_by_id(self, session, id: int) -> Optional[dict]:
@@ -768,13 +974,13 @@ class Neo4jManager:
         record = result.single()
         return record["total"] if record else 0
 
-    def count_posts_unanalyzed_by_username(self, session, username: str) -> int:
+    def count_posts_unanalyzed_by_username(self, session, username: str, triage_threshold: int = 0) -> int:
         query = """
         MATCH (p:Person {username: $username})-[:POSTED]->(post:Post)
-        WHERE post.post_analysis IS NULL OR post.post_analysis = ""
+        WHERE """ + UNANALYZED_POST + """
         RETURN count(post) AS total
         """
-        result = session.run(query, username=username)
+        result = session.run(query, username=username, triage_threshold=triage_threshold)
         record = result.single()
         return record["total"] if record else 0
 
@@ -1,9 +1,9 @@
 import asyncio
-import re
 import json
 import os
 import requests
-from itertools import islice
+import queue
+import threading
 import logging
 
 
@@ -25,12 +25,10 @@ from langmem.short_term import SummarizationNode, RunningSummary
 import langmem.short_term.summarization as summarization_mod
 
 from ..credential_manager import get_credential_manager
-from ..services.llm_models import (
-    gemini_2_0_flash, 
-    gemini_2_0_flash_with_limit,
-    text_embedding_004_llm
-)
+from ..services.llm_models import MODEL_SPECS, get_model, registry
+from ..services.embedding_engine import EmbeddingEngine
 from ..neo4j_manager import Neo4jManager
+from ..services.retry_policy import QuotaExhausted, server_retry_delay
 
 from .osint_prompts import (
     INVESTIGATION_PROMPT,
@@ -79,7 +77,7 @@ class State(TypedDict):
 class OSINTGraphAgent:
     def __init__(self, debug=False):
         self.debug = debug
-        self.llm = gemini_2_0_flash
+        self.llm = get_model("gemini_2_0_flash")
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.DEBUG if debug else logging.INFO)
         self.nm = Neo4jManager()
@@ -158,15 +156,16 @@ class OSINTGraphAgent:
 
         except requests.RequestException as e:
             self.logger.warning(f"⚠ Network error: {e}")
-    def initialize_vector_store(self):
+    def initialize_vector_store(self, page_size: int = 200, window: int = 4, concurrency: int = 4):
+        """
+        Embeds every USEFUL_FIELDS property that has no vector yet. Nodes are read
+        page by page (keyset pagination on `id`), and fetching, embedding and
+        writing run as three stages joined by queues holding at most `window`
+        pages, so memory stays flat however large the graph is and the next page
+        is read while the current ones are embedded. Up to `concurrency` pages are
+        embedded at once, within the embedding model's RPM (see EmbeddingEngine).
+        """
         live_console.print("[grey70]⚡ Updating vectors...[/grey70]")
-        def batched(iterable, size):
-            it = iter(iterable)
-            while True:
-                batch = list(islice(it, size))
-                if not batch:
-                    break
-                yield batch
 
         def inject_summaries_into_posts(post_nodes):
             for post in post_nodes:
@@ -182,18 +181,20 @@ class OSINTGraphAgent:
                     person["account_analysis"] = generate_account_summary(person["account_analysis"])
             return person_nodes
 
-        def fetch_nodes_missing_vectors(label, field):
+        def fetch_nodes_missing_vectors(label, field, after=None):
             """
-            Fetch nodes where:
+            Fetch the next `page_size` nodes, by id after `after`, where:
             - the field exists and is not null/empty
             - the corresponding vector field is null
             """
             query = f"""
             MATCH (n:{label})
-            WHERE n.{field} IS NOT NULL AND trim(n.{field}) <> "" AND n.{field}_vector IS NULL
+            WHERE {"n.id > $after AND " if after is not None else ""}n.{field} IS NOT NULL AND trim(n.{field}) <> "" AND n.{field}_vector IS NULL
             RETURN n.id AS id, n.{field} AS content
+            ORDER BY n.id
+            LIMIT $limit
             """
-            return self.nm.execute_read(self.nm.run_query_with_params, query)
+            return self.nm.execute_read(self.nm.run_query_with_params, query, {"after": after, "limit": page_size})
 
         def store_field_vectors_batch(label, batch_data):
             query = f"""
@@ -203,43 +204,106 @@ class OSINTGraphAgent:
             """
             self.nm.execute_write(self.nm.run_query_with_params, query, {"data": batch_data})
 
-        for label in USEFUL_FIELDS:
-            # print(f"🔄 Processing {label} nodes...")
-
-            for field in USEFUL_FIELDS[label]:
-                # print(f"🔸 Embedding field: {label}.{field}")
-
-                # Fetch only nodes missing this vector field
-                nodes = fetch_nodes_missing_vectors(label, field)
-
-                # Inject summaries if needed
-                if label == "Person" and field == "account_analysis":
-                    nodes = inject_summaries_into_persons(nodes)
-                elif label == "Post" and field in ["post_analysis", "image_analysis"]:
-                    nodes = inject_summaries_into_posts(nodes)
-
-                texts = []
-                refs = []
-
-                for node in nodes:
-                    content = node.get("content")
-                    if content:
-                        texts.append(str(content))
-                        refs.append({"id": node["id"], "property": f"{field}_vector"})
+        def fetch_pages(label, field, pages: "queue.Queue", stop: threading.Event):
+            # Nodes embedded meanwhile drop out of the filter; the id cursor keeps the scan moving past those that failed
+            try:
+                after = None
+                while not stop.is_set() and (page := fetch_nodes_missing_vectors(label, field, after)):
+                    after = page[-1]["id"]
+                    pages.put(page)
+            except Exception as e:
+                self.logger.error(f"⚠  Failed to read {label}.{field} nodes: {e}")
+            finally:
+                pages.put(None)
 
-                for text_batch, ref_batch in zip(batched(texts, 200), batched(refs, 200)):
+        def write_batches(label, field, writes: "queue.Queue"):
+            while (batch_data := writes.get()) is not None:
+                try:
+                    store_field_vectors_batch(label, batch_data)
+                except Exception as e:
+                    self.logger.error(f"⚠  Failed to store {label}.{field} vectors: {e}")
+
+        async def embed_page(engine, field, nodes, writes: "queue.Queue"):
+            # print(f"✨ Embedding batch of size {len(nodes)} for {label}.{field}")
+            vectors = await engine.aembed([str(node["content"]) for node in nodes])
+            if vectors is not None: # Otherwise left without vectors for the next launch
+                await asyncio.to_thread(writes.put, [
+                    {"id": node["id"], "property": f"{field}_vector", "vector": vector}
+                    for node, vector in zip(nodes, vectors)
+                ])
+
+        async def backfill():
+            # Built inside the event loop, which the embeddings' async client binds to
+            engine = EmbeddingEngine(
+                get_model("text_embedding_004_llm"),
+                concurrency=concurrency,
+                rate_limiter=registry.limiter(MODEL_SPECS["text_embedding_004_llm"]["model"]),
+            )
+            for label in USEFUL_FIELDS:
+                # print(f"🔄 Processing {label} nodes...")
+
+                for field in USEFUL_FIELDS[label]:
+                    # print(f"🔸 Embedding field: {label}.{field}")
+                    pages, writes = queue.Queue(maxsize=window), queue.Queue(maxsize=window)
+                    stop = threading.Event()
+                    stages = [
+                        threading.Thread(target=fetch_pages, args=(label, field, pages, stop), daemon=True),
+                        threading.Thread(target=write_batches, args=(label, field, writes), daemon=True),
+                    ]
+                    for stage in stages:
+                        stage.start()
+
+                    in_flight, errors = set(), []
+
+                    def finished(task):
+                        in_flight.discard(task)
+                        if not task.cancelled() and task.exception() is not None:
+                            errors.append(task.exception()) # QuotaExhausted; the engine retries everything else
+
+                    nodes = []
                     try:
-                        # print(f"✨ Embedding batch of size {len(text_batch)} for {label}.{field}")
-                        vectors = text_embedding_004_llm.embed_documents(text_batch)
-                        batch_data = [
-                            {**ref, "vector": vector}
-                            for ref, vector in zip(ref_batch, vectors)
-                        ]
-                        store_field_vectors_batch(label, batch_data)
-                    except Exception as e:
-                        self.logger.error(f"⚠  Failed to embed {label}.{field} batch: {e}")
+                        while not errors and (nodes := await asyncio.to_thread(pages.get)) is not None:
+                            # Inject summaries if needed
+                            if label == "Person" and field == "account_analysis":
+                                nodes = inject_summaries_into_persons(nodes)
+                            elif label == "Post" and field in ["post_analysis", "image_analysis"]:
+                                nodes = inject_summaries_into_posts(nodes)
+
+                            nodes = [node for node in nodes if node.get("content")]
+                            if not nodes:
+                                continue
+                            task = asyncio.create_task(embed_page(engine, field, nodes, writes))
+                            in_flight.add(task)
+                            task.add_done_callback(finished)
+                            if len(in_flight) >= concurrency: # Keeps the pages held in memory bounded
+                                await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                        await asyncio.gather(*in_flight)
+                        if errors:
+                            raise errors[0]
+                    finally:
+                        stop.set()
+                        if nodes is not None: # Left early: drop what is in flight and unblock the reader so it sees `stop`
+                            for task in in_flight:
+                                task.cancel()
+                            while pages.get() is not None:
+                                pass
+                        writes.put(None)
+                        for stage in stages:
+                            stage.join()
+
+                live_console.print(f"[grey70]• ✓  {label}[/grey70]", end=" ")
+            return engine.stats()
 
-            live_console.print(f"[grey70]• ✓  {label}[/grey70]", end=" ")
+        try:
+            stats = asyncio.run(backfill())
+        except QuotaExhausted as e:
+            self.logger.warning(f"⚠  {e}. Remaining vectors are added on the next launch.")
+            return
+        if stats["embedded"] or stats["failed"]:
+            live_console.print(
+                f"\n[grey70]• {stats['embedded']} texts embedded in {stats['seconds']}s ({stats['per_second']}/s)"
+                + (f", {stats['failed']} failed and left for the next launch" if stats["failed"] else "") + "[/grey70]"
+            )
 
 
     def initialize_agent(self):
@@ -253,8 +317,8 @@ class OSINTGraphAgent:
 
         ]
 
-        self.llm_with_tools = gemini_2_0_flash.bind_tools(self.tools)
-        self.llm_with_tools_with_limit = gemini_2_0_flash_with_limit.bind_tools(self.tools)
+        self.llm_with_tools = get_model("gemini_2_0_flash").bind_tools(self.tools)
+        self.llm_with_tools_with_limit = get_model("gemini_2_0_flash_with_limit").bind_tools(self.tools)
         self.llm = self.llm_with_tools
         self.logger.info("Agent is in beta — responses may be inconsistent. Ask for clarification if needed.")
         self.logger.info("Type 'exit' to end the session.")
@@ -266,7 +330,7 @@ class OSINTGraphAgent:
     
         message_summarization_node = SummarizationNode(
             token_counter=count_tokens_approximately,
-            model=gemini_2_0_flash_with_limit,
+            model=get_model("gemini_2_0_flash_with_limit"),
             max_tokens=100000,
             max_tokens_before_summary=200000,
             max_summary_tokens=3000,
@@ -278,7 +342,7 @@ class OSINTGraphAgent:
 
         scratchpad_summarization_node = SummarizationNode(
             token_counter=count_tokens_approximately,
-            model=gemini_2_0_flash_with_limit,
+            model=get_model("gemini_2_0_flash_with_limit"),
             max_tokens=100000,
             max_tokens_before_summary=150000,
             max_summary_tokens=3000,
@@ -447,9 +511,7 @@ class OSINTGraphAgent:
                 except Exception as e:
                     err_str = str(e)
                     if "429" in err_str:
-                        # Inline regex extraction of retry_delay
-                        m = re.search(r"retry_delay\s*{\s*seconds:\s*(\d+)", err_str)
-                        delay = int(m.group(1)) if m else 10
+                        delay = int(server_retry_delay(e) or 10)
                         delay += 15  # small buffer
                         prev_status_items = list(ui.status_text.items)
                         for remaining in range(delay, 0, -1):
@@ -17,12 +17,20 @@ from ...services.llm_analyzer import LLMAnalyzer
 from ...utils.schemas import GetTemplateDetailsInput
 from ...constants import TEMPLATES_DIR, DEBUG_LOGS_DIR
 from ...ui import ui
-from ...services.llm_models import gemini_2_5_flash_llm_with_limit
+from ...services.llm_models import get_model
 
 logger = logging.getLogger(__name__)
 
 console = Console()
-template_llm = LLMAnalyzer(default_model=gemini_2_5_flash_llm_with_limit)
+_template_llm = None
+
+
+def template_llm() -> LLMAnalyzer:
+    """The analyzer running templates, created on first use."""
+    global _template_llm
+    if _template_llm is None:
+        _template_llm = LLMAnalyzer(default_model=get_model("gemini_2_5_flash_llm_with_limit"))
+    return _template_llm
 
 
 
@@ -189,7 +197,7 @@ def run_template(template_name: str, args: dict) -> str:
     full_prompt = f"[SYSTEM]\n{template['system_prompt'].strip()}\n\n[USER]\n{rendered_user_prompt.strip()}"
     ui.status_text.set(f"[grey70]Executing Template {template_name}...[/grey70]")
     try:
-        result = template_llm.analyze_text(user_prompt=rendered_user_prompt, system_prompt=template['system_prompt'], json_output=False)
+        result = template_llm().analyze_text(user_prompt=rendered_user_prompt, system_prompt=template['system_prompt'], json_output=False)
         ui.status_text.set(f"[grey70]Results from {template_name}:[/grey70]")
     except Exception as e:
         logger.error(f"Error running template '{template_name}': {e}")
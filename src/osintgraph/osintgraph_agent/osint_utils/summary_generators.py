@@ -48,6 +48,18 @@ def generate_post_summary(post_summary_str: str) -> str:
 
         parts = []
 
+        # === Kept at triage: only a relevance score and short summary, no full analysis
+        if "triage" in summary:
+            triage = summary["triage"]
+            parts.append(f"This post was not analyzed in full: triage rated its OSINT relevance {triage.get('osint_relevance', 'N/A')}/10.")
+            if triage.get("summary"):
+                parts.append(f"Summary: {triage['summary']}.")
+            if triage.get("topics"):
+                parts.append(f"Topics: {', '.join(triage['topics'])}.")
+            if triage.get("reason"):
+                parts.append(f"Reason: {triage['reason']}.")
+            return " ".join(parts)
+
         # === Metadata
         meta = summary.get("post_metadata_summary", {})
         parts.append(f"This post is a {meta.get('post_type', 'post')} with a {meta.get('post_tone', 'neutral')} tone, intended for {meta.get('target_audience', 'general audience')}.")
@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import instaloader
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket whose refill rate adapts with AIMD: every request
+    that goes through without a throttle nudges the rate up additively, every
+    429/backoff cuts it multiplicatively.
+    """
+    def __init__(self, rate: float, capacity: float, min_rate: float, max_rate: float,
+                 increase: float = 0.005, decrease: float = 0.5):
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.requests = 0
+        self.throttles = 0
+        self._throttled_since_last = False
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self) -> float:
+        """Blocks until a token is available, takes it and returns the time waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    # The previous request was not throttled: additive increase.
+                    if not self._throttled_since_last:
+                        self.rate = min(self.max_rate, self.rate + self.increase)
+                    self._throttled_since_last = False
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def throttle(self):
+        """Multiplicative decrease after a 429 / backoff response; also drains the bucket."""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = 0
+            self.updated_at = time.monotonic()
+            self.throttles += 1
+            self._throttled_since_last = True
+
+
+class AccountRateLimiter:
+    """
+    One adaptive TokenBucket per Instagram account, shared by every Instaloader
+    context (and thread) that scrapes with that account.
+    """
+    def __init__(self, requests_per_minute: float = 30, burst: float = 5,
+                 min_requests_per_minute: float = 3, max_requests_per_minute: float = 60):
+        self.rate = requests_per_minute / 60
+        self.burst = burst
+        self.min_rate = min(min_requests_per_minute, requests_per_minute) / 60
+        self.max_rate = max(max_requests_per_minute, requests_per_minute) / 60
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, account: Optional[str]) -> TokenBucket:
+        key = account or ""
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(self.rate, self.burst, self.min_rate, self.max_rate)
+            return self._buckets[key]
+
+    def acquire(self, account: Optional[str]) -> float:
+        return self.bucket(account).acquire()
+
+    def throttle(self, account: Optional[str]):
+        self.bucket(account).throttle()
+
+    def stats(self) -> Dict[str, dict]:
+        """Per-account request count, 429 count and current rate (requests/minute)."""
+        with self._lock:
+            return {
+                account or "anonymous": {
+                    "requests": b.requests,
+                    "throttles": b.throttles,
+                    "requests_per_minute": round(b.rate * 60, 2),
+                }
+                for account, b in self._buckets.items()
+            }
+
+
+class AdaptiveRateController(instaloader.RateController):
+    """
+    Instaloader RateController that paces every real HTTP request through the
+    shared per-account token bucket and reports it to `on_request(account, query_type)`.
+    Instaloader's own sliding-window limits still apply on top as a hard safety net.
+    """
+    def __init__(self, context, limiter: AccountRateLimiter, on_request: Optional[Callable[[Optional[str], str], None]] = None):
+        super().__init__(context)
+        self.limiter = limiter
+        self.on_request = on_request
+        self.logger = logging.getLogger(__name__)
+
+    def wait_before_query(self, query_type: str) -> None:
+        waited = self.limiter.acquire(self._context.username)
+        if waited > 15:
+            self.logger.debug(f"Rate limiter held {query_type} query for {waited:.0f}s")
+        super().wait_before_query(query_type)
+        if self.on_request:
+            self.on_request(self._context.username, query_type)
+
+    def handle_429(self, query_type: str) -> None:
+        self.limiter.throttle(self._context.username)
+        self.logger.debug(f"429 on {query_type}; rate for {self._context.username} lowered")
+        super().handle_429(query_type)
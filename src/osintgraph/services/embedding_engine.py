@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from google.api_core.exceptions import ResourceExhausted, TooManyRequests
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from .retry_policy import RetryPolicy, server_retry_delay
+from .shared_rate_limiter import SharedRateLimiter
+
+
+class EmbeddingEngine:
+    """
+    Embeds batches of texts concurrently with `aembed_documents`: at most
+    `concurrency` requests in flight, each one first taking a request from
+    `rate_limiter` (the embedding model's SharedRateLimiter, so the RPM is shared
+    with other processes). A failed batch is retried on its own with the usual
+    backoff, up to `max_retries` times, without holding up the other batches.
+    """
+    def __init__(self, embedder, concurrency: int = 4, rate_limiter: Optional[BaseRateLimiter] = None,
+                 max_retries: int = 6, retry_policy: Optional[RetryPolicy] = None):
+        self.embedder = embedder
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.logger = logging.getLogger(__name__)
+        self._slots = None # Created in the running event loop
+        self._started_at = None
+        self.counts = {"embedded": 0, "failed": 0, "batches": 0, "retries": 0}
+
+    async def aembed(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """Vectors of `texts`, or None once the batch failed `max_retries` times. Raises QuotaExhausted."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._started_at = time.monotonic()
+        for attempt in range(self.max_retries):
+            async with self._slots:
+                self.retry_policy.check()
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.aacquire()
+                try:
+                    vectors = await self.embedder.aembed_documents(texts)
+                    self.counts["embedded"] += len(vectors)
+                    self.counts["batches"] += 1
+                    return vectors
+                except (ResourceExhausted, TooManyRequests) as e:
+                    if isinstance(self.rate_limiter, SharedRateLimiter):
+                        await self.rate_limiter.apenalize(server_retry_delay(e) or 60 / self.rate_limiter.requests_per_minute)
+                    delay = self.retry_policy.wait_time(attempt, e)
+                    error = e
+                except Exception as e:
+                    delay = self.retry_policy.delay(attempt, e)
+                    error = e
+            if attempt == self.max_retries - 1:
+                break
+            # Backing off outside the slot leaves it to other batches meanwhile
+            self.counts["retries"] += 1
+            self.logger.debug(f"Embedding batch of {len(texts)} failed ({error}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        self.counts["failed"] += len(texts)
+        self.logger.error(f"⚠  Embedding batch of {len(texts)} failed after {self.max_retries} attempts: {error}")
+        return None
+
+    def stats(self) -> dict:
+        seconds = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {**self.counts, "seconds": round(seconds, 1), "per_second": round(self.counts["embedded"] / seconds, 1) if seconds else 0.0}
@@ -0,0 +1,178 @@
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+## Local stand-ins for the Gemini chat and embedding clients, for benchmarks and
+## regression runs without API keys. Answers are derived from a hash of the
+## prompt, so the same input always gets the same output; only the simulated
+## latency, errors and 429s draw on a (seeded) random generator.
+
+EMBEDDING_DIMENSIONS = 768 # Same as text-embedding-004, so the Neo4j vector indexes fit
+
+
+def _digest(*parts: str) -> bytes:
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).digest()
+
+
+def _message_text(message: BaseMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return "\n".join(part.get("text", "") for part in message.content if isinstance(part, dict))
+
+
+def _image_count(message: BaseMessage) -> int:
+    if isinstance(message.content, str):
+        return 0
+    return sum(1 for part in message.content if isinstance(part, dict) and part.get("type") == "image_url")
+
+
+def fake_json(schema: dict, seed: bytes, path: str = "", array_length: int = 1):
+    """
+    A value valid for the Gemini `schema` (as built by gemini_response_schema), with
+    strings, numbers and booleans derived from `seed` and the field path. Arrays
+    hold `array_length` items.
+    """
+    h = _digest(seed.hex(), path)
+    kind = schema.get("type", "string").lower()
+    if kind == "object":
+        return {name: fake_json(sub, seed, f"{path}.{name}", array_length) for name, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [fake_json(schema.get("items", {}), seed, f"{path}[{i}]", array_length) for i in range(array_length)]
+    if kind == "integer":
+        return h[0] % 11 # Fits the 0-10 scores the prompts ask for
+    if kind == "number":
+        return round(h[0] % 101 / 10, 1) # 0-10 with decimals, like a score
+    if kind == "boolean":
+        return bool(h[0] & 1)
+    if schema.get("enum"):
+        return schema["enum"][h[0] % len(schema["enum"])]
+    return f"{path.rsplit('.', 1)[-1] or 'value'} {h[:3].hex()}"
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering without a network call. JSON requests (a `response_schema`,
+    or a system prompt with an output schema in LLMAnalyzer) get schema-valid JSON;
+    anything else a short templated text. Tools bound with `bind_tools` are never
+    called. Every response carries usage_metadata, so token accounting and the TPM
+    limit work as with Gemini.
+    """
+    model: str = "fake"
+    latency: float = 0.0 # Mean seconds per call (exponentially distributed)
+    error_rate: float = 0.0 # Share of calls failing with a 503
+    malformed_rate: float = 0.0 # Share of JSON responses cut off mid-way
+    rate_limit_rate: float = 0.0 # Chance of a call starting a burst of 429s
+    rate_limit_burst: int = 3 # Consecutive 429s per burst
+    retry_delay: int = 2 # Seconds the simulated 429s ask to wait
+    seed: int = 0
+
+    _rng: random.Random = PrivateAttr()
+    _burst_left: int = PrivateAttr(default=0)
+    _state_lock: Any = PrivateAttr()
+
+    def model_post_init(self, __context):
+        self._rng = random.Random(self.seed)
+        self._state_lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _draw(self) -> Tuple[float, bool]:
+        """Simulated latency of the next call and whether its JSON comes out malformed; raises the simulated error, if any."""
+        with self._state_lock:
+            if self._burst_left or self._rng.random() < self.rate_limit_rate:
+                self._burst_left = (self._burst_left or self.rate_limit_burst) - 1
+                raise ResourceExhausted(f"429 Resource has been exhausted (simulated). retry_delay {{ seconds: {self.retry_delay} }}")
+            if self._rng.random() < self.error_rate:
+                raise ServiceUnavailable("503 The model is overloaded (simulated)")
+            malformed = self._rng.random() < self.malformed_rate
+            delay = self._rng.expovariate(1 / self.latency) if self.latency else 0.0
+        return delay, malformed
+
+    def _schema(self, messages: List[BaseMessage], kwargs: dict) -> Optional[dict]:
+        if kwargs.get("response_schema"):
+            return kwargs["response_schema"]
+        system = next((_message_text(m) for m in messages if isinstance(m, SystemMessage)), "")
+        from .llm_analyzer import OUTPUT_SCHEMAS, RESPONSE_SCHEMAS # Imported late: llm_analyzer imports the model registry
+        schema = OUTPUT_SCHEMAS.get(system)
+        return RESPONSE_SCHEMAS[schema] if schema is not None else None
+
+    def _respond(self, messages: List[BaseMessage], malformed: bool, kwargs: dict) -> ChatResult:
+        prompt = "\n".join(_message_text(m) for m in messages)
+        images = sum(_image_count(m) for m in messages)
+        seed = _digest(self.model, prompt, str(images))
+        schema = self._schema(messages, kwargs)
+        if schema is not None:
+            text = json.dumps(fake_json(schema, seed, array_length=max(images, 1)))
+            if malformed:
+                text = text[:len(text) // 2]
+        else:
+            last = " ".join(_message_text(messages[-1]).split()) if messages else ""
+            text = f"[{self.model}] Simulated answer {seed[:4].hex()} to: {last[:80]}"
+        input_tokens = len(prompt) // 4 + 258 * images # Gemini bills an image as 258 tokens
+        output_tokens = len(text) // 4
+        message = AIMessage(content=text, usage_metadata={
+            "input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens,
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, malformed = self._draw()
+        time.sleep(delay)
+        return self._respond(messages, malformed, kwargs)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, malformed = self._draw()
+        await asyncio.sleep(delay)
+        return self._respond(messages, malformed, kwargs)
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic 768-d embeddings: each word is hashed onto a signed dimension and
+    the sum is normalized, so texts sharing words land close together and
+    semantic search still returns sensible neighbours.
+    """
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS, latency: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency # Seconds per call, regardless of batch size
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for word in re.findall(r"\w+", text.lower()) or [text]:
+            h = _digest(word)
+            index = int.from_bytes(h[:4], "big") % self.dimensions
+            vector[index] += 1.0 if h[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
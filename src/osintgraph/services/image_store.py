@@ -0,0 +1,173 @@
+import base64
+import io
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+from PIL import Image
+
+from ..constants import IMAGES_DIR
+from .llm_cache import content_hash
+
+
+@dataclass
+class LocalImage:
+    path: str
+    data: bytes
+    key: str # Cache key: content hash of `data`, or of a near-identical earlier image when perceptual matching is on
+
+    def data_url(self) -> str:
+        return f"data:image/jpeg;base64,{base64.b64encode(self.data).decode()}"
+
+
+def dhash(image: Image.Image, size: int = 8) -> int:
+    """64-bit difference hash: robust to re-encoding, resizing and small edits."""
+    pixels = list(image.convert("L").resize((size + 1, size), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree of 64-bit hashes under Hamming distance. A lookup only
+    visits subtrees whose edge distance is within reach of the query, instead of
+    comparing against every hash stored.
+    """
+    def __init__(self):
+        self._root = None # (hash, value, {distance: child})
+
+    def add(self, h: int, value: str):
+        if self._root is None:
+            self._root = (h, value, {})
+            return
+        node = self._root
+        while True:
+            distance = hamming(h, node[0])
+            if distance == 0:
+                return # The first value stored for a hash is kept
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (h, value, {})
+                return
+            node = child
+
+    def find(self, h: int, max_distance: int) -> Optional[str]:
+        """The value of the closest hash within `max_distance` of `h`, or None."""
+        best = None
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(h, node[0])
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, node[1])
+            stack.extend(child for edge, child in node[2].items() if abs(edge - distance) <= max_distance)
+        return best[1] if best else None
+
+
+class ImageStore:
+    """
+    Local, downscaled copies of post images. Each image is downloaded once, shrunk
+    to `max_edge` pixels on its longest side and re-encoded as JPEG, so it can be
+    sent inline instead of by CDN URL. Images are keyed by the hash of their bytes.
+
+    Reusing the analysis of a near-identical image (e.g. a repost) is opt-in: with
+    `match_distance`, an image whose perceptual hash is within that many bits of
+    an earlier one's gets its key. Keep it small (0-2): two different photos of
+    the same scene can be a few bits apart. With `max_entries`, the least
+    recently used images (files and index rows) are evicted.
+    """
+    def __init__(self, directory: str = IMAGES_DIR, max_edge: int = 1024, match_distance: Optional[int] = None, max_entries: int = 0):
+        self.directory = directory
+        self.max_edge = max_edge
+        self.match_distance = match_distance
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                name TEXT PRIMARY KEY,
+                phash TEXT,
+                key TEXT,
+                last_used REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS images_last_used ON images (last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+        self._load_tree()
+
+    def _load_tree(self):
+        self._tree = BKTree()
+        if self.match_distance is not None:
+            for phash, key in self._conn.execute("SELECT phash, key FROM images WHERE phash IS NOT NULL ORDER BY last_used"):
+                self._tree.add(int(phash, 16), key)
+
+    def _register(self, name: str, image: Image.Image, data: bytes) -> str:
+        """Records image `name` as just used and returns its cache key."""
+        key = f"sha256:{content_hash(data)}"
+        phash = dhash(image) if self.match_distance is not None else None
+        with self._lock:
+            if phash is not None:
+                key = self._tree.find(phash, self.match_distance) or key
+                self._tree.add(phash, key)
+            if self._conn.execute("SELECT 1 FROM images WHERE name = ?", (name,)).fetchone() is None:
+                self._count += 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO images (name, phash, key, last_used) VALUES (?, ?, ?, ?)",
+                (name, f"{phash:016x}" if phash is not None else None, key, time.time())
+            )
+            if self.max_entries and self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+        return key
+
+    def _evict(self):
+        """Drops the least recently used images down to 90% of `max_entries`, so eviction runs in batches."""
+        excess = self._count - int(self.max_entries * 0.9)
+        names = [row[0] for row in self._conn.execute("SELECT name FROM images ORDER BY last_used LIMIT ?", (excess,))]
+        self._conn.executemany("DELETE FROM images WHERE name = ?", ((name,) for name in names))
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, f"{name}.jpg"))
+            except FileNotFoundError:
+                pass
+        self._count -= len(names)
+        self._load_tree()
+
+    def load(self, url: str, name: str) -> Optional[LocalImage]:
+        """
+        The local copy of image `name`, downloading it from `url` on first use.
+        Returns None if the download fails (e.g. an expired CDN link).
+        """
+        path = os.path.join(self.directory, f"{name}.jpg")
+        if not os.path.exists(path):
+            try:
+                response = requests.get(url, timeout=30)
+                response.raise_for_status()
+                image = Image.open(io.BytesIO(response.content)).convert("RGB")
+            except (requests.RequestException, OSError):
+                return None
+            image.thumbnail((self.max_edge, self.max_edge))
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            image.save(tmp, format="JPEG", quality=85)
+            os.replace(tmp, path)
+
+        with open(path, "rb") as f:
+            data = f.read()
+        with Image.open(io.BytesIO(data)) as image:
+            key = self._register(name, image, data)
+        return LocalImage(path=path, data=data, key=key)
@@ -1,153 +1,725 @@
+import asyncio
+import base64
+import itertools
 import json
 import time
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple
 
+import requests
 from google.api_core.exceptions import ResourceExhausted, TooManyRequests
 from langchain_core.messages import HumanMessage, SystemMessage
 
+from pydantic import ValidationError
+
 from ..utils.data_extractors import extract_json_block
-from ..utils.prompts import image_analysis, post_analysis, account_analysis
+from ..utils.prompts import (
+    image_analysis,
+    post_analysis,
+    sidecar_post_analysis,
+    post_triage,
+    account_analysis,
+    account_chunk_analysis,
+    account_reduce_analysis,
+    account_update_analysis,
+)
 from ..utils.fetch_urls import fetch_post_urls
-from ..services.llm_models import gemini_2_0_flash_with_limit, gemini_2_5_flash_llm_with_limit
+from ..utils.schemas import AccountAnalysis, AccountChunkNotes, ImageAnalysis, PostAnalysis, PostTriage, SidecarAnalysis, gemini_response_schema
+from ..utils.prompt_encoding import TokenReport, approx_tokens, encode_comments, encode_record, table_header, table_row
+from ..services.llm_models import get_model, loop_client
+from .llm_cache import LLMCache, content_hash
+from .image_store import ImageStore
+from .retry_policy import RetryLater, RetryPolicy, server_retry_delay
+from .shared_rate_limiter import SharedRateLimiter
+
+
+ACCOUNT_PROFILE_FIELDS = ("username", "fullname", "bio", "followers", "followees", "is_verified", "is_business_account", "business_category_name", "biography_hashtags", "biography_mentions")
+ACCOUNT_POST_FIELDS = ("id", "date_utc", "date_local", "is_video", "is_pinned", "is_sponsored", "likes", "title", "caption", "caption_hashtags", "caption_mentions", "tagged_users", "post_analysis")
+ACCOUNT_POST_LIMITS = {"caption": 500, "title": 200} # The post_analysis already covers the full caption
+POST_CONTEXT_FIELDS = ("date_utc", "date_local", "is_video", "is_pinned", "is_sponsored", "likes", "comments", "title", "caption", "pcaption", "caption_hashtags", "caption_mentions", "tagged_users", "image_analysis")
+TRIAGE_FIELDS = tuple(field for field in POST_CONTEXT_FIELDS if field not in ("comments", "image_analysis"))
+
+
+def prompt_version(*prompts: str) -> str:
+    """Short hash identifying a set of prompts; it changes whenever any of them does."""
+    return content_hash("\0".join(prompts))[:12]
+
+
+# Stamped on every stored analysis (with the model id), so analyses made with older prompts can be found and redone.
+# Post analyses depend on the image prompts, and account analyses on post analyses, so changes cascade.
+POST_ANALYSIS_VERSION = prompt_version(post_triage, image_analysis, sidecar_post_analysis, post_analysis)
+ACCOUNT_ANALYSIS_VERSION = prompt_version(POST_ANALYSIS_VERSION, account_analysis, account_chunk_analysis, account_reduce_analysis, account_update_analysis)
+
+# Output shape of each JSON-returning prompt: requested from Gemini as a response schema and validated on parse
+OUTPUT_SCHEMAS = {
+    image_analysis: ImageAnalysis,
+    post_analysis: PostAnalysis,
+    sidecar_post_analysis: SidecarAnalysis,
+    post_triage: PostTriage,
+    account_analysis: AccountAnalysis,
+    account_chunk_analysis: AccountChunkNotes,
+    account_reduce_analysis: AccountAnalysis,
+    account_update_analysis: AccountAnalysis,
+}
+RESPONSE_SCHEMAS = {schema: gemini_response_schema(schema) for schema in set(OUTPUT_SCHEMAS.values())}
 
 
 class LLMAnalyzer:
 
-    def __init__(self, default_model=gemini_2_0_flash_with_limit, fallback_model=gemini_2_5_flash_llm_with_limit):
-        self.default_model = default_model
-        self.fallback_model = fallback_model
+    def __init__(self, default_model=None, fallback_model=None,
+                 cache: Optional[LLMCache] = None, images: Optional[ImageStore] = None, single_call_sidecars: bool = True,
+                 retry_policy: Optional[RetryPolicy] = None, triage_model=None, triage_threshold: int = 0,
+                 structured_output: bool = True):
+        # Unset models are looked up in the model registry on every use (see the properties below)
+        self._default_model = default_model
+        self._fallback_model = fallback_model
+        self._triage_model = triage_model
+        self.triage_threshold = triage_threshold # Posts scoring below this (0-10) on post_triage skip full analysis; 0 = no triage
+        self.triage_counts = {"full": 0, "skipped": 0}
+        self.structured_output = structured_output # Ask for schema-constrained JSON instead of parsing free text
+        self.decode_stats = {"parsed": 0, "failures": 0} # Failures are responses that had to be requested again
+        self.tokens_used = 0 # Gemini tokens (per usage_metadata) of the calls made, not counting cache hits
+        self.cache = cache
+        self.images = images
+        self.single_call_sidecars = single_call_sidecars
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.token_report = TokenReport()
+
+    ### Models
+    # Resolved at call time: a Gemini key set up after the analyzer was created
+    # (or a provider switched with registry.set_provider) is picked up.
+
+    @property
+    def default_model(self):
+        return self._default_model or get_model("gemini_2_0_flash_with_limit")
+
+    @property
+    def fallback_model(self):
+        return self._fallback_model or get_model("gemini_2_5_flash_llm_with_limit")
+
+    @property
+    def triage_model(self):
+        return self._triage_model or get_model("gemini_2_5_flash_lite_llm_with_limit")
+
+    ### Response cache (read-through)
+
+    @staticmethod
+    def _model_name(model) -> str:
+        return getattr(model, "model", None) or type(model).__name__
+
+    @property
+    def model_id(self) -> str:
+        """The configured model."""
+        return self._model_name(self.default_model)
+
+    @property
+    def model_ids(self) -> List[str]:
+        """Every model the current configuration may answer with: analyses stamped with others are stale."""
+        return [self._model_name(model) for model in (self.default_model, self.fallback_model, self.triage_model) if model]
+
+    def _model_stamp(self, models: Optional[Set[str]]) -> str:
+        """The analysis_model stamp of a result produced by `models` (names joined with "+")."""
+        return "+".join(sorted(models)) if models else self.model_id
+
+    def _is_current_stamp(self, stamp: Optional[str]) -> bool:
+        return bool(stamp) and all(name in self.model_ids for name in stamp.split("+"))
+
+    def _post_analysis_record(self, post: dict) -> dict:
+        """
+        Analysis fields of `post` for Neo4jManager.update_post_analyses, stamped once
+        post_analysis is done with the models that answered (collected in post["_models"])
+        and with whether it is a full analysis or a triage score the post was kept at.
+        """
+        done = bool(post.get("post_analysis"))
+        kept = post.get("_triage_kept") # Triage score, when the post was kept at it instead of analyzed in full
+        return {
+            "id": post["id"],
+            "image_analysis": post.get("image_analysis") or None,
+            "post_analysis": post.get("post_analysis") or None,
+            "analysis_version": POST_ANALYSIS_VERSION if done else None,
+            "analysis_model": self._model_stamp(post.get("_models")) if done else None,
+            "analysis_kind": ("full" if kept is None else "triage") if done else None,
+            "triage_relevance": kept if done else None,
+        }
+
+    def _cache_lookup(self, model, system_prompt: str, user_prompt: str = "", image_hash: str = "",
+                      read: bool = True) -> Tuple[Optional[str], Optional[str]]:
+        """Returns (cache key, cached response); both None when caching is off. Without `read`, only the key."""
+        if self.cache is None:
+            return None, None
+        key = LLMCache.key(self._model_name(model), system_prompt, user_prompt, image_hash)
+        return key, self.cache.get(key) if read else None
+
+    def _cache_store(self, key: Optional[str], model, response: str, fresh: bool):
+        """Stores a `fresh` response; a cached one being served is counted as a hit instead."""
+        if key is None:
+            return
+        if fresh:
+            self.cache.put(key, self._model_name(model), response)
+        else:
+            self.cache.count_hit()
+
+    ### Structured output
+
+    def _output_kwargs(self, system_prompt: str, json_output: bool) -> dict:
+        """Invocation kwargs asking Gemini to answer in the prompt's output schema."""
+        schema = OUTPUT_SCHEMAS.get(system_prompt)
+        if not (json_output and self.structured_output and schema):
+            return {}
+        return {"response_mime_type": "application/json", "response_schema": RESPONSE_SCHEMAS[schema]}
 
-    def analyze_image(self, url: str, system_prompt: str,  json_output: bool, max_retries=13, model_switch_threshold=1) -> dict:
+    def _parse_json(self, result: str, system_prompt: str, validate: Optional[Callable[[object], bool]] = None):
+        """
+        `result` decoded and, for prompts with an output schema, validated against
+        it (and by `validate`). Returns None when it does not decode or validate.
+        """
+        schema = OUTPUT_SCHEMAS.get(system_prompt)
+        parsed = None
+        if schema is not None:
+            try:
+                parsed = schema.model_validate_json(result).model_dump()
+            except ValidationError:
+                pass
+        if parsed is None: # Free-text JSON, e.g. fenced, or cached from before structured output
+            parsed = extract_json_block(result)
+            if isinstance(parsed, dict) and "error" in parsed:
+                parsed = None
+            elif schema is not None:
+                try:
+                    parsed = schema.model_validate(parsed).model_dump()
+                except ValidationError:
+                    parsed = None
+        if parsed is not None and validate and not validate(parsed):
+            parsed = None
+        self.decode_stats["parsed" if parsed is not None else "failures"] += 1
+        return parsed
+
+    def _load_image(self, url: str) -> Tuple[str, str]:
+        """
+        Returns (image reference for the model, content hash). With a cache the image
+        is downloaded here and sent inline, so it can be keyed by its bytes rather
+        than by a CDN URL that changes between scrapes; the Gemini client would
+        download it anyway.
+        """
+        if self.cache is None:
+            return url, ""
+        try:
+            response = requests.get(url, timeout=30)
+            response.raise_for_status()
+        except requests.RequestException:
+            return url, content_hash(url)
+        mime = response.headers.get("Content-Type", "image/jpeg").split(";")[0]
+        return f"data:{mime};base64,{base64.b64encode(response.content).decode()}", content_hash(response.content)
+
+    def _post_images(self, post: dict, fetch_urls: Callable[[dict], List[str]]) -> List[Tuple[str, str]]:
+        """
+        (image reference, hash) for every image of `post`. Uses the display URLs
+        saved at scrape time and only asks Instagram (`fetch_urls`) for posts scraped
+        before they were saved, or once if the saved CDN links have expired. With an
+        ImageStore, images are sent as local downscaled copies keyed by their content.
+        """
+        saved_urls = post.get("display_urls")
+        urls = saved_urls or fetch_urls(post)
+        if self.images is None:
+            return [self._load_image(url) for url in urls]
+
+        local = [self.images.load(url, f"{post['id']}_{i}") for i, url in enumerate(urls)]
+        if saved_urls and None in local:
+            urls = fetch_urls(post)
+            local = [self.images.load(url, f"{post['id']}_{i}") for i, url in enumerate(urls)]
+        return [
+            (image.data_url(), image.key) if image else self._load_image(url)
+            for url, image in zip(urls, local)
+        ]
+
+    @staticmethod
+    def _image_messages(url: str, system_prompt: str):
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=[{
+                "type": "image_url",
+                "image_url": {"url": url}
+            }])
+        ]
+
+    @staticmethod
+    def _text_messages(user_prompt: str, system_prompt: str):
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt)
+        ]
+
+    @staticmethod
+    def _multimodal_messages(text: str, images: List[str], system_prompt: str):
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=[
+                *({"type": "image_url", "image_url": {"url": image}} for image in images),
+                {"type": "text", "text": text},
+            ])
+        ]
+
+    def _post_prompt(self, post: dict, comments, with_image_analysis: bool = True) -> str:
+        post_inf = {k: v for k, v in post.items() if k in POST_CONTEXT_FIELDS}
+        if with_image_analysis:
+            post_inf['image_analysis'] = json.loads(post_inf['image_analysis'])
+        else:
+            post_inf.pop('image_analysis', None)
+        text = (
+            "Post contextual background:\n" + encode_record(post_inf, POST_CONTEXT_FIELDS)
+            + "\n\nComments (one per line, replies point to the `n` of their parent in `reply_to`):\n" + encode_comments(comments)
+        )
+        self.token_report.add("post", text, json_baseline=[post_inf, comments])
+        return text
+
+    def _record_usage(self, response) -> str:
+        """Counts the tokens `response` used and returns its content. (The shared TPM budget is charged by the model's TokenUsageRecorder.)"""
+        self.tokens_used += (getattr(response, "usage_metadata", None) or {}).get("total_tokens", 0)
+        return response.content
+
+    def _note_model(self, models: Optional[Set[str]], model):
+        if models is not None:
+            models.add(self._model_name(model))
+
+    @staticmethod
+    def _penalize(model, error: Exception):
+        """After a 429, pauses every process using this model for the server's retry delay (or one request interval)."""
+        limiter = getattr(model, "rate_limiter", None)
+        if isinstance(limiter, SharedRateLimiter):
+            limiter.penalize(server_retry_delay(error) or 60 / limiter.requests_per_minute)
+
+    @staticmethod
+    async def _apenalize(model, error: Exception):
+        limiter = getattr(model, "rate_limiter", None)
+        if isinstance(limiter, SharedRateLimiter):
+            await limiter.apenalize(server_retry_delay(error) or 60 / limiter.requests_per_minute)
+
+    def analyze_image(self, url: str, system_prompt: str,  json_output: bool, max_retries=13, model_switch_threshold=1, image_hash: Optional[str] = None,
+                      models: Optional[Set[str]] = None) -> dict:
+        """
+        Analyzes the image at `url`; with `image_hash`, `url` is an already loaded reference (e.g. a data URL).
+        The name of the model that answered is added to `models`.
+        """
         decode_failures = 0
+        image, image_hash = (url, image_hash) if image_hash is not None else self._load_image(url)
 
         for attempt in range(max_retries):
             try:
+                self.retry_policy.check()
                 # print(f"[Process] Processing URL: {url}")
                 current_model = (
                     self.fallback_model if decode_failures >= model_switch_threshold and self.fallback_model
                     else self.default_model
                 )
-                messages = [
-                    SystemMessage(content=system_prompt),
-                    HumanMessage(content=[{
-                        "type": "image_url",
-                        "image_url": {"url": url}
-                    }])
-                ]
-
-                result = current_model.invoke(messages).content
+                # A cached response that failed to parse is not read again
+                key, result = self._cache_lookup(current_model, system_prompt, image_hash=image_hash, read=not decode_failures)
+                fresh = result is None
+                if fresh:
+                    result = self._record_usage(current_model.invoke(self._image_messages(image, system_prompt), **self._output_kwargs(system_prompt, json_output)))
                 if json_output:
-                    parsed = extract_json_block(result)
+                    parsed = self._parse_json(result, system_prompt)
 
-                    if isinstance(parsed, dict) and "error" in parsed:
+                    if parsed is None:
                         decode_failures += 1
                         continue  # or handle as needed
+                    self._cache_store(key, current_model, result, fresh)
+                    self._note_model(models, current_model)
                     return parsed
+                self._cache_store(key, current_model, result, fresh)
+                self._note_model(models, current_model)
                 return result
             except (ResourceExhausted, TooManyRequests) as e:
+                self._penalize(current_model, e)
                 if attempt == max_retries - 1:
                     raise e
-                time.sleep(10)
+                time.sleep(self.retry_policy.wait_time(attempt, e))
             except Exception as e:
                 raise e
         raise RuntimeError("Image analysis failed after retries")
 
 
-    def analyze_text(self, user_prompt: str, system_prompt: str, json_output: bool= False, max_retries=13, model_switch_threshold=1) -> dict | str:
+    def analyze_text(self, user_prompt: str, system_prompt: str, json_output: bool= False, max_retries=13, model_switch_threshold=1,
+                     models: Optional[Set[str]] = None) -> dict | str:
         decode_failures = 0
 
         for attempt in range(max_retries):
             try:
+                self.retry_policy.check()
                 current_model = (
                     self.fallback_model if decode_failures >= model_switch_threshold and self.fallback_model
                     else self.default_model
                 )
 
-                messages = [
-                    SystemMessage(content=system_prompt),
-                    HumanMessage(content=user_prompt)
-                ]
-
-                result = current_model.invoke(messages).content
+                key, result = self._cache_lookup(current_model, system_prompt, user_prompt, read=not decode_failures)
+                fresh = result is None
+                if fresh:
+                    result = self._record_usage(current_model.invoke(self._text_messages(user_prompt, system_prompt), **self._output_kwargs(system_prompt, json_output)))
 
                 if json_output:
-                    parsed = extract_json_block(result)
+                    parsed = self._parse_json(result, system_prompt)
 
-                    if isinstance(parsed, dict) and "error" in parsed:
+                    if parsed is None:
                         decode_failures += 1
                         continue  # or handle as needed
+                    self._cache_store(key, current_model, result, fresh)
+                    self._note_model(models, current_model)
                     return parsed
+                self._cache_store(key, current_model, result, fresh)
+                self._note_model(models, current_model)
                 return result
             except (ResourceExhausted, TooManyRequests) as e:
+                self._penalize(current_model, e)
                 if attempt == max_retries - 1:
                     raise e
-                time.sleep(10)
+                time.sleep(self.retry_policy.wait_time(attempt, e))
             except Exception as e:
                 raise e
         raise RuntimeError("Text analysis failed after retries")
-            
 
-    def process_post(self, insta_manager, post):
-
-        if not post.get("post_analysis") or post["post_analysis"].strip() == "":
+    async def _ainvoke_json(self, messages: list, json_output: bool, system_prompt: str, user_prompt: str = "", image_hash: str = "",
+                            max_retries=13, model_switch_threshold=1, validate: Optional[Callable[[object], bool]] = None,
+                            max_decode_failures: Optional[int] = None, requeue: bool = False, model=None, models: Optional[Set[str]] = None):
+        """
+        Async counterpart of the analyze_* retry loop. Rate limiting is left to the
+        model's SharedRateLimiter, which `ainvoke` waits on without blocking
+        the event loop. With `requeue`, long backoffs raise RetryLater instead.
+        With `model`, only that model is used (no fallback). The name of the model
+        that answered (or whose cached answer was used) is added to `models`.
+        """
+        decode_failures = 0
 
-            if not post.get("image_analysis") or post["image_analysis"].strip() == "":
-                urls = fetch_post_urls(insta_manager.L, post)
-                try: 
-                    results = [self.analyze_image(url, system_prompt=image_analysis, json_output=True) for url in urls]
-                    post["image_analysis"] = json.dumps(results)
-                    insta_manager.neo4j_manager.execute_write(insta_manager.neo4j_manager.manage_post_relationships, post , True)
-                    # print(f"✅ Image analysis complete for post {post['id']}")
+        for attempt in range(max_retries):
+            try:
+                self.retry_policy.check()
+                current_model = model or (
+                    self.fallback_model if decode_failures >= model_switch_threshold and self.fallback_model
+                    else self.default_model
+                )
+                key, result = self._cache_lookup(current_model, system_prompt, user_prompt, image_hash, read=not decode_failures)
+                fresh = result is None
+                if fresh:
+                    result = self._record_usage(await loop_client(current_model).ainvoke(messages, **self._output_kwargs(system_prompt, json_output)))
+                if json_output:
+                    parsed = self._parse_json(result, system_prompt, validate)
 
-                except Exception as e:
+                    if parsed is None:
+                        decode_failures += 1
+                        if max_decode_failures is not None and decode_failures >= max_decode_failures:
+                            break
+                        continue
+                    self._cache_store(key, current_model, result, fresh)
+                    self._note_model(models, current_model)
+                    return parsed
+                self._cache_store(key, current_model, result, fresh)
+                self._note_model(models, current_model)
+                return result
+            except (ResourceExhausted, TooManyRequests) as e:
+                await self._apenalize(current_model, e)
+                if attempt == max_retries - 1:
                     raise e
-            try:
-                text = "Post contextual background: " 
-                include_keys = { "is_video", "caption", "pcaption", "caption_hashtags", "caption_mentions", "likes", "comments", "date_utc", "date_local", "title", "tagged_users", "is_sponsored", "is_pinned", "image_analysis"}
-                post_inf = {k: v for k, v in post.items() if k  in include_keys}
-                post_inf['image_analysis'] = json.loads(post_inf['image_analysis'])
-                text += json.dumps(post_inf, indent=2)
-                text += ".\n\nComments:"
-                text += json.dumps(insta_manager.neo4j_manager.execute_read(insta_manager.neo4j_manager.get_comments_with_replies_by_post_id, post["id"]), indent=2) 
-                post["post_analysis"] = json.dumps(self.analyze_text(user_prompt=text, system_prompt=post_analysis, json_output=True ))
-                insta_manager.neo4j_manager.execute_write(insta_manager.neo4j_manager.manage_post_relationships, post , True)
+                await asyncio.sleep(self.retry_policy.wait_time(attempt, e, requeue))
+        raise RuntimeError("Analysis failed after retries")
 
-            except Exception as e:
-                raise e
-        
-        ## debug 
-        # with open(f'posts_dump{post["id"]}.json', 'w', encoding='utf-8') as f:
-        #     json.dump(post, f, indent=4, ensure_ascii=False)
+    async def aanalyze_image(self, url: str, system_prompt: str, json_output: bool, image_hash: Optional[str] = None, **kwargs) -> dict:
+        image, image_hash = (url, image_hash) if image_hash is not None else await asyncio.to_thread(self._load_image, url)
+        return await self._ainvoke_json(self._image_messages(image, system_prompt), json_output, system_prompt, image_hash=image_hash, **kwargs)
+
+    async def aanalyze_text(self, user_prompt: str, system_prompt: str, json_output: bool = False, **kwargs) -> dict | str:
+        return await self._ainvoke_json(self._text_messages(user_prompt, system_prompt), json_output, system_prompt, user_prompt, **kwargs)
 
-    def process_account(self, insta_manager, username):
-        
+    async def aanalyze_sidecar(self, post: dict, comments, images: List[Tuple[str, str]], **kwargs) -> dict:
+        """
+        Analyzes all `images` of a multi-image post together with its caption and
+        comments in one multimodal request. Returns {"image_analysis": [...],
+        "post_analysis": {...}} with one image entry per input image.
+        """
+        text = self._post_prompt(post, comments, with_image_analysis=False)
+        return await self._ainvoke_json(
+            self._multimodal_messages(text, [image for image, _ in images], sidecar_post_analysis),
+            True, sidecar_post_analysis, text, ",".join(image_hash for _, image_hash in images),
+            validate=lambda parsed: len(parsed["image_analysis"]) == len(images),
+            max_decode_failures=2,
+            **kwargs
+        )
+
+    async def atriage_post(self, post: dict, images: List[Tuple[str, str]], **kwargs) -> Optional[dict]:
+        """
+        Scores the OSINT relevance of `post` (0-10) with post_triage on the triage
+        model, from its metadata and first image only. Returns None if the model
+        gives no usable answer, in which case the post should get full analysis.
+        """
+        text = "Post metadata:\n" + encode_record(post, TRIAGE_FIELDS)
+        self.token_report.add("triage", text)
+        cover = images[:1]
         try:
-            profile = insta_manager.neo4j_manager.execute_read(insta_manager.neo4j_manager.get_person_by_username, username)
-            posts = insta_manager.neo4j_manager.get_posts_by_username(username)
+            return await self._ainvoke_json(
+                self._multimodal_messages(text, [image for image, _ in cover], post_triage),
+                True, post_triage, text, ",".join(image_hash for _, image_hash in cover),
+                max_decode_failures=2, model=self.triage_model, **kwargs
+            )
+        except RuntimeError:
+            return None
+
+
+    def process_post(self, insta_manager, post):
+        """Analyzes a single post; a blocking wrapper around `aprocess_posts`."""
+        asyncio.run(self.aprocess_posts(insta_manager, [post], concurrency=1, batch_size=1))
+
+    async def aprocess_posts(self, insta_manager, posts: Iterable[dict], concurrency: int = 4, batch_size: int = 20,
+                             on_done: Optional[Callable[[dict], None]] = None, should_stop: Optional[Callable[[], bool]] = None):
+        """
+        Analyzes `posts` concurrently: up to `concurrency` LLM calls in flight across
+        posts and the images within them. Results are written back to Neo4j in
+        batches of `batch_size`, including the image analysis of posts whose text
+        step failed, so a retry only redoes what is missing. A post that would have
+        to back off for long is put back on the queue for later, leaving its slot to
+        other posts. The first error stops the remaining posts and is re-raised once
+        pending writes are flushed. With a `triage_threshold`, new posts are first
+        scored on the triage model and low scorers keep that score as their analysis.
+        """
+        neo4j = insta_manager.neo4j_manager
+        L = insta_manager.L  # Bound here: worker threads of to_thread have no Instaloader of their own
+        llm_slots = asyncio.Semaphore(concurrency)
+        instagram_lock = insta_manager.instagram_lock # The to_thread fetches below share L
+        queue = asyncio.Queue()
+        for post in posts:
+            queue.put_nowait(post)
+        pending = {}
+        errors = []
+        deferred = 0 # Posts waiting out a backoff before going back on the queue
+
+        def requeue(post):
+            nonlocal deferred
+            deferred -= 1
+            queue.put_nowait(post)
+
+        async def limited(coro):
+            async with llm_slots:
+                return await coro
+
+        async def flush(force: bool = False):
+            if pending and (force or len(pending) >= batch_size):
+                batch = list(pending.values())
+                pending.clear()
+                await asyncio.to_thread(neo4j.execute_write, neo4j.update_post_analyses, batch)
 
-            profile_include_keys = { "username", "fullname", "bio", "followers", "followees", "is_verified", "is_business_account", "business_category_name", "biography_hashtags", "biography_mentions"}
-            post_include_keys = { "id", "is_video", "caption", "caption_hashtags", "caption_mentions", "likes", "date_utc", "date_local", "title", "tagged_users", "is_sponsored", "is_pinned", "post_analysis"}
+        def fetch_urls(post):
+            with instagram_lock:
+                return fetch_post_urls(L, post)
 
-            text = "Profile metadata: "
-            profile_metadata = {k: v for k, v in profile.items() if k  in profile_include_keys}
-            text += json.dumps(profile_metadata, indent=2)
-            text += "\n\nPosts:\n"
+        async def analyze(post):
+            models = post.setdefault("_models", set()) # Models whose answers end up in this post's analysis
+            if not post.get("image_analysis") or post["image_analysis"].strip() == "":
+                images = await asyncio.to_thread(self._post_images, post, fetch_urls)
+                if self.triage_threshold and self.triage_model and "_triage" not in post: # Not again when requeued
+                    triage = post["_triage"] = await limited(self.atriage_post(post, images, requeue=True))
+                    if triage is not None and triage["osint_relevance"] < self.triage_threshold:
+                        # Kept as its post_analysis, so account analysis still sees what the post is about
+                        post["post_analysis"] = json.dumps({"triage": triage})
+                        post["_triage_kept"] = triage["osint_relevance"] # Found again once the threshold no longer applies
+                        models.add(self._model_name(self.triage_model))
+                        pending[post["id"]] = self._post_analysis_record(post)
+                        self.triage_counts["skipped"] += 1
+                        return
+                    self.triage_counts["full"] += 1
+                if self.single_call_sidecars and len(images) > 1:
+                    comments = await asyncio.to_thread(neo4j.execute_read, neo4j.get_comments_with_replies_by_post_id, post["id"])
+                    try:
+                        result = await limited(self.aanalyze_sidecar(post, comments, images, requeue=True, models=models))
+                    except RuntimeError: # Never returned one entry per image; fall back to a call per image
+                        result = None
+                    if result is not None:
+                        post["image_analysis"] = json.dumps(result["image_analysis"])
+                        post["post_analysis"] = json.dumps(result["post_analysis"])
+                        pending[post["id"]] = self._post_analysis_record(post)
+                        return
+                results = await asyncio.gather(*(
+                    limited(self.aanalyze_image(image, system_prompt=image_analysis, json_output=True, image_hash=image_hash, requeue=True, models=models))
+                    for image, image_hash in images
+                ))
+                post["image_analysis"] = json.dumps(results)
+                pending[post["id"]] = self._post_analysis_record(post)
+
+            comments = await asyncio.to_thread(neo4j.execute_read, neo4j.get_comments_with_replies_by_post_id, post["id"])
+            result = await limited(self.aanalyze_text(user_prompt=self._post_prompt(post, comments), system_prompt=post_analysis, json_output=True, requeue=True, models=models))
+            post["post_analysis"] = json.dumps(result)
+            pending[post["id"]] = self._post_analysis_record(post)
 
-            for i, post in enumerate(posts, 1):
-                text += f"\nPost {i}:\n"
-                post_metadata = {k: v for k, v in post.items() if k  in post_include_keys}
+        async def worker():
+            nonlocal deferred
+            while not errors and (deferred or not queue.empty()):
+                if should_stop and should_stop():
+                    return
+                if queue.empty():
+                    await asyncio.sleep(0.5)
+                    continue
+                post = queue.get_nowait()
+                if post.get("post_analysis") and post["post_analysis"].strip() != "":
+                    continue
                 try:
-                    post_metadata['post_analysis'] = json.loads(post_metadata.get('post_analysis', '{}'))
+                    await analyze(post)
+                except RetryLater as e:
+                    deferred += 1
+                    asyncio.get_running_loop().call_later(e.delay, requeue, post)
+                    continue
                 except Exception as e:
-                    post_metadata['post_analysis'] = {}
-                text += json.dumps(post_metadata, indent=2)
+                    errors.append(e)
+                    return
+                if on_done:
+                    on_done(post)
+                await flush()
 
-            profile["account_analysis"] = json.dumps(self.analyze_text(user_prompt=text, system_prompt=account_analysis, json_output=True))
-            insta_manager.neo4j_manager.execute_write(insta_manager.neo4j_manager.create_user, profile)
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        finally:
+            await flush(force=True)
+        if errors:
+            raise errors[0]
 
-            # debug
-            # with open(f'profile_dump{profile["id"]}.json', 'w', encoding='utf-8') as f:
-            #     json.dump(profile, f, indent=4, ensure_ascii=False)
+    def _account_profile_text(self, profile: dict) -> str:
+        profile_metadata = {k: v for k, v in profile.items() if k in ACCOUNT_PROFILE_FIELDS}
+        text = "Profile metadata:\n" + encode_record(profile_metadata, ACCOUNT_PROFILE_FIELDS)
+        self.token_report.add("account", text, json_baseline=profile_metadata)
+        return text
 
+    def _account_post_text(self, post: dict) -> str:
+        """One row of the account's post table (see ACCOUNT_POST_FIELDS)."""
+        post_metadata = {k: v for k, v in post.items() if k in ACCOUNT_POST_FIELDS}
+        try:
+            post_metadata['post_analysis'] = json.loads(post_metadata.get('post_analysis') or '{}')
         except Exception as e:
-            raise e
-        
\ No newline at end of file
+            post_metadata['post_analysis'] = {}
+        text = "\n" + table_row(post_metadata, ACCOUNT_POST_FIELDS, ACCOUNT_POST_LIMITS)
+        self.token_report.add("account", text, json_baseline=post_metadata)
+        return text
+
+    @staticmethod
+    def _latest_analyzed_at(stamps: Iterable):
+        """The latest of the post_analyzed_at `stamps`, None if none is set."""
+        return max((stamp for stamp in stamps if stamp is not None), default=None)
+
+    @staticmethod
+    def _chunks(parts: Iterable[str], token_budget: int) -> Iterator[List[str]]:
+        """Groups `parts` lazily into lists of at most ~`token_budget` tokens (a part too large on its own is truncated)."""
+        chunk, chunk_tokens = [], 0
+        for part in parts:
+            tokens = approx_tokens(part)
+            if tokens > token_budget:
+                part, tokens = part[:token_budget * 4], token_budget
+            if chunk and chunk_tokens + tokens > token_budget:
+                yield chunk
+                chunk, chunk_tokens = [], 0
+            chunk.append(part)
+            chunk_tokens += tokens
+        if chunk:
+            yield chunk
+
+    async def _amap_chunks(self, header: str, heading: str, chunks: Iterator[List[str]], concurrency: int, models: Optional[Set[str]] = None) -> List[str]:
+        """
+        Runs account_chunk_analysis over `chunks` with up to `concurrency` calls in
+        flight. Chunks are pulled from the iterator only as workers free up, so
+        memory stays bounded by `concurrency` chunks. Returns the notes, in order.
+        """
+        notes = {}
+        numbered = enumerate(chunks)
+
+        async def worker():
+            for i, chunk in numbered:
+                result = await self.aanalyze_text(
+                    user_prompt=f"{header}\n\n{heading}" + "".join(chunk),
+                    system_prompt=account_chunk_analysis, json_output=True, models=models
+                )
+                notes[i] = f"\nBatch {i + 1}: " + json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return [notes[i] for i in sorted(notes)]
+
+    async def aprocess_account(self, insta_manager, username, chunk_tokens: int = 50000, concurrency: int = 4, incremental: bool = True) -> str:
+        """
+        Writes `account_analysis` for `username`, together with the ids of the
+        posts it covers. Returns how it was produced: "full", "incremental" or
+        "unchanged".
+
+        With `incremental`, an existing analysis made with the current prompts
+        and model is updated from the new posts alone in one
+        account_update_analysis call, as long as they fit into
+        `chunk_tokens` and do not outnumber the posts already covered, and none
+        of the covered posts has been analyzed again since (its old analysis
+        cannot be taken back out of the account analysis).
+        Otherwise the account is analyzed from scratch: in a single call if its
+        posts fit into `chunk_tokens`, else map-reduced (post rows are grouped into
+        token-budgeted batches summarized in parallel, notes are merged level by
+        level until they fit, and a final call turns them into the schema).
+        """
+        neo4j = insta_manager.neo4j_manager
+        # Neo4j is only queried in worker threads, and results are read in full before
+        # any LLM call: no driver session stays open across an await.
+        profile = await asyncio.to_thread(neo4j.execute_read, neo4j.get_person_by_username, username)
+        header = self._account_profile_text(profile)
+        posts_heading = "Posts (one per line):\n" + table_header(ACCOUNT_POST_FIELDS)
+        budget = max(chunk_tokens - approx_tokens(header) - approx_tokens(posts_heading), 1000)
+
+        covered = list(profile.get("_account_analysis_post_ids") or [])
+        analyzed_at = profile.get("_account_analysis_posts_analyzed_at")
+        up_to_date = profile.get("account_analysis_version") == ACCOUNT_ANALYSIS_VERSION and self._is_current_stamp(profile.get("account_analysis_model"))
+        models = set()
+
+        def load_new_posts() -> Optional[List[dict]]:
+            """Posts not covered yet, or None when a covered one was re-analyzed since."""
+            if neo4j.has_posts_analyzed_since(username, covered, analyzed_at):
+                return None
+            return list(neo4j.get_posts_by_username_excluding(username, covered))
+
+        new_posts = None
+        if incremental and covered and profile.get("account_analysis") and up_to_date:
+            new_posts = await asyncio.to_thread(load_new_posts)
+        if new_posts is not None:
+            if not new_posts:
+                return "unchanged"
+            rows = [self._account_post_text(post) for post in new_posts]
+            current = f"Current account analysis (covers {len(covered)} posts): " + profile["account_analysis"]
+            if len(new_posts) <= len(covered) and sum(approx_tokens(row) for row in rows) + approx_tokens(current) <= budget:
+                result = await self.aanalyze_text(
+                    user_prompt=f"{header}\n\n{current}\n\nNew {posts_heading}" + "".join(rows),
+                    system_prompt=account_update_analysis, json_output=True, models=models
+                )
+                await asyncio.to_thread(
+                    neo4j.execute_write,
+                    neo4j.set_account_analysis, username, json.dumps(result), covered + [post["id"] for post in new_posts],
+                    ACCOUNT_ANALYSIS_VERSION, self._model_stamp(models | set(profile["account_analysis_model"].split("+"))),
+                    self._latest_analyzed_at([analyzed_at, *(post.get("post_analyzed_at") for post in new_posts)])
+                )
+                return "incremental"
+
+        def load_rows() -> Tuple[List[str], List[int], list]:
+            rows, post_ids, stamps = [], [], []
+            for post in neo4j.get_posts_by_username(username):
+                rows.append(self._account_post_text(post))
+                post_ids.append(post["id"])
+                stamps.append(post.get("post_analyzed_at"))
+            return rows, post_ids, stamps
+
+        rows, post_ids, stamps = await asyncio.to_thread(load_rows)
+        chunks = self._chunks(rows, budget)
+        first = next(chunks, [])
+        second = next(chunks, None)
+
+        if second is None:
+            result = await self.aanalyze_text(user_prompt=f"{header}\n\n{posts_heading}" + "".join(first), system_prompt=account_analysis, json_output=True, models=models)
+        else:
+            notes = await self._amap_chunks(header, posts_heading, itertools.chain([first, second], chunks), concurrency, models)
+            while sum(approx_tokens(note) for note in notes) > budget:
+                merged = await self._amap_chunks(header, "Batch notes:", self._chunks(notes, budget), concurrency, models)
+                if len(merged) >= len(notes):
+                    break # Notes no longer shrink; the final call gets them as they are
+                notes = merged
+            result = await self.aanalyze_text(user_prompt=f"{header}\n\nBatch notes:" + "".join(notes), system_prompt=account_reduce_analysis, json_output=True, models=models)
+
+        await asyncio.to_thread(
+            neo4j.execute_write,
+            neo4j.set_account_analysis, username, json.dumps(result), post_ids,
+            ACCOUNT_ANALYSIS_VERSION, self._model_stamp(models), self._latest_analyzed_at(stamps)
+        )
+        return "full"
+
+    def process_account(self, insta_manager, username, **kwargs) -> str:
+        return asyncio.run(self.aprocess_account(insta_manager, username, **kwargs))
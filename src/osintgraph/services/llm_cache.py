@@ -0,0 +1,87 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from ..constants import LLM_CACHE_FILE
+
+
+def content_hash(data) -> str:
+    """sha256 hex digest of `data` (str or bytes)."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class LLMCache:
+    """
+    Persistent, content-addressed store of LLM responses. Entries are keyed by
+    model name plus hashes of the system prompt, user prompt and image bytes, so
+    identical requests are answered locally no matter which post or run they
+    come from. With `max_entries`, the least recently used entries are evicted.
+    """
+    def __init__(self, path: str = LLM_CACHE_FILE, max_entries: int = 0):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT,
+                created_at REAL,
+                last_used REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model: str, system_prompt: str, user_prompt: str = "", image_hash: str = "") -> str:
+        return content_hash("\0".join((model, content_hash(system_prompt), content_hash(user_prompt), image_hash)))
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        The cached response for `key`, or None (counted as a miss). A hit is only
+        counted once the caller actually uses the response, see `count_hit`.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def count_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def put(self, key: str, model: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+            if self.max_entries:
+                self._conn.execute("""
+                    DELETE FROM llm_cache WHERE key IN (
+                        SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """Hits, misses and hit rate since this cache was opened (i.e. for this run)."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
@@ -1,70 +1,224 @@
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_core.rate_limiters import InMemoryRateLimiter
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Optional
 
+from ..constants import GEMINI_RATE_LIMITS
 from ..credential_manager import get_credential_manager
+from .shared_rate_limiter import SharedRateLimiter, TokenUsageRecorder
 cm = get_credential_manager()
 
 
+# Every model client osintgraph uses, by name. `rate_limited` variants are the same
+# client as their plain model with the model's SharedRateLimiter attached, and a
+# TokenUsageRecorder charging its TPM.
+MODEL_SPECS: Dict[str, Dict[str, Any]] = {
+    "gemini_2_0_flash": {"model": "gemini-2.0-flash", "temperature": 0.0},
+    "gemini_2_0_flash_with_limit": {"model": "gemini-2.0-flash", "temperature": 0.0, "rate_limited": True},
+    "gemini_2_5_flash_lite_llm": {"model": "gemini-2.5-flash-lite-preview-06-17", "temperature": 0.0},
+    "gemini_2_5_flash_lite_llm_with_limit": {"model": "gemini-2.5-flash-lite-preview-06-17", "temperature": 0.0, "rate_limited": True},
+    "gemini_2_5_flash_llm": {"model": "gemini-2.5-flash", "temperature": 0.0},
+    "gemini_2_5_flash_llm_with_limit": {"model": "gemini-2.5-flash", "temperature": 0.0, "rate_limited": True},
+    "text_embedding_004_llm": {"model": "models/text-embedding-004", "embeddings": True},
+}
 
 
-if cm.get("GEMINI_API_KEY"):
-
-    rate_limiter = InMemoryRateLimiter(
-    requests_per_second=0.16, 
-    check_every_n_seconds=0.5, 
-    max_bucket_size=5
-    )
-
-    gemini_2_0_flash = ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash",
-        google_api_key=cm.get("GEMINI_API_KEY"),
-        temperature=0.0,
-    )
-
-    gemini_2_0_flash_with_limit = ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash",
-        google_api_key=cm.get("GEMINI_API_KEY"),
-        temperature=0.0,
-        rate_limiter=rate_limiter
-    )
-
-    gemini_2_5_flash_lite_llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash-lite-preview-06-17",
-        google_api_key=cm.get("GEMINI_API_KEY"),
-        temperature=0.0,
-    )
-
-    gemini_2_5_flash_lite_llm_with_limit = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash-lite-preview-06-17",
-        google_api_key=cm.get("GEMINI_API_KEY"),
-        temperature=0.0,
-        rate_limiter=rate_limiter
-    )
-
-    gemini_2_5_flash_llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        google_api_key=cm.get("GEMINI_API_KEY"),
-        temperature=0.0,
-    )
-    
-    gemini_2_5_flash_llm_with_limit = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        google_api_key=cm.get("GEMINI_API_KEY"),
-        temperature=0.0,
-        rate_limiter=rate_limiter
-    )
-
-
-    text_embedding_004_llm = GoogleGenerativeAIEmbeddings(
-        model="models/text-embedding-004",
-        google_api_key=cm.get("GEMINI_API_KEY")
-    )
-
-else:
-    gemini_2_0_flash = None
-    gemini_2_0_flash_with_limit = None
-    gemini_2_5_flash_lite_llm = None
-    gemini_2_5_flash_lite_llm_with_limit = None
-    gemini_2_5_flash_llm = None
-    gemini_2_5_flash_llm_with_limit = None
-    text_embedding_004_llm = None
\ No newline at end of file
+def shared_rate_limiter(model: str, bucket: Optional[str] = None) -> SharedRateLimiter:
+    """
+    The host-wide rate limiter of `model`, with its RPM/TPM from GEMINI_RATE_LIMITS
+    (overridable per model in the credentials). `bucket` names its buckets when they
+    must not be shared with the real model's.
+    """
+    limits = {**GEMINI_RATE_LIMITS.get(model, {"rpm": 10}), **(cm.get("GEMINI_RATE_LIMITS", {}) or {}).get(model, {})}
+    return SharedRateLimiter(bucket or model, requests_per_minute=limits["rpm"], tokens_per_minute=limits.get("tpm", 0))
+
+
+class ModelProvider:
+    """Builds the clients of MODEL_SPECS entries; `name` also prefixes its rate-limit buckets (except Gemini's own)."""
+    name = ""
+
+    def available(self) -> bool:
+        raise NotImplementedError
+
+    def chat_model(self, spec: Dict[str, Any]):
+        raise NotImplementedError
+
+    def embeddings(self, spec: Dict[str, Any]):
+        raise NotImplementedError
+
+
+class GeminiProvider(ModelProvider):
+    name = "gemini"
+
+    def available(self) -> bool:
+        return bool(cm.get("GEMINI_API_KEY"))
+
+    def chat_model(self, spec: Dict[str, Any]):
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(google_api_key=cm.get("GEMINI_API_KEY"), **spec)
+
+    def embeddings(self, spec: Dict[str, Any]):
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        return GoogleGenerativeAIEmbeddings(google_api_key=cm.get("GEMINI_API_KEY"), **spec)
+
+
+class FakeProvider(ModelProvider):
+    """
+    Offline stand-ins (see fake_models) for benchmarks and regression runs. `options`
+    are FakeChatModel settings (latency, error_rate, malformed_rate, rate_limit_rate,
+    rate_limit_burst, retry_delay, seed), plus `embedding_latency`.
+    """
+    name = "fake"
+
+    def __init__(self, **options):
+        self.embedding_latency = options.pop("embedding_latency", 0.0)
+        self.options = options
+
+    def available(self) -> bool:
+        return True
+
+    def chat_model(self, spec: Dict[str, Any]):
+        from .fake_models import FakeChatModel
+        return FakeChatModel(model=f"fake:{spec['model']}", **self.options) # Never stamped on analyses as the real model
+
+    def embeddings(self, spec: Dict[str, Any]):
+        from .fake_models import HashEmbeddings
+        return HashEmbeddings(latency=self.embedding_latency)
+
+
+PROVIDERS = {"gemini": GeminiProvider, "fake": FakeProvider}
+
+
+def configured_provider() -> ModelProvider:
+    """The provider named by the LLM_PROVIDER credential (Gemini unless set), built with its LLM_PROVIDER_OPTIONS."""
+    name = cm.get("LLM_PROVIDER") or "gemini"
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider: {name}. Choose from {', '.join(PROVIDERS)}.")
+    return PROVIDERS[name](**(cm.get("LLM_PROVIDER_OPTIONS", {}) or {}))
+
+
+class ModelRegistry:
+    """
+    Lazily built, memoized model clients. Nothing is created (and the Gemini
+    client library is not even imported) until a model is first asked for, so
+    commands that never call Gemini don't pay for it. The plain and rate-limited
+    variants of a model share one client (and so one connection), and every
+    variant of a model shares one rate limiter. Specs can be changed, clients
+    replaced outright, or another provider used at runtime with `configure`,
+    `register` and `set_provider`.
+    """
+    def __init__(self, specs: Dict[str, Dict[str, Any]], provider: Optional[ModelProvider] = None):
+        self._provider = provider
+        self._specs = {name: dict(spec) for name, spec in specs.items()}
+        self._clients: Dict[str, Any] = {}
+        self._base_clients: Dict[tuple, Any] = {}
+        self._limiters: Dict[str, SharedRateLimiter] = {}
+        self._lock = threading.RLock()
+
+    def get(self, name: str) -> Optional[Any]:
+        """The client called `name`, built on first use; None when the provider is not set up (no Gemini API key)."""
+        with self._lock:
+            if name in self._clients:
+                return self._clients[name]
+            if name not in self._specs:
+                raise KeyError(f"Unknown model: {name}")
+            if not self.provider.available():
+                return None # Not memoized: the key may still be set up during this run
+            client = self._build(self._specs[name])
+            self._clients[name] = client
+            return client
+
+    @property
+    def provider(self) -> ModelProvider:
+        with self._lock:
+            if self._provider is None:
+                self._provider = configured_provider()
+            return self._provider
+
+    def set_provider(self, provider: ModelProvider):
+        """Builds every model with `provider` from now on (e.g. FakeProvider(latency=0.5) for a benchmark)."""
+        with self._lock:
+            self._provider = provider
+            self.reset()
+
+    def _build(self, spec: Dict[str, Any]):
+        spec = dict(spec)
+        rate_limited = spec.pop("rate_limited", False)
+        if spec.pop("embeddings", False):
+            return self.provider.embeddings(spec)
+
+        key = tuple(sorted(spec.items()))
+        base = self._base_clients.get(key)
+        if base is None:
+            base = self._base_clients[key] = self.provider.chat_model(spec)
+        if not rate_limited:
+            return base
+        # A shallow copy keeps the underlying API client of `base`
+        limiter = self.limiter(spec["model"])
+        return base.model_copy(update={"rate_limiter": limiter, "callbacks": [TokenUsageRecorder(limiter)]})
+
+    def limiter(self, model: str) -> SharedRateLimiter:
+        """The one rate limiter of `model` (e.g. "gemini-2.5-flash") in this process, for the current provider."""
+        bucket = model if self.provider.name == "gemini" else f"{self.provider.name}:{model}"
+        with self._lock:
+            if bucket not in self._limiters:
+                self._limiters[bucket] = shared_rate_limiter(model, bucket)
+            return self._limiters[bucket]
+
+    def configure(self, name: str, **spec):
+        """Changes or adds the spec of `name` (e.g. model="gemini-2.5-pro"); it is rebuilt on next use."""
+        with self._lock:
+            self._specs[name] = {**self._specs.get(name, {}), **spec}
+            self._clients.pop(name, None)
+
+    def register(self, name: str, client: Any):
+        """Uses `client` for `name` from now on, instead of building one."""
+        with self._lock:
+            self._clients[name] = client
+
+    def reset(self):
+        """Drops every built client, e.g. after the API key changed."""
+        with self._lock:
+            self._clients.clear()
+            self._base_clients.clear()
+
+
+registry = ModelRegistry(MODEL_SPECS)
+
+
+# Per event loop: id(client) -> (client, its copy for that loop)
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[int, tuple]]" = weakref.WeakKeyDictionary()
+_loop_clients_lock = threading.Lock()
+
+
+def loop_client(client: Any) -> Any:
+    """
+    `client` for the running event loop. ChatGoogleGenerativeAI keeps the grpc_asyncio
+    client it builds on first `ainvoke`, bound to that loop, and every `asyncio.run`
+    starts a new one; so each loop gets a shallow copy of `client` (same sync client,
+    rate limiter and callbacks) that builds an async client of its own.
+    """
+    if "async_client_running" not in getattr(type(client), "model_fields", {}):
+        return client
+    loop = asyncio.get_running_loop()
+    with _loop_clients_lock:
+        copies = _loop_clients.setdefault(loop, {})
+        if id(client) not in copies:
+            copies[id(client)] = (client, client.model_copy(update={"async_client_running": None}))
+        return copies[id(client)][1]
+
+
+def get_model(name: str) -> Optional[Any]:
+    return registry.get(name)
+
+
+def models_available() -> bool:
+    """Whether models can be built: a Gemini API key is set, or another provider is configured."""
+    return registry.provider.available()
+
+
+def __getattr__(name: str):
+    # Keeps `llm_models.gemini_2_0_flash` style access working, built on first access
+    if name in MODEL_SPECS:
+        return registry.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,78 @@
+import random
+import re
+import threading
+import time
+from typing import Optional
+
+
+class QuotaExhausted(Exception):
+    """The circuit breaker is open: the daily Gemini quota is used up until `retry_at`."""
+    def __init__(self, retry_at: float):
+        self.retry_at = retry_at
+        super().__init__(f"Gemini quota exhausted until {time.strftime('%H:%M', time.localtime(retry_at))}")
+
+
+class RetryLater(Exception):
+    """The next attempt should wait `delay` seconds; raised so the caller can requeue instead of blocking."""
+    def __init__(self, delay: float):
+        self.delay = delay
+        super().__init__(f"Retry in {delay:.0f}s")
+
+
+def server_retry_delay(error: Exception) -> Optional[float]:
+    """The delay the server asked for, from a Retry-After header or Gemini's `retry_delay { seconds: N }`."""
+    response = getattr(error, "response", None)
+    retry_after = getattr(response, "headers", {}).get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    m = re.search(r"retry_delay\s*{\s*seconds:\s*(\d+)", str(error))
+    return float(m.group(1)) if m else None
+
+
+def is_daily_quota(error: Exception) -> bool:
+    return bool(re.search(r"PerDay|per day", str(error)))
+
+
+class RetryPolicy:
+    """
+    Backoff for rate-limited LLM calls, shared by every call of an LLMAnalyzer:
+    full-jitter exponential backoff (`base` * 2^attempt, capped at `cap`) that
+    never waits less than the server's own retry delay, plus a circuit breaker
+    that fails fast once the daily quota is exhausted.
+    """
+    def __init__(self, base: float = 2, cap: float = 120, max_block: float = 30, breaker_cooldown: float = 60 * 60):
+        self.base = base
+        self.cap = cap
+        self.max_block = max_block # Longest wait a caller that can requeue is asked to block for
+        self.breaker_cooldown = breaker_cooldown
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def check(self):
+        """Raises QuotaExhausted while the breaker is open."""
+        with self._lock:
+            if time.time() < self._open_until:
+                raise QuotaExhausted(self._open_until)
+
+    def delay(self, attempt: int, error: Exception) -> float:
+        backoff = random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+        server = server_retry_delay(error)
+        return backoff if server is None else max(server + random.uniform(1, 3), backoff)
+
+    def wait_time(self, attempt: int, error: Exception, requeue: bool = False) -> float:
+        """
+        Seconds to wait before retrying after rate-limit `error`. Opens the breaker
+        (and raises QuotaExhausted) on daily-quota errors; with `requeue`, raises
+        RetryLater rather than asking the caller to block for more than `max_block`.
+        """
+        if is_daily_quota(error):
+            with self._lock:
+                self._open_until = time.time() + max(server_retry_delay(error) or 0, self.breaker_cooldown)
+            self.check()
+        delay = self.delay(attempt, error)
+        if requeue and delay > self.max_block:
+            raise RetryLater(delay)
+        return delay
@@ -0,0 +1,128 @@
+import asyncio
+import sqlite3
+import time
+from contextlib import closing
+from typing import Any, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from ..constants import GEMINI_RATE_LIMIT_FILE
+
+
+class SharedRateLimiter(BaseRateLimiter):
+    """
+    Requests-per-minute and tokens-per-minute budget of one Gemini model, shared
+    by every osintgraph process on this host through token buckets in a SQLite
+    file, so parallel `discover` runs and an `agent` session stay within the
+    quota together. Requests are taken from the RPM bucket before each call
+    (`acquire`, called by the chat model); tokens are charged afterwards with
+    `record_tokens` (by the model's TokenUsageRecorder), and no new request
+    starts while the TPM bucket is in debt. The async methods run the SQLite
+    transactions in a worker thread, off the event loop.
+    """
+    def __init__(self, model: str, requests_per_minute: float, tokens_per_minute: float = 0, burst: int = 5,
+                 path: str = GEMINI_RATE_LIMIT_FILE, check_every_n_seconds: float = 0.5):
+        self.model = model
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute # 0 = no token limit
+        self.burst = max(1, burst)
+        self.path = path
+        self.check_every_n_seconds = check_every_n_seconds
+        with closing(self._connect()) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per operation: safe across threads and processes alike
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def _refill(conn: sqlite3.Connection, name: str, rate_per_second: float, capacity: float, now: float) -> float:
+        row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return capacity
+        tokens, updated = row
+        return min(capacity, tokens + max(0.0, now - updated) * rate_per_second)
+
+    @staticmethod
+    def _store(conn: sqlite3.Connection, name: str, tokens: float, now: float):
+        conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)", (name, tokens, now))
+
+    def _try_consume(self) -> Tuple[bool, float]:
+        """Takes one request if both buckets allow it. Returns (taken, seconds until it could be)."""
+        rpm_rate = self.requests_per_minute / 60
+        tpm_rate = self.tokens_per_minute / 60
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            requests = self._refill(conn, f"{self.model}:rpm", rpm_rate, self.burst, now)
+            tokens = self._refill(conn, f"{self.model}:tpm", tpm_rate, self.tokens_per_minute, now) if tpm_rate else 1.0
+            if requests >= 1 and tokens > 0:
+                self._store(conn, f"{self.model}:rpm", requests - 1, now)
+                if tpm_rate:
+                    self._store(conn, f"{self.model}:tpm", tokens, now)
+                conn.execute("COMMIT")
+                return True, 0.0
+            conn.execute("COMMIT")
+        wait = (1 - requests) / rpm_rate if requests < 1 else 0.0
+        if tokens <= 0:
+            wait = max(wait, -tokens / tpm_rate + 0.1)
+        return False, wait
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        while True:
+            taken, wait = self._try_consume()
+            if taken or not blocking:
+                return taken
+            time.sleep(min(wait, self.check_every_n_seconds) if wait else self.check_every_n_seconds)
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        while True:
+            taken, wait = await asyncio.to_thread(self._try_consume)
+            if taken or not blocking:
+                return taken
+            await asyncio.sleep(min(wait, self.check_every_n_seconds) if wait else self.check_every_n_seconds)
+
+    def record_tokens(self, count: int):
+        """Charges `count` tokens used by a finished call to the TPM bucket."""
+        if not self.tokens_per_minute or not count:
+            return
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            name = f"{self.model}:tpm"
+            tokens = self._refill(conn, name, self.tokens_per_minute / 60, self.tokens_per_minute, now)
+            self._store(conn, name, tokens - count, now)
+            conn.execute("COMMIT")
+
+    def penalize(self, seconds: float):
+        """After a rate-limit error, keeps every process from sending to this model for about `seconds`."""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            name = f"{self.model}:rpm"
+            requests = self._refill(conn, name, self.requests_per_minute / 60, self.burst, now)
+            self._store(conn, name, min(requests, 1 - seconds * self.requests_per_minute / 60), now)
+            conn.execute("COMMIT")
+
+    async def apenalize(self, seconds: float):
+        await asyncio.to_thread(self.penalize, seconds)
+
+
+class TokenUsageRecorder(BaseCallbackHandler):
+    """
+    Charges the tokens of every finished call of a chat model to its
+    SharedRateLimiter, whoever made the call (analysis or agent). langchain runs
+    it in a worker thread for async calls.
+    """
+    def __init__(self, limiter: SharedRateLimiter):
+        self.limiter = limiter
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any):
+        tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                tokens += usage.get("total_tokens", 0)
+        self.limiter.record_tokens(tokens)
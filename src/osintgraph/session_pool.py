@@ -0,0 +1,71 @@
+import logging
+import os
+import pickle
+import threading
+from typing import Callable, Dict, List, Optional
+
+import instaloader
+from instaloader.exceptions import InstaloaderException
+
+from .account_pool import AccountPool
+from .constants import SESSIONS_DIR
+
+
+class SessionPool:
+    """
+    Saved session cookies of every configured account, read from SESSIONS_DIR
+    once per run and checked with Instagram in the background, so switching
+    accounts never has to touch the disk or the network.
+    """
+    def __init__(self, account_pool: AccountPool, loader_factory: Callable[[], instaloader.Instaloader]):
+        self.account_pool = account_pool
+        self.loader_factory = loader_factory
+        self.logger = logging.getLogger(__name__)
+        self._sessions: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def get(self, account: str) -> Optional[dict]:
+        """Session data for `account`, read from its session file on first use. None if unavailable."""
+        with self._lock:
+            if account in self._sessions:
+                return self._sessions[account]
+        try:
+            with open(os.path.join(SESSIONS_DIR, account), "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            data = None
+        with self._lock:
+            return self._sessions.setdefault(account, data)
+
+    def put(self, account: str, data: dict):
+        """Adds or replaces `account`'s session, e.g. after an interactive login."""
+        with self._lock:
+            self._sessions[account] = data
+
+    def discard(self, account: str):
+        with self._lock:
+            self._sessions[account] = None
+
+    def warm(self, accounts: List[str]) -> threading.Thread:
+        """Loads and validates every account's session on a background thread."""
+        thread = threading.Thread(target=self._warm, args=(list(accounts),), name="osintgraph-sessions", daemon=True)
+        thread.start()
+        return thread
+
+    def _warm(self, accounts: List[str]):
+        for account in accounts:
+            data = self.get(account)
+            if data is None:
+                self.account_pool.record_session(account, False)
+                continue
+            L = self.loader_factory()
+            try:
+                L.load_session(account, data)
+                valid = L.test_login() == account
+            except (InstaloaderException, KeyError) as e:
+                self.logger.debug(f"Could not check session of {account}: {e}")
+                continue
+            self.account_pool.record_session(account, valid)
+            if not valid:
+                self.logger.warning(f"Session of {account} has expired. Run `osintgraph reset instagram` to log in again.")
+                self.discard(account)
@@ -67,30 +67,142 @@ def extract_comment_data(comment):
 
     }
 
-def extract_post_data(post):
+## Post fields that instaloader resolves through `Post._field`, which silently
+## downloads the full post metadata (one extra request) when the key is not in `_node`.
+LAZY_POST_FIELDS = (
+    'typename',
+    'video_duration',
+    'video_view_count',
+    'accessibility_caption',
+    'likes',
+    'comments',
+    'viewer_has_liked',
+    'mediacount',
+    'owner_id',
+    'owner_username',
+    'title',
+    'tagged_users',
+    'is_sponsored',
+)
+
+_MISSING = object()
+
+
+def _node_get(node, *paths):
+    """Return the value at the first key path present in `node`, or _MISSING."""
+    for path in paths:
+        d = node
+        try:
+            for key in path:
+                d = d[key]
+            return d
+        except (KeyError, IndexError, TypeError):
+            continue
+    return _MISSING
+
+
+def _read_post_node(post, field):
+    """
+    Reads a single lazy post field from the already-loaded `_node` payload
+    (GraphQL keys first, then the embedded iPhone struct). Never hits the network.
+    """
+    node = getattr(post, '_node', None) or {}
+    owner = getattr(getattr(post, '_owner_profile', None), '_node', None) or {}
+
+    if field == 'typename':
+        return _node_get(node, ('__typename',))
+    if field == 'video_duration':
+        return _node_get(node, ('video_duration',), ('iphone_struct', 'video_duration')) if node.get('is_video') else None
+    if field == 'video_view_count':
+        return _node_get(node, ('video_view_count',), ('iphone_struct', 'view_count')) if node.get('is_video') else None
+    if field == 'accessibility_caption':
+        return _node_get(node, ('accessibility_caption',), ('iphone_struct', 'accessibility_caption'))
+    if field == 'likes':
+        return _node_get(node, ('edge_media_preview_like', 'count'), ('edge_liked_by', 'count'), ('iphone_struct', 'like_count'))
+    if field == 'comments':
+        value = _node_get(node, ('edge_media_to_comment', 'count'), ('edge_media_to_parent_comment', 'count'), ('comments',), ('iphone_struct', 'comment_count'))
+        return _MISSING if value is None else value
+    if field == 'viewer_has_liked':
+        return _node_get(node, ('likes', 'viewer_has_liked'), ('viewer_has_liked',), ('iphone_struct', 'has_liked'))
+    if field == 'mediacount':
+        if node.get('__typename') != 'GraphSidecar':
+            return 1
+        edges = _node_get(node, ('edge_sidecar_to_children', 'edges'))
+        return _MISSING if edges is _MISSING else len(edges)
+    if field == 'owner_id':
+        return _node_get(node, ('owner', 'id'), ('iphone_struct', 'user', 'pk'), ('iphone_struct', 'user', 'id')) \
+            if _node_get(owner, ('id',)) is _MISSING else owner['id']
+    if field == 'owner_username':
+        return _node_get(node, ('owner', 'username'), ('iphone_struct', 'user', 'username')) \
+            if _node_get(owner, ('username',)) is _MISSING else owner['username']
+    if field == 'title':
+        return _node_get(node, ('title',), ('iphone_struct', 'title'))
+    if field == 'tagged_users':
+        edges = _node_get(node, ('edge_media_to_tagged_user', 'edges'))
+        if edges is not _MISSING:
+            return [edge['node']['user']['username'].lower() for edge in edges]
+        tags = _node_get(node, ('iphone_struct', 'usertags', 'in'))
+        if tags is not _MISSING:
+            return [tag['user']['username'].lower() for tag in tags or []]
+        return _MISSING
+    if field == 'is_sponsored':
+        edges = _node_get(node, ('edge_media_to_sponsor_user', 'edges'), ('iphone_struct', 'sponsor_tags'))
+        return _MISSING if edges is _MISSING else bool(edges)
+    return _MISSING
+
+
+def _read_display_urls(post):
+    """Image (or video thumbnail) URLs of every slide, from the loaded payload only."""
+    node = getattr(post, '_node', None) or {}
+    edges = _node_get(node, ('edge_sidecar_to_children', 'edges'))
+    if edges is not _MISSING and edges:
+        urls = [edge['node'].get('display_url') for edge in edges]
+    else:
+        urls = [_node_get(node, ('display_url',), ('display_src',))]
+    return [url for url in urls if url and url is not _MISSING]
+
+
+def extract_post_data(post, fetch_fields=()):
     """
     Extracts all useful attributes from an instaloader.Post object
     into a dictionary for later use or display.
+
+    Lazy fields (see LAZY_POST_FIELDS) are read from the already-loaded `_node`
+    payload only, so extraction never triggers a hidden full-metadata request.
+    Fields missing from the payload are set to None and listed under
+    'unavailable_fields', unless they are named in `fetch_fields`, in which case
+    they are resolved through instaloader (fetching full metadata if needed).
     """
+    lazy = {}
+    unavailable = []
+    for name in LAZY_POST_FIELDS:
+        value = _read_post_node(post, name)
+        if value is _MISSING and name in fetch_fields:
+            value = getattr(post, name, None)
+        if value is _MISSING:
+            unavailable.append(name)
+            value = None
+        lazy[name] = value
+
     return {
         'shortcode': getattr(post, 'shortcode', None),
         'id': int(getattr(post, 'mediaid', None)),
-        'typename': getattr(post, 'typename', None),
+        'typename': lazy['typename'],
         'is_video': getattr(post, 'is_video', None),
         # 'video_url': getattr(post, 'video_url', None),
-        'video_duration': getattr(post, 'video_duration', None),
-        'video_view_count': getattr(post, 'video_view_count', None),
+        'video_duration': lazy['video_duration'],
+        'video_view_count': lazy['video_view_count'],
         # 'url': getattr(post, 'url', None),
         'caption': getattr(post, 'caption', None),
         'pcaption': getattr(post, 'pcaption', None),
         'caption_hashtags': getattr(post, 'caption_hashtags', None),
         'caption_mentions': getattr(post, 'caption_mentions', None),
-        'accessibility_caption': getattr(post, 'accessibility_caption', None),
-        'likes': getattr(post, 'likes', None),
+        'accessibility_caption': lazy['accessibility_caption'],
+        'likes': lazy['likes'],
         'likers_list': getattr(post, 'likers_list', None),
-        'comments': getattr(post, 'comments', None),
+        'comments': lazy['comments'],
         'comments_details': getattr(post, 'comments_details', None),
-        'viewer_has_liked': getattr(post, 'viewer_has_liked', None),
+        'viewer_has_liked': lazy['viewer_has_liked'],
         'date_utc': safe_iso(getattr(post, 'date_utc', None)),
         'date_local': safe_iso(getattr(post, 'date_local', None)),
         # 'location': {
@@ -101,16 +213,18 @@ def extract_post_data(post):
         #     'slug': getattr(post.location, 'slug', None),
         #     'has_public_page': getattr(post.location, 'has_public_page', None)
         # } if post.location else None,
-        'mediacount': getattr(post, 'mediacount', None),
-        'owner_id': getattr(post, 'owner_id', None),
-        'owner_username': getattr(post, 'owner_username', None),
-        'title': getattr(post, 'title', None),
+        'mediacount': lazy['mediacount'],
+        'owner_id': safe_int(lazy['owner_id']),
+        'owner_username': lazy['owner_username'],
+        'title': lazy['title'],
         # 'sponsor_users': [s.username for s in getattr(post, 'sponsor_users', [])],
-        'tagged_users': getattr(post, 'tagged_users', None),
-        'is_sponsored': getattr(post, 'is_sponsored', None),
+        'tagged_users': lazy['tagged_users'],
+        'is_sponsored': lazy['is_sponsored'],
         'is_pinned': getattr(post, 'is_pinned', None),
+        'display_urls': _read_display_urls(post),
         'image_analysis': "",
         'post_analysis':"",
+        'unavailable_fields': unavailable,
     }
 
 def extract_json_block(raw: str):
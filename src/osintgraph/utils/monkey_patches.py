@@ -1,19 +1,60 @@
 import instaloader
-from typing import  Iterator
+from datetime import datetime
+from typing import  Iterable, Iterator
+
+from instaloader.structures import PostComment, PostCommentAnswer
+
+from ..custom_iterator import LikersIterator
+from .data_extractors import _MISSING, _node_get, _read_post_node
 
 ## Monkey Patching
 
 def custom_get_likes(self) -> Iterator[instaloader.Profile]:
     """
     Iterate over all likes of the post. A :class:`Profile` instance of each likee is yielded.
+    Pages through the iPhone likers endpoint lazily, so large posts are covered
+    completely without materializing the whole list.
 
     .. versionchanged:: 4.5.4
         Require being logged in (as required by Instagram).
     """
     if not self._context.is_logged_in:
         raise instaloader.LoginRequiredException("Login required to access likes of a post.")
-    if self.likes == 0:
-        # Avoid doing additional requests if there are no comments
-        return
+    # Avoid doing additional requests if there are no likes. The count is read from the
+    # loaded payload: `self.likes` could fetch the full metadata just to learn it.
+    likes = _read_post_node(self, 'likes')
+    return LikersIterator(self._context, self.mediaid, exhausted=likes is not _MISSING and likes == 0)
+
+
+def custom_get_comments(self) -> Iterable[PostComment]:
+    """
+    Iterate over all comments of the post, like instaloader's get_comments, but
+    without its `_field` lookups: the count and comment edges are read from the
+    loaded payload only, so no full-metadata request is made. When the payload
+    does not hold every comment, they are paged through the iPhone comments
+    endpoint, which instaloader itself falls back to for larger posts.
+    """
+    if not self._context.is_logged_in:
+        raise instaloader.LoginRequiredException("Login required to access comments of a post.")
+
+    def _answer(node):
+        return PostCommentAnswer(id=int(node['id']),
+                                 created_at_utc=datetime.utcfromtimestamp(node['created_at']),
+                                 text=node['text'],
+                                 owner=instaloader.Profile(self._context, node['owner']),
+                                 likes_count=node.get('edge_liked_by', {}).get('count', 0))
 
-    yield from (instaloader.Profile(self._context, user) for user in self._context.get_iphone_json(path='api/v1/media/{}/likers/'.format(self.mediaid), params={})['users'])
\ No newline at end of file
+    count = _read_post_node(self, 'comments')
+    if count == 0:
+        return []
+    edges = _node_get(self._node, ('edge_media_to_parent_comment', 'edges'), ('edge_media_to_comment', 'edges'))
+    if count is not _MISSING and edges is not _MISSING:
+        threads = [edge['node'].get('edge_threaded_comments', {'count': 0, 'edges': []}) for edge in edges]
+        if count == len(edges) + sum(thread['count'] for thread in threads) \
+                and all(thread['count'] == len(thread['edges']) for thread in threads):
+            # Every comment and answer is in the payload already
+            return [
+                PostComment(context=self._context, node=edge['node'], answers=iter([_answer(answer['node']) for answer in thread['edges']]), post=self)
+                for edge, thread in zip(edges, threads)
+            ]
+    return self._get_comments_via_iphone_endpoint()
@@ -0,0 +1,123 @@
+import json
+import threading
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence
+
+## Compact encodings of post, comment and profile context for LLM prompts.
+## Pretty-printed JSON repeats every key for every record and spends a large
+## share of the input on indentation; these encoders write each record once as
+## `key: value` lines, or homogeneous records as a `|`-separated table whose
+## header is written only once.
+
+SEPARATOR = "|"
+ELLIPSIS = "…"
+
+
+def approx_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), enough for budgeting prompts."""
+    return len(text) // 4
+
+
+def truncate(text: str, limit: Optional[int]) -> str:
+    if limit is None or len(text) <= limit:
+        return text
+    return text[:limit - 1] + ELLIPSIS
+
+
+def encode_value(value, limit: Optional[int] = None, cell: bool = True) -> str:
+    """
+    One value on a single line: None as empty, lists of scalars joined with
+    commas, other containers as whitespace-free JSON. Newlines (and, in table
+    cells, separators) are escaped so a value never breaks its line.
+    """
+    if value is None:
+        text = ""
+    elif isinstance(value, bool):
+        text = "true" if value else "false"
+    elif isinstance(value, (list, tuple)) and all(isinstance(v, (str, int, float)) for v in value):
+        text = ",".join(str(v) for v in value)
+    elif isinstance(value, (dict, list, tuple)):
+        text = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    else:
+        text = str(value)
+    text = truncate(text, limit)
+    text = text.replace("\\", "\\\\").replace("\n", "\\n").replace("\r", "")
+    return text.replace(SEPARATOR, "\\" + SEPARATOR) if cell else text
+
+
+def encode_record(record: Mapping, fields: Sequence[str], limits: Optional[Mapping[str, int]] = None) -> str:
+    """`fields` of a single record as `key: value` lines, skipping empty values."""
+    limits = limits or {}
+    lines = []
+    for field in fields:
+        value = record.get(field)
+        if value is None or value == "" or value == []:
+            continue
+        lines.append(f"{field}: {encode_value(value, limits.get(field), cell=False)}")
+    return "\n".join(lines)
+
+
+def table_header(fields: Sequence[str]) -> str:
+    return SEPARATOR.join(fields)
+
+
+def table_row(record: Mapping, fields: Sequence[str], limits: Optional[Mapping[str, int]] = None) -> str:
+    limits = limits or {}
+    return SEPARATOR.join(encode_value(record.get(field), limits.get(field)) for field in fields)
+
+
+def encode_table(records: Iterable[Mapping], fields: Sequence[str], limits: Optional[Mapping[str, int]] = None) -> str:
+    """Homogeneous `records` as a header line followed by one `|`-separated row per record."""
+    return "\n".join([table_header(fields), *(table_row(record, fields, limits) for record in records)])
+
+
+COMMENT_FIELDS = ("n", "reply_to", "timestamp", "likes", "text")
+COMMENT_LIMITS = {"text": 500}
+
+
+def flatten_comments(comments: List[dict]) -> Iterable[dict]:
+    """
+    Comments with nested `replies` (as returned by Neo4jManager.get_comments_with_replies_by_post_id)
+    as flat rows numbered in order; replies refer to their parent's number in `reply_to`.
+    """
+    n = 0
+    for comment in comments:
+        n += 1
+        parent = n
+        yield {"n": n, "timestamp": comment.get("timestamp"), "likes": comment.get("likes_count"), "text": comment.get("text")}
+        for reply in comment.get("replies") or []:
+            n += 1
+            yield {"n": n, "reply_to": parent, "timestamp": reply.get("timestamp"), "likes": reply.get("likes_count"), "text": reply.get("text")}
+
+
+def encode_comments(comments: List[dict]) -> str:
+    if not comments:
+        return "(no comments)"
+    return encode_table(flatten_comments(comments), COMMENT_FIELDS, COMMENT_LIMITS)
+
+
+class TokenReport:
+    """
+    Estimated input tokens per prompt kind, next to what the same context would
+    have cost as pretty-printed (indent=2) JSON, so the saving of the compact
+    encoding can be measured on real runs.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._kinds: Dict[str, Dict[str, int]] = {}
+
+    def add(self, kind: str, text: str, json_baseline=None):
+        """Records prompt `text`; `json_baseline` is the context it encodes, as it would have been sent before."""
+        tokens = approx_tokens(text)
+        baseline = approx_tokens(json.dumps(json_baseline, indent=2, default=str)) if json_baseline is not None else tokens
+        with self._lock:
+            entry = self._kinds.setdefault(kind, {"parts": 0, "tokens": 0, "json_tokens": 0})
+            entry["parts"] += 1
+            entry["tokens"] += tokens
+            entry["json_tokens"] += baseline
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                kind: {**entry, "saved": round(1 - entry["tokens"] / entry["json_tokens"], 3) if entry["json_tokens"] else 0.0}
+                for kind, entry in self._kinds.items()
+            }
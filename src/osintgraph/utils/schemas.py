@@ -1,4 +1,10 @@
-from pydantic import BaseModel, Field
+import json
+from typing import List, Type
+
+from langchain_core.utils.json_schema import dereference_refs
+from pydantic import BaseModel, ConfigDict, Field, create_model
+
+from .prompts import ACCOUNT_ANALYSIS_SCHEMA, ACCOUNT_CHUNK_SCHEMA, IMAGE_ANALYSIS_SCHEMA, POST_ANALYSIS_SCHEMA, POST_TRIAGE_SCHEMA
 
 
 class SemanticCypherInput(BaseModel):
@@ -8,3 +14,67 @@ class SemanticCypherInput(BaseModel):
 class GetTemplateDetailsInput(BaseModel):
     template_name: str = Field(..., description="Name of the template to retrieve details for.")
 
+
+
+## Output shapes of the analysis prompts. Each is built from the JSON template its prompt
+## shows the model (see prompts.py), so the two cannot drift apart.
+
+class AnalysisOutput(BaseModel):
+    # Gemini sometimes answers a free-text field with a bare number; unknown keys are kept as-is
+    model_config = ConfigDict(extra="allow", coerce_numbers_to_str=True)
+
+
+def model_from_template(name: str, template) -> Type[BaseModel]:
+    """
+    A pydantic model mirroring a JSON template: "" becomes str, false bool, 0 float
+    (scores like 6.5 must validate too), [] a list of str, [{...}] a list of nested
+    models and {...} a nested model. Every field defaults to its template value.
+    """
+    if isinstance(template, str):
+        template = json.loads(template)
+    fields = {}
+    for key, value in template.items():
+        if isinstance(value, dict):
+            sub = model_from_template(name + key.title().replace("_", ""), value)
+            fields[key] = (sub, Field(default_factory=sub))
+        elif isinstance(value, list):
+            item = model_from_template(name + key.title().replace("_", ""), value[0]) if value and isinstance(value[0], dict) else str
+            fields[key] = (List[item], Field(default_factory=list))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            fields[key] = (float, float(value))
+        else:
+            fields[key] = (type(value), value)
+    return create_model(name, __base__=AnalysisOutput, **fields)
+
+
+ImageAnalysis = model_from_template("ImageAnalysis", IMAGE_ANALYSIS_SCHEMA)
+PostAnalysis = model_from_template("PostAnalysis", POST_ANALYSIS_SCHEMA)
+PostTriage = model_from_template("PostTriage", POST_TRIAGE_SCHEMA)
+AccountAnalysis = model_from_template("AccountAnalysis", ACCOUNT_ANALYSIS_SCHEMA)
+AccountChunkNotes = model_from_template("AccountChunkNotes", ACCOUNT_CHUNK_SCHEMA)
+
+class SidecarAnalysis(AnalysisOutput):
+    image_analysis: List[ImageAnalysis]
+    post_analysis: PostAnalysis
+
+
+# JSON Schema keywords the Gemini response_schema accepts
+_GEMINI_SCHEMA_KEYS = {"type", "properties", "items", "required", "enum", "description", "nullable", "format"}
+
+def gemini_response_schema(model: Type[BaseModel]) -> dict:
+    """
+    JSON schema of `model` for Gemini's schema-constrained output: references
+    inlined, unsupported keywords dropped and every property required, so the
+    response always has the template's full shape.
+    """
+    def clean(node):
+        if isinstance(node, list):
+            return [clean(item) for item in node]
+        if not isinstance(node, dict):
+            return node
+        cleaned = {key: clean(value) for key, value in node.items() if key in _GEMINI_SCHEMA_KEYS}
+        if "properties" in node:
+            cleaned["properties"] = {key: clean(value) for key, value in node["properties"].items()}
+            cleaned["required"] = list(node["properties"])
+        return cleaned
+    return clean(dereference_refs(model.model_json_schema()))
@@ -0,0 +1,91 @@
+import asyncio
+import itertools
+import threading
+
+from osintgraph.services.fake_models import FakeChatModel
+from osintgraph.services.llm_analyzer import LLMAnalyzer
+
+
+def parts(*sizes):
+    """Parts of about `size` tokens each (approx_tokens counts 4 characters per token)."""
+    return [str(i) * (size * 4) for i, size in enumerate(sizes)]
+
+
+def test_chunks_stay_within_the_token_budget():
+    chunks = list(LLMAnalyzer._chunks(parts(40, 40, 30, 90, 10), token_budget=100))
+    assert [len(chunk) for chunk in chunks] == [2, 1, 2]
+    assert [len("".join(chunk)) // 4 for chunk in chunks] == [80, 30, 100]
+
+
+def test_oversized_part_is_truncated_into_its_own_chunk():
+    chunks = list(LLMAnalyzer._chunks(parts(10, 250, 10), token_budget=100))
+    assert [len(chunk) for chunk in chunks] == [1, 1, 1]
+    assert len(chunks[1][0]) == 100 * 4
+
+
+def test_no_parts_no_chunks():
+    assert list(LLMAnalyzer._chunks([], token_budget=100)) == []
+
+
+def test_chunks_are_built_lazily():
+    consumed = []
+    def source():
+        for i, part in enumerate(parts(*[30] * 100)):
+            consumed.append(i)
+            yield part
+    chunks = LLMAnalyzer._chunks(source(), token_budget=100)
+    next(chunks)
+    assert len(consumed) == 4 # Three parts and the one that did not fit any more
+    assert len(list(itertools.islice(chunks, 2))) == 2
+
+
+class FakeNeo4j:
+    """The Neo4jManager calls of aprocess_account, asserting none runs on the event loop thread."""
+    def __init__(self, posts):
+        self.posts = posts
+        self.loop_thread = None
+        self.analysis = None
+
+    def _off_loop(self):
+        assert threading.get_ident() != self.loop_thread
+
+    def execute_read(self, query, *args):
+        self._off_loop()
+        return query(*args)
+
+    def execute_write(self, query, *args):
+        self._off_loop()
+        return query(*args)
+
+    def get_person_by_username(self, username):
+        return {"username": username, "full_name": "Test", "followers": 10}
+
+    def get_posts_by_username(self, username):
+        self._off_loop()
+        yield from self.posts
+
+    def set_account_analysis(self, username, analysis, post_ids, version, model, posts_analyzed_at=None):
+        self.analysis = (analysis, post_ids, model)
+
+
+def test_large_account_is_map_reduced_with_neo4j_off_the_event_loop():
+    posts = [{"id": i, "caption": f"post {i} " + "x" * 2000, "post_analysis": "{}"} for i in range(20)]
+    neo4j = FakeNeo4j(posts)
+    model = FakeChatModel(model="fake:test")
+    analyzer = LLMAnalyzer(default_model=model, fallback_model=model, triage_model=model)
+    mapped = []
+    map_chunks = analyzer._amap_chunks
+    async def amap_chunks(header, heading, chunks, *args):
+        chunks = list(chunks)
+        mapped.append(len(chunks))
+        return await map_chunks(header, heading, iter(chunks), *args)
+    analyzer._amap_chunks = amap_chunks
+
+    async def run():
+        neo4j.loop_thread = threading.get_ident()
+        return await analyzer.aprocess_account(type("Manager", (), {"neo4j_manager": neo4j})(), "target", chunk_tokens=1000)
+
+    assert asyncio.run(run()) == "full"
+    assert mapped[0] == 3 # ~130 tokens per post row, 1000 per chunk
+    assert neo4j.analysis[1] == list(range(20))
+    assert neo4j.analysis[2] == "fake:test"
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from osintgraph import account_pool as account_pool_module
+from osintgraph.account_pool import AccountPool
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(account_pool_module.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def pool(tmp_path, clock):
+    return AccountPool(str(tmp_path / "account_pool.json"))
+
+
+def test_cooldown_doubles_with_consecutive_429s_up_to_the_cap(pool):
+    assert pool.record_429("a") == AccountPool.BASE_COOLDOWN
+    assert pool.record_429("a") == 2 * AccountPool.BASE_COOLDOWN
+    for _ in range(10):
+        cooldown = pool.record_429("a")
+    assert cooldown == AccountPool.MAX_COOLDOWN
+
+
+def test_a_clean_request_resets_the_backoff(pool):
+    pool.record_429("a")
+    pool.record_429("a")
+    pool.record_request("a")
+    assert pool.record_429("a") == AccountPool.BASE_COOLDOWN
+
+
+def test_cooldown_runs_out(pool, clock):
+    pool.record_429("a")
+    assert pool.cooldown_remaining("a") == AccountPool.BASE_COOLDOWN
+    clock[0] += AccountPool.BASE_COOLDOWN - 60
+    assert pool.cooldown_remaining("a") == 60
+    clock[0] += 60
+    assert pool.cooldown_remaining("a") == 0
+
+
+def test_pick_prefers_ready_healthy_accounts(pool, clock):
+    for _ in range(9):
+        pool.record_request("a")
+        pool.record_request("b")
+    pool.record_429("a")
+    clock[0] += AccountPool.BASE_COOLDOWN # "a" is ready again, with a worse record
+    pool.record_429("c")
+    assert pool.pick(["a", "b", "c"]) == ("b", 0)
+    assert pool.pick(["a", "b", "c"], exclude="b") == ("a", 0)
+
+
+def test_pick_waits_for_the_account_that_frees_up_first(pool, clock):
+    pool.record_429("a")
+    pool.record_429("a") # 20 min
+    pool.record_429("b") # 10 min
+    assert pool.pick(["a", "b"]) == ("b", AccountPool.BASE_COOLDOWN)
+
+
+def test_pick_uses_broken_sessions_only_as_a_last_resort(pool):
+    pool.record_session("a", False)
+    assert pool.pick(["a", "b"])[0] == "b"
+    assert pool.pick(["a", "b"], exclude="b")[0] == "a"
+    assert pool.pick(["a"], exclude="a") == (None, 0)
+
+
+def test_request_counts_are_saved_periodically_not_per_request(pool, clock, tmp_path):
+    path = tmp_path / "account_pool.json"
+    pool.record_request("a") # First save
+    pool.record_request("a")
+    assert json.loads(path.read_text())["a"]["requests"] == 1
+    clock[0] += AccountPool.SAVE_INTERVAL + 1
+    pool.record_request("a")
+    assert json.loads(path.read_text())["a"]["requests"] == 3
+
+
+def test_cooldowns_are_saved_at_once_and_survive_a_restart(pool, clock, tmp_path):
+    pool.record_429("a")
+    restarted = AccountPool(str(tmp_path / "account_pool.json"))
+    assert restarted.cooldown_remaining("a") == AccountPool.BASE_COOLDOWN
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+
+from osintgraph.insta_manager import analysis_priority
+
+NOW = datetime(2026, 10, 1, tzinfo=timezone.utc).timestamp()
+
+
+def post(likes=0, comments=0, date_utc="2026-09-30T12:00:00Z"):
+    return {"likes": likes, "comments": comments, "date_utc": date_utc}
+
+
+def test_each_factor_raises_the_priority():
+    base = analysis_priority(post(likes=10), 100, NOW)
+    assert analysis_priority(post(likes=1000), 100, NOW) > base
+    assert analysis_priority(post(likes=10), 100000, NOW) > base
+    assert analysis_priority(post(likes=10, date_utc="2024-09-30T12:00:00Z"), 100, NOW) < base
+
+
+def test_no_single_factor_dominates():
+    # A fresh post of a small account still beats a year-old one of a big account with some engagement
+    fresh = analysis_priority(post(likes=50), 500, NOW)
+    old = analysis_priority(post(likes=50, date_utc="2025-09-30T12:00:00Z"), 5000, NOW)
+    assert fresh > old
+
+
+def test_ordering_of_pending_posts():
+    pending = {
+        "viral": (post(likes=50000, comments=2000), 1000),
+        "celebrity": (post(likes=200), 5_000_000),
+        "quiet": (post(likes=2, date_utc="2023-01-01T00:00:00Z"), 150),
+        "recent": (post(likes=20), 300),
+    }
+    order = sorted(pending, key=lambda name: analysis_priority(*pending[name], NOW), reverse=True)
+    assert order[-1] == "quiet"
+    assert set(order[:2]) == {"viral", "celebrity"}
+
+
+def test_date_formats_and_missing_values():
+    assert analysis_priority(post(date_utc="2026-09-30T12:00:00+00:00"), 0, NOW) == analysis_priority(post(), 0, NOW)
+    assert analysis_priority(post(date_utc="2026-09-30T12:00:00.000000000Z"), 0, NOW) == analysis_priority(post(), 0, NOW)
+    undated = analysis_priority({"likes": None}, None, NOW)
+    assert undated == analysis_priority(post(date_utc="not a date"), 0, NOW)
+    assert undated < analysis_priority(post(), 0, NOW)
@@ -0,0 +1,48 @@
+from osintgraph.budget import Budget
+
+
+def test_charges_propagate_to_ancestors():
+    run = Budget(100)
+    target = run.child(50)
+    target.charge(10)
+    assert run.remaining_requests == 90
+    assert target.remaining_requests == 40
+
+
+def test_child_is_exhausted_with_its_parent():
+    run = Budget(10)
+    target = run.child(50)
+    run.charge(10)
+    assert target.exhausted()
+
+
+def test_unlimited():
+    budget = Budget()
+    budget.charge(1000)
+    assert budget.remaining_requests is None
+    assert not budget.exhausted()
+
+
+def test_stage_shares_are_reserved_up_front():
+    target = Budget(100)
+    reservations = target.reservations({"followers": 1, "followees": 2, "posts": 3})
+    followers = target.allocate(*reservations["followers"])
+    assert followers.remaining_requests == 17
+    followers.charge(17)
+    followees = target.allocate(*reservations["followees"])
+    assert followees.remaining_requests == 33
+    followees.charge(33)
+    assert target.allocate(*reservations["posts"]).remaining_requests == 50
+
+
+def test_unspent_share_rolls_over_to_later_stages():
+    target = Budget(100)
+    reservations = target.reservations({"followers": 1, "posts": 1})
+    target.allocate(*reservations["followers"]).charge(10)
+    assert target.allocate(*reservations["posts"]).remaining_requests == 90
+
+
+def test_time_is_reserved_too():
+    target = Budget(max_seconds=600)
+    reservations = target.reservations({"followers": 1, "posts": 2})
+    assert 190 < target.allocate(*reservations["followers"]).remaining_seconds <= 200
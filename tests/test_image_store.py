@@ -0,0 +1,73 @@
+import random
+
+import pytest
+from PIL import Image
+
+from osintgraph.services.image_store import BKTree, dhash, hamming
+
+
+def brute_force(hashes, h, max_distance):
+    matches = [(hamming(h, other), value) for other, value in hashes.items() if hamming(h, other) <= max_distance]
+    return min(matches)[0] if matches else None
+
+
+def test_hamming():
+    assert hamming(0b1011, 0b1011) == 0
+    assert hamming(0b1011, 0b0010) == 2
+    assert hamming(0, (1 << 64) - 1) == 64
+
+
+def test_empty_tree_finds_nothing():
+    assert BKTree().find(123, 64) is None
+
+
+def test_find_exact_and_within_distance():
+    tree = BKTree()
+    tree.add(0b0000, "zero")
+    tree.add(0b1111, "fifteen")
+    tree.add(0b0111, "seven")
+    assert tree.find(0b0111, 0) == "seven"
+    assert tree.find(0b0001, 1) == "zero"
+    assert tree.find(0b1110, 1) == "fifteen"
+    assert tree.find(0b0011, 1) == "seven" # Distance 1 to seven, 2 to zero
+    assert tree.find(0b0011, 0) is None
+
+
+def test_first_value_of_a_hash_is_kept():
+    tree = BKTree()
+    tree.add(42, "first")
+    tree.add(42, "second")
+    assert tree.find(42, 0) == "first"
+
+
+@pytest.mark.parametrize("max_distance", [0, 1, 2, 6])
+def test_matches_a_brute_force_search(max_distance):
+    rng = random.Random(max_distance)
+    hashes = {}
+    tree = BKTree()
+    for i in range(300):
+        h = rng.getrandbits(64)
+        # Some near-duplicates of earlier hashes, so that close matches exist
+        if hashes and i % 3 == 0:
+            h = rng.choice(list(hashes)) ^ (1 << rng.randrange(64))
+        if h not in hashes:
+            hashes[h] = str(i)
+            tree.add(h, str(i))
+    for _ in range(200):
+        query = rng.choice(list(hashes)) ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64))
+        found = tree.find(query, max_distance)
+        expected = brute_force(hashes, query, max_distance)
+        if expected is None:
+            assert found is None
+        else:
+            found_distance = next(hamming(query, h) for h, value in hashes.items() if value == found)
+            assert found_distance == expected
+
+
+def test_dhash_survives_resizing_and_reencoding(tmp_path):
+    image = Image.effect_mandelbrot((256, 256), (-2, -1.5, 1, 1.5), 100).convert("RGB")
+    resized = image.resize((128, 128))
+    path = tmp_path / "image.jpg"
+    resized.save(path, quality=60)
+    assert hamming(dhash(image), dhash(Image.open(path))) <= 2
+    assert hamming(dhash(image), dhash(image.transpose(Image.FLIP_LEFT_RIGHT))) > 2
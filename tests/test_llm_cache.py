@@ -0,0 +1,55 @@
+from osintgraph.services import llm_cache as llm_cache_module
+from osintgraph.services.llm_cache import LLMCache
+
+
+def make_cache(tmp_path, monkeypatch, **kwargs):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache_module.time, "time", lambda: now[0])
+    cache = LLMCache(str(tmp_path / "llm_cache.sqlite3"), **kwargs)
+    return cache, now
+
+
+def test_key_depends_on_model_prompts_and_image():
+    key = LLMCache.key("m", "system", "user", "img")
+    assert key == LLMCache.key("m", "system", "user", "img")
+    assert len({key, LLMCache.key("n", "system", "user", "img"), LLMCache.key("m", "other", "user", "img"),
+                LLMCache.key("m", "system", "other", "img"), LLMCache.key("m", "system", "user", "")}) == 5
+
+
+def test_round_trip_and_persistence(tmp_path, monkeypatch):
+    cache, _ = make_cache(tmp_path, monkeypatch)
+    cache.put("k", "m", "response")
+    assert cache.get("k") == "response"
+    assert LLMCache(str(tmp_path / "llm_cache.sqlite3")).get("k") == "response"
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    cache, now = make_cache(tmp_path, monkeypatch, max_entries=2)
+    cache.put("a", "m", "A")
+    now[0] += 1
+    cache.put("b", "m", "B")
+    now[0] += 1
+    assert cache.get("a") == "A" # Now more recently used than "b"
+    now[0] += 1
+    cache.put("c", "m", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+
+
+def test_unbounded_by_default(tmp_path, monkeypatch):
+    cache, now = make_cache(tmp_path, monkeypatch)
+    for i in range(50):
+        now[0] += 1
+        cache.put(str(i), "m", str(i))
+    assert cache.get("0") == "0"
+
+
+def test_hits_are_only_counted_when_reported(tmp_path, monkeypatch):
+    cache, _ = make_cache(tmp_path, monkeypatch)
+    assert cache.get("k") is None
+    cache.put("k", "m", "response")
+    cache.get("k") # Looked up, but e.g. discarded as unparsable
+    assert cache.stats() == {"hits": 0, "misses": 1, "hit_rate": 0.0}
+    cache.count_hit()
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_google_genai")
+from google.ai.generativelanguage_v1beta.types import Candidate, Content, GenerateContentResponse, Part
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_google_genai import chat_models
+
+from osintgraph.services.llm_models import loop_client
+
+
+class LoopBoundClient:
+    """Stands in for a grpc_asyncio client: only usable on the loop it was built in."""
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+
+    async def generate_content(self, request=None, metadata=None, **kwargs):
+        if asyncio.get_running_loop() is not self.loop:
+            raise RuntimeError("attached to a different loop")
+        return GenerateContentResponse(candidates=[Candidate(content=Content(parts=[Part(text="ok")]), finish_reason=1)])
+
+
+@pytest.fixture
+def shared_client(monkeypatch):
+    monkeypatch.setattr(chat_models.genaix, "build_generative_async_service", lambda **kwargs: LoopBoundClient())
+    return ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key="test-key", max_retries=1)
+
+
+def test_shared_client_survives_consecutive_event_loops(shared_client):
+    async def ask():
+        return (await loop_client(shared_client).ainvoke("hi")).content
+
+    assert asyncio.run(ask()) == "ok"
+    assert asyncio.run(ask()) == "ok"
+    assert shared_client.async_client_running is None # Only the per-loop copies hold one
+
+
+def test_loop_client_is_memoized_per_loop(shared_client):
+    async def copies():
+        return loop_client(shared_client), loop_client(shared_client)
+
+    first, again = asyncio.run(copies())
+    second, _ = asyncio.run(copies())
+    assert first is again
+    assert second is not first
+    assert second.rate_limiter is shared_client.rate_limiter
+
+
+def test_loop_client_passes_through_other_clients():
+    client = object()
+
+    async def get():
+        return loop_client(client)
+    assert asyncio.run(get()) is client
@@ -0,0 +1,133 @@
+import asyncio
+import io
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from osintgraph.services import llm_analyzer as llm_analyzer_module
+from osintgraph.services.llm_analyzer import POST_ANALYSIS_VERSION, LLMAnalyzer
+from osintgraph.services.llm_cache import LLMCache
+from osintgraph.services.llm_models import FakeProvider
+from osintgraph.utils.schemas import ImageAnalysis, PostAnalysis
+
+
+class FakeNeo4j:
+    """The Neo4jManager calls of aprocess_posts, recording every analysis written."""
+    def __init__(self):
+        self.records = {}
+        self.batches = 0
+
+    def execute_read(self, query, *args):
+        return query(*args)
+
+    def execute_write(self, query, *args):
+        return query(*args)
+
+    def get_comments_with_replies_by_post_id(self, post_id):
+        return [{"text": f"nice {post_id}", "likes_count": 1, "timestamp": "2026-01-01", "replies": []}]
+
+    def update_post_analyses(self, batch):
+        self.batches += 1
+        for record in batch:
+            self.records[record["id"]] = {**self.records.get(record["id"], {}), **{k: v for k, v in record.items() if v is not None}}
+
+
+@pytest.fixture(autouse=True)
+def offline_images(monkeypatch):
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), "red").save(buffer, "JPEG")
+    response = SimpleNamespace(content=buffer.getvalue(), headers={"Content-Type": "image/jpeg"}, raise_for_status=lambda: None)
+    monkeypatch.setattr(llm_analyzer_module.requests, "get", lambda url, timeout=None: response)
+
+
+def posts(count=6):
+    return [
+        {
+            "id": i, "shortcode": f"s{i}", "caption": f"Post {i} #tag", "likes": i * 10, "comments": 1,
+            "display_urls": [f"https://cdn.invalid/{i}_{n}.jpg" for n in range(1 + i % 3)], # Singles and carousels
+        }
+        for i in range(count)
+    ]
+
+
+def manager(neo4j):
+    return SimpleNamespace(neo4j_manager=neo4j, L=None, instagram_lock=threading.RLock())
+
+
+def analyzer(tmp_path=None, **options):
+    provider = FakeProvider(seed=7, **options.pop("provider_options", {}))
+    return LLMAnalyzer(
+        default_model=provider.chat_model({"model": "gemini-2.0-flash"}),
+        fallback_model=provider.chat_model({"model": "gemini-2.5-flash"}),
+        triage_model=provider.chat_model({"model": "gemini-2.5-flash-lite"}),
+        cache=LLMCache(str(tmp_path / "llm_cache.sqlite3")) if tmp_path else None,
+        **options,
+    )
+
+
+def run(analyzer, neo4j, batch, **kwargs):
+    done = []
+    asyncio.run(analyzer.aprocess_posts(manager(neo4j), batch, on_done=done.append, **kwargs))
+    return done
+
+
+def test_every_post_is_analyzed_and_stamped():
+    neo4j = FakeNeo4j()
+    batch = posts()
+    done = run(analyzer(), neo4j, batch, concurrency=3, batch_size=4)
+
+    assert len(done) == len(batch)
+    assert neo4j.batches >= 2 # Written back in batches of 4
+    for post in batch:
+        record = neo4j.records[post["id"]]
+        PostAnalysis.model_validate_json(record["post_analysis"])
+        images = json.loads(record["image_analysis"])
+        assert len(images) == len(post["display_urls"])
+        for image in images:
+            ImageAnalysis.model_validate(image)
+        assert record["analysis_version"] == POST_ANALYSIS_VERSION
+        assert record["analysis_model"] == "fake:gemini-2.0-flash"
+        assert record["analysis_kind"] == "full"
+
+
+def test_already_analyzed_posts_are_skipped():
+    neo4j = FakeNeo4j()
+    batch = posts(3)
+    batch[0]["post_analysis"] = '{"done": true}'
+    run(analyzer(), neo4j, batch)
+    assert set(neo4j.records) == {1, 2}
+
+
+def test_second_run_is_answered_from_the_cache(tmp_path):
+    first = analyzer(tmp_path)
+    run(first, FakeNeo4j(), posts())
+    misses = first.cache.stats()["misses"]
+
+    second = analyzer(tmp_path)
+    neo4j = FakeNeo4j()
+    run(second, neo4j, posts())
+    assert second.cache.stats() == {"hits": misses, "misses": 0, "hit_rate": 1.0}
+    assert len(neo4j.records) == 6
+
+
+def test_malformed_answers_are_retried():
+    neo4j = FakeNeo4j()
+    run(analyzer(provider_options={"malformed_rate": 0.3}), neo4j, posts())
+    for record in neo4j.records.values():
+        PostAnalysis.model_validate_json(record["post_analysis"])
+
+
+def test_triage_keeps_low_scorers_at_their_score():
+    neo4j = FakeNeo4j()
+    triaging = analyzer(triage_threshold=11) # Above any score: every post is kept at triage
+    run(triaging, neo4j, posts())
+    assert triaging.triage_counts == {"full": 0, "skipped": 6}
+    for record in neo4j.records.values():
+        triage = json.loads(record["post_analysis"])["triage"]
+        assert record["analysis_kind"] == "triage"
+        assert record["triage_relevance"] == triage["osint_relevance"]
+        assert record["analysis_model"] == "fake:gemini-2.5-flash-lite"
+        assert "image_analysis" not in record
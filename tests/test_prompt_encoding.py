@@ -0,0 +1,58 @@
+from osintgraph.utils.prompt_encoding import (
+    encode_comments, encode_record, encode_table, encode_value, table_header, table_row, truncate,
+)
+
+
+def test_encode_value_formats():
+    assert encode_value(None) == ""
+    assert encode_value(True) == "true"
+    assert encode_value(["a", 1, 2.5]) == "a,1,2.5"
+    assert encode_value({"k": [1, {"x": None}]}) == '{"k":[1,{"x":null}]}'
+    assert encode_value("café") == "café"
+
+
+def test_encode_value_keeps_values_on_one_line():
+    assert encode_value("line one\r\nline two") == "line one\\nline two"
+    assert encode_value("back\\slash") == "back\\\\slash"
+
+
+def test_separators_are_escaped_in_cells_only():
+    assert encode_value("a|b") == "a\\|b"
+    assert encode_value("a|b", cell=False) == "a|b"
+
+
+def test_truncate():
+    assert truncate("abcdef", None) == "abcdef"
+    assert truncate("abcdef", 6) == "abcdef"
+    assert truncate("abcdef", 4) == "abc…"
+
+
+def test_encode_record_skips_empty_fields_and_keeps_field_order():
+    record = {"caption": "Hello\nworld", "likes": 0, "tagged_users": [], "title": "", "location": None, "hashtags": ["a", "b"]}
+    assert encode_record(record, ["likes", "caption", "title", "tagged_users", "location", "hashtags"]) == (
+        "likes: 0\ncaption: Hello\\nworld\nhashtags: a,b"
+    )
+
+
+def test_encode_record_limits():
+    assert encode_record({"caption": "x" * 10}, ["caption"], {"caption": 5}) == "caption: xxxx…"
+
+
+def test_table_row_has_one_cell_per_field():
+    fields = ["id", "caption", "likes"]
+    assert table_header(fields) == "id|caption|likes"
+    assert table_row({"id": 1, "caption": "a|b\nc"}, fields) == "1|a\\|b\\nc|"
+    assert table_row({"id": 1, "caption": "abcdef"}, fields, {"caption": 3}) == "1|ab…|"
+
+
+def test_encode_table():
+    assert encode_table([{"a": 1, "b": 2}, {"a": 3}], ["a", "b"]) == "a|b\n1|2\n3|"
+
+
+def test_encode_comments_numbers_replies_after_their_parent():
+    comments = [
+        {"text": "first", "likes_count": 2, "timestamp": "t1", "replies": [{"text": "re", "likes_count": 0, "timestamp": "t2"}]},
+        {"text": "second", "likes_count": None, "timestamp": "t3"},
+    ]
+    assert encode_comments(comments) == "n|reply_to|timestamp|likes|text\n1||t1|2|first\n2|1|t2|0|re\n3||t3||second"
+    assert encode_comments([]) == "(no comments)"
@@ -0,0 +1,66 @@
+import pytest
+
+from osintgraph.rate_limiter import AccountRateLimiter, TokenBucket
+
+
+def bucket(**kwargs):
+    options = {"rate": 100.0, "capacity": 5, "min_rate": 10.0, "max_rate": 200.0, "increase": 1.0, "decrease": 0.5}
+    return TokenBucket(**{**options, **kwargs})
+
+
+def test_clean_requests_raise_the_rate_additively():
+    b = bucket()
+    for _ in range(3):
+        assert b.acquire() == 0
+    assert b.rate == pytest.approx(103.0)
+    assert b.requests == 3
+
+
+def test_rate_never_exceeds_max_rate():
+    b = bucket(rate=199.5, max_rate=200.0)
+    b.acquire()
+    b.acquire()
+    assert b.rate == 200.0
+
+
+def test_throttle_cuts_the_rate_multiplicatively_and_drains_the_bucket():
+    b = bucket()
+    b.throttle()
+    assert b.rate == pytest.approx(50.0)
+    assert b.tokens == 0
+    assert b.throttles == 1
+
+
+def test_throttle_stops_at_min_rate():
+    b = bucket(rate=12.0)
+    b.throttle()
+    b.throttle()
+    assert b.rate == 10.0
+
+
+def test_first_request_after_a_throttle_does_not_raise_the_rate():
+    b = bucket()
+    b.throttle()
+    assert b.acquire() > 0 # Waits for a refill
+    assert b.rate == pytest.approx(50.0)
+    b.acquire()
+    assert b.rate == pytest.approx(51.0)
+
+
+def test_burst_is_bounded_by_capacity():
+    b = bucket(rate=50.0, capacity=2, increase=0.0)
+    assert b.acquire() == 0
+    assert b.acquire() == 0
+    assert b.acquire() > 0
+
+
+def test_accounts_get_separate_buckets():
+    limiter = AccountRateLimiter(requests_per_minute=60, burst=5, min_requests_per_minute=6, max_requests_per_minute=120)
+    assert limiter.bucket("a") is limiter.bucket("a")
+    assert limiter.bucket("a") is not limiter.bucket("b")
+    limiter.acquire("a")
+    limiter.throttle("b")
+    stats = limiter.stats()
+    assert stats["a"]["requests"] == 1 and stats["a"]["throttles"] == 0
+    assert stats["b"]["throttles"] == 1
+    assert stats["b"]["requests_per_minute"] == 30
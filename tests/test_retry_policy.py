@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+
+from osintgraph.services import retry_policy as retry_policy_module
+from osintgraph.services.retry_policy import QuotaExhausted, RetryLater, RetryPolicy, is_daily_quota, server_retry_delay
+
+
+class HTTPError(Exception):
+    def __init__(self, message="", headers=None):
+        super().__init__(message)
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+GEMINI_429 = """429 Resource has been exhausted [violations {
+  quota_metric: "generativelanguage.googleapis.com/generate_content_free_tier_requests"
+  quota_id: "GenerateRequestsPerMinutePerProjectPerModel-FreeTier"
+}
+, retry_delay {
+  seconds: 37
+}
+]"""
+
+
+@pytest.fixture
+def max_jitter(monkeypatch):
+    """random.uniform always returns its upper bound."""
+    monkeypatch.setattr(retry_policy_module.random, "uniform", lambda low, high: high)
+
+
+def test_server_retry_delay_from_retry_after_header():
+    assert server_retry_delay(HTTPError(headers={"Retry-After": "12"})) == 12.0
+
+
+def test_server_retry_delay_from_gemini_error_details():
+    assert server_retry_delay(Exception(GEMINI_429)) == 37.0
+
+
+def test_server_retry_delay_ignores_unparsable_header():
+    assert server_retry_delay(HTTPError(GEMINI_429, headers={"Retry-After": "Wed, 21 Oct 2026 07:28:00 GMT"})) == 37.0
+
+
+def test_server_retry_delay_is_none_without_a_hint():
+    assert server_retry_delay(Exception("429 Too Many Requests")) is None
+    assert server_retry_delay(HTTPError("boom")) is None
+
+
+def test_daily_quota_detection():
+    assert is_daily_quota(Exception('quota_id: "GenerateRequestsPerDayPerProjectPerModel-FreeTier"'))
+    assert not is_daily_quota(Exception(GEMINI_429))
+
+
+def test_backoff_grows_exponentially_up_to_the_cap(max_jitter):
+    policy = RetryPolicy(base=2, cap=30)
+    assert [policy.delay(attempt, Exception()) for attempt in range(6)] == [2, 4, 8, 16, 30, 30]
+
+
+def test_backoff_is_full_jitter(monkeypatch):
+    bounds = []
+    monkeypatch.setattr(retry_policy_module.random, "uniform", lambda low, high: bounds.append((low, high)) or low)
+    assert RetryPolicy(base=2).delay(3, Exception()) == 0
+    assert bounds == [(0, 16)]
+
+
+def test_never_waits_less_than_the_server_asks(max_jitter):
+    policy = RetryPolicy(base=2, cap=120)
+    assert policy.delay(0, Exception(GEMINI_429)) == 37 + 3
+    assert policy.delay(6, Exception(GEMINI_429)) == 120
+
+
+def test_requeue_instead_of_blocking_long(max_jitter):
+    policy = RetryPolicy(base=2, max_block=30)
+    assert policy.wait_time(0, Exception(), requeue=True) == 2
+    with pytest.raises(RetryLater) as raised:
+        policy.wait_time(0, Exception(GEMINI_429), requeue=True)
+    assert raised.value.delay == 40
+    assert policy.wait_time(0, Exception(GEMINI_429)) == 40
+
+
+def test_daily_quota_opens_the_breaker(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(retry_policy_module.time, "time", lambda: now[0])
+    policy = RetryPolicy(breaker_cooldown=3600)
+    with pytest.raises(QuotaExhausted) as raised:
+        policy.wait_time(0, Exception("Quota exceeded: GenerateRequestsPerDayPerProjectPerModel"))
+    assert raised.value.retry_at == 1000 + 3600
+    with pytest.raises(QuotaExhausted):
+        policy.check()
+    now[0] += 3600
+    policy.check()
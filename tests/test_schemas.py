@@ -0,0 +1,68 @@
+import pytest
+from pydantic import ValidationError
+
+from osintgraph.utils.schemas import PostAnalysis, PostTriage, SidecarAnalysis, gemini_response_schema, model_from_template
+
+TEMPLATE = """{
+  "summary": "",
+  "score": 0,
+  "flagged": false,
+  "topics": [],
+  "people": [{"name": "", "role": ""}],
+  "meta": {"tone": "neutral"}
+}"""
+
+
+@pytest.fixture(scope="module")
+def Model():
+    return model_from_template("Sample", TEMPLATE)
+
+
+def test_defaults_mirror_the_template(Model):
+    assert Model().model_dump() == {"summary": "", "score": 0.0, "flagged": False, "topics": [], "people": [], "meta": {"tone": "neutral"}}
+
+
+def test_field_types(Model):
+    parsed = Model.model_validate({
+        "summary": 7, "score": 6.5, "flagged": True, "topics": ["a", "b"],
+        "people": [{"name": "Ann"}], "meta": {"tone": "dry"},
+    })
+    assert parsed.summary == "7" # Bare numbers in free-text fields are accepted as strings
+    assert parsed.score == 6.5 # Fractional scores validate
+    assert parsed.people[0].name == "Ann" and parsed.people[0].role == ""
+    assert parsed.meta.tone == "dry"
+
+
+def test_nested_models_are_named_after_their_path(Model):
+    assert Model.model_fields["people"].annotation.__args__[0].__name__ == "SamplePeople"
+    assert Model.model_fields["meta"].annotation.__name__ == "SampleMeta"
+
+
+def test_wrong_shapes_are_rejected(Model):
+    with pytest.raises(ValidationError):
+        Model.model_validate({"topics": "not a list"})
+    with pytest.raises(ValidationError):
+        Model.model_validate({"score": "high"})
+
+
+def test_unknown_keys_are_kept(Model):
+    assert Model.model_validate({"extra": 1}).model_dump()["extra"] == 1
+
+
+def test_defaults_are_not_shared_between_instances(Model):
+    first, second = Model(), Model()
+    first.topics.append("x")
+    assert second.topics == []
+
+
+def test_prompt_models_accept_their_templates():
+    PostAnalysis()
+    assert PostTriage.model_validate({"osint_relevance": 3.5}).osint_relevance == 3.5
+
+
+def test_gemini_response_schema_inlines_and_requires_everything():
+    schema = gemini_response_schema(SidecarAnalysis)
+    assert "$defs" not in schema and "additionalProperties" not in str(schema)
+    assert schema["required"] == ["image_analysis", "post_analysis"]
+    post = schema["properties"]["post_analysis"]
+    assert post["type"] == "object" and set(post["required"]) == set(post["properties"])